@@ -18,6 +18,13 @@ from datetime import datetime
 import platform
 import time
 import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from tile_cache import TileCache, tile_bytes
+from framing import MessageReader, ConnectionClosed, send_message
+from protocol import (PROTOCOL_VERSION, LEGACY_PROTOCOL_VERSION, ProtocolWriter, is_typed_message, unpack_message,
+                      encode_command, encode_batch, encode_timed_batch, timestamp_ms, MessageAssembler,
+                      MSG_HELLO_ACK, MSG_CHAT, MSG_CONTROL, MSG_INPUT_BATCH, MSG_TIMED_INPUT_BATCH)
 
 # ---------------------- 按需导入PIL（保留原有逻辑，增强异常处理） ----------------------
 try:
@@ -34,10 +41,126 @@ OPERATE_BAR_HEIGHT = 80
 SCREEN_MARGIN = 50
 ADJUST_THROTTLE = 0.3  # 进一步提高窗口调整节流
 BUFFER_SIZE = 65536  # 增大缓冲区
-FRAME_QUEUE_MAXSIZE = 3  # 增加队列缓冲，减少丢帧
+FRAME_QUEUE_MAXSIZE = 3  # 最多积压的分块帧数（超出时暂停接收，整帧JPEG只保留最新一帧）
 DRAG_BASE_THROTTLE = 0.002  # 降低拖拽节流，提高响应速度
 WINDOW_ADJUST_ONLY_ONCE = True
 RENDER_FPS_LIMIT = 30  # 渲染帧率限制
+JPEG_REDUCED_DECODE = True  # 整帧JPEG按显示尺寸在DCT域缩小解码（1/2、1/4、1/8），显示远小于原图时大幅降低解码开销
+DIRTY_BAND_HEIGHT = 32  # 显示画面变化检测的行带高度：每个行带内的变化合并为一个矩形
+DIRTY_FULL_RATIO = 0.6  # 变化面积超过显示画面的该比例时整幅更新（仍复用同一图像，不重新创建）
+RENDER_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))  # 解码/缩放线程数（所有会话共用，主线程只负责显示）
+REFRESH_REQUEST_INTERVAL = 1.0  # 画面缓冲失效时请求关键帧的最小间隔
+RATE_TARGET_LATENCY_MS = 150  # 下发给被控端的目标延迟
+# 带宽预算选项（kbps，0为自动：被控端只按延迟自适应）
+BANDWIDTH_PRESETS = [("自动", 0), ("100Mbps", 100000), ("20Mbps", 20000), ("8Mbps", 8000),
+                     ("4Mbps", 4000), ("2Mbps", 2000), ("1Mbps", 1000)]
+VIEW_PRIORITY_DELAY = 200  # 窗口聚焦/失焦/最小化后下发观看状态的防抖延迟（毫秒），被控端据此调整帧率或暂停
+VIEWPORT_UPDATE_DELAY = 300  # 显示区域尺寸变化后下发视口的防抖延迟（毫秒）
+INPUT_FLUSH_INTERVAL = 16  # 键鼠事件批量发送周期（毫秒）：周期内连续的移动/拖拽只发最新位置，滚轮累加
+ROI_MIN_SIZE = 16  # 区域放大框选的最小尺寸（显示区像素），小于此视为误点
+
+# ---------------------- 分块帧格式（需与被控端保持一致） ----------------------
+# 帧头：魔数(4) + 标志(1) + 帧宽(2) + 帧高(2) + 区块数(2) + 源区域x(4) + y(4) + 宽(2) + 高(2) + 复制操作数(2)
+#       帧宽高为实际传输（被控端缩放后）的尺寸，源区域为该帧对应的被控端原始屏幕坐标范围
+# 复制：源x(2) + 源y(2) + 目标x(2) + 目标y(2) + 宽(2) + 高(2)，紧跟帧头，按顺序在画面缓冲上先于区块执行
+# 区块：x(2) + y(2) + 宽(2) + 高(2) + 类型(1) + 内容哈希(8) + 数据长度(4) + 数据（坐标为传输尺寸下的坐标）
+#       类型：JPEG/PNG/WebP为对应图片数据，纯色为3字节BGR，缓存引用无数据（从区块缓存中按哈希取出像素）
+TILE_FRAME_MAGIC = b'LDT5'
+TILE_HEADER = struct.Struct('>4sBHHHiiHHH')
+COPY_RECORD = struct.Struct('>HHHHHH')
+TILE_RECORD = struct.Struct('>HHHHBQI')
+TILE_FLAG_KEYFRAME = 0x01
+TILE_FLAG_CACHE_RESET = 0x02  # 两端清空区块缓存后再处理本帧
+TILE_CODEC_JPEG = 0
+TILE_CODEC_CACHED = 1
+TILE_CODEC_PNG = 2
+TILE_CODEC_FLAT = 3
+TILE_CODEC_WEBP = 4
+
+def is_tile_frame(frame_data):
+    """判断是否为分块增量帧"""
+    return frame_data[:4] == TILE_FRAME_MAGIC
+
+# ---------------------- 光标消息格式（需与被控端保持一致） ----------------------
+# 位置：魔数(4) + x(4) + y(4) + 形状哈希(4) + 是否可见(1)，坐标系与鼠标指令相同
+# 形状：魔数(4) + 形状哈希(4) + 热点x(2) + 热点y(2) + PNG(BGRA)，形状哈希为0表示使用默认箭头
+CURSOR_POS_MAGIC = b'LDC1'
+CURSOR_POS = struct.Struct('>4siiIB')
+CURSOR_SHAPE_MAGIC = b'LDS1'
+CURSOR_SHAPE = struct.Struct('>4sIHH')
+
+def is_cursor_message(data):
+    """判断是否为光标位置/形状消息"""
+    return data[:4] in (CURSOR_POS_MAGIC, CURSOR_SHAPE_MAGIC)
+
+_default_cursor = None
+
+def default_cursor_shape():
+    """默认箭头光标 (RGBA, 热点x, 热点y)，被控端无法提供形状时使用"""
+    global _default_cursor
+    if _default_cursor is None:
+        arrow = np.array([[0, 0], [0, 16], [4, 12], [7, 18], [9, 17], [6, 11], [11, 11]], np.int32)
+        rgba = np.zeros((20, 13, 4), np.uint8)
+        cv2.fillPoly(rgba, [arrow], (255, 255, 255, 255))
+        cv2.polylines(rgba, [arrow], True, (0, 0, 0, 255), 1)
+        _default_cursor = (rgba, 0, 0)
+    return _default_cursor
+
+# ---------------------- 整帧JPEG缩小解码 ----------------------
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}  # 帧起始段（排除DHT/JPG/DAC）
+JPEG_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def jpeg_size(data):
+    """从JPEG的帧起始段读取 (宽, 高)，不解码图像；数据不是JPEG或找不到时返回None"""
+    view = memoryview(data).cast('B')
+    if view.nbytes < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+    offset = 2
+    while offset + 9 <= view.nbytes:
+        if view[offset] != 0xFF:
+            return None
+        marker = view[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+        elif marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from('>HH', view, offset + 5)
+            return width, height
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            offset += 2
+        else:
+            offset += 2 + struct.unpack_from('>H', view, offset + 2)[0]
+    return None
+
+def decode_jpeg_scaled(data, size, target_w, target_h):
+    """按显示尺寸选择libjpeg的DCT域缩小解码（缩小后仍不小于显示尺寸的最大倍数），剩余的小幅缩放由调用方完成"""
+    width, height = size
+    flags = cv2.IMREAD_COLOR
+    for factor, reduced in JPEG_REDUCED_FLAGS:
+        if width // factor >= target_w and height // factor >= target_h:
+            flags = reduced
+            break
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+
+# ---------------------- 增量显示（只上传变化区域） ----------------------
+def dirty_boxes(previous, current, band=DIRTY_BAND_HEIGHT):
+    """比较两幅同尺寸的画面，返回变化区域列表 [(x0, y0, x1, y1)]（不含右下边界）"""
+    height, width = current.shape[:2]
+    changed = (previous != current).reshape(height, width * current.shape[2])
+    rows = changed.any(axis=1)
+    boxes = []
+    for top in range(0, height, band):
+        ys = np.flatnonzero(rows[top:top + band])
+        if not ys.size:
+            continue
+        cols = np.flatnonzero(changed[top:top + band].any(axis=0))
+        x0, x1 = int(cols[0]) // current.shape[2], int(cols[-1]) // current.shape[2] + 1
+        y0, y1 = top + int(ys[0]), top + int(ys[-1]) + 1
+        # 与上一行带的矩形上下相接且列范围重叠时合并
+        if boxes and boxes[-1][3] == y0 and boxes[-1][0] < x1 and x0 < boxes[-1][2]:
+            last = boxes.pop()
+            x0, y0, x1 = min(last[0], x0), last[1], max(last[2], x1)
+        boxes.append((x0, y0, x1, y1))
+    return boxes
 
 # ---------------------- 跨平台屏幕可用尺寸获取 ----------------------
 def get_screen_available_size(root):
@@ -72,6 +195,68 @@ def get_screen_available_size(root):
     except Exception as e:
         return 1280, 720
 
+# ---------------------- 最新帧信箱（接收线程 → 渲染调度） ----------------------
+class FrameMailbox:
+    """接收线程与渲染调度之间的信箱：整帧JPEG只保留最新一帧，分块帧全部保留（需按序合成）但只显示最新一帧
+
+    渲染调度阻塞在条件变量上，有新帧且到达渲染时刻才取走全部积压，不再轮询；
+    rendered/dropped 统计送去显示的帧数与未显示（被新帧取代或只合成）的帧数
+    """
+    def __init__(self, tile_backlog=FRAME_QUEUE_MAXSIZE):
+        self._cond = threading.Condition()
+        self._frames = []
+        self.tile_backlog = tile_backlog
+        self.rendered = 0
+        self.dropped = 0
+
+    def put(self, frame_data, stop_event):
+        """接收线程放入一帧；分块帧积压已满时等待渲染调度取走（阻塞接收，形成TCP背压）"""
+        with self._cond:
+            if is_tile_frame(frame_data):
+                while len(self._frames) >= self.tile_backlog and not stop_event.is_set():
+                    self._cond.wait(0.1)
+            else:
+                # 末尾尚未显示的旧整帧直接丢弃（其前的分块帧仍需合成以保持区块缓存一致）
+                while self._frames and not is_tile_frame(self._frames[-1]):
+                    self._frames.pop()
+                    self.dropped += 1
+            self._frames.append(frame_data)
+            self._cond.notify_all()
+
+    def take(self, deadline, stop_event):
+        """等到有新帧且到达渲染时刻（monotonic）后取走全部积压，最后一帧用于显示；停止时返回空列表"""
+        with self._cond:
+            while not stop_event.is_set():
+                if not self._frames:
+                    self._cond.wait(0.5)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            else:
+                return []
+            frames, self._frames = self._frames, []
+            self.rendered += 1
+            self.dropped += len(frames) - 1
+            self._cond.notify_all()
+            return frames
+
+    def wake(self):
+        """唤醒等待中的线程（断开连接时使其检查停止标志）"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._frames = []
+            self._cond.notify_all()
+
+    def reset_stats(self):
+        rendered, dropped = self.rendered, self.dropped
+        self.rendered = self.dropped = 0
+        return rendered, dropped
+
 # ---------------------- 封装单个远程连接类（优化版） ----------------------
 class RemoteClient:
     """单个被控端连接的封装类"""
@@ -81,17 +266,36 @@ class RemoteClient:
         self.remote_scaling = 1.0
         self.remote_width = 0       
         self.remote_height = 0      
-        self.canvas_ratio = 1.0
         self.is_connected = False
         self.remote_sys_info = None
         self.is_ratio_calculated = False
         self.HD_SCALE_FACTOR = 1.0
+        self.bandwidth_kbps = 0  # 带宽预算，0为自动
+        self.viewport_job = None  # 视口下发的防抖任务
+        self.last_viewport = None  # 最近一次下发的视口，避免重复发送
+        self.view_priority_job = None  # 观看状态下发的防抖任务
+        self.last_view_priority = None  # 最近一次下发的观看状态：focused / background / paused
+        self.display_obscured = False  # 显示区被其他窗口完全遮挡（X11的Visibility事件）
+        self.roi = None  # 区域放大的被控端区域 (x, y, w, h)，None为整屏
+        self.roi_selecting = False  # 是否处于框选放大区域状态
+        self.roi_start = None  # 框选起点（显示区坐标）
+        self.remote_monitors = []  # 被控端显示器列表（来自系统信息）
+        self.cursor_state = None  # 被控端光标 (x, y, 形状哈希, 是否可见)
+        self.cursor_shapes = {}  # 形状哈希 -> (RGBA, 热点x, 热点y)
+        self.cursor_redraw_pending = False
 
         # 连接核心资源
         self.client_socket = None
-        self.frame_queue = queue.Queue(maxsize=FRAME_QUEUE_MAXSIZE)
+        self.frame_mailbox = FrameMailbox()
         self.stop_event = threading.Event()
         self.cmd_lock = threading.Lock()
+        self.protocol_version = LEGACY_PROTOCOL_VERSION  # 收到被控端确认后切换为协商版本
+        self.protocol_writer = ProtocolWriter()
+        self.input_queue = []  # 待发送的键鼠事件（只在主线程中读写）
+        self.input_flush_job = None
+        self.input_events = 0  # 统计：产生的键鼠事件数与实际发出的消息数
+        self.input_packets = 0
+        self.view_only = False  # 被控端已有其他控制端时本端为观察者，只观看不发送键鼠事件
 
         # GUI组件绑定
         self.display_label = None
@@ -100,6 +304,8 @@ class RemoteClient:
         self.sys_info_panel = None
         self.hd_scale_slider = None
         self.hd_scale_entry = None
+        self.bandwidth_combo = None
+        self.monitor_combo = None
         self.main_window = None
         self.chat_send_btn = None
 
@@ -122,7 +328,13 @@ class RemoteClient:
 
         # 渲染优化
         self.last_render_time = 0
-        self.frame_count = 0
+        self.last_refresh_request = 0.0
+        self.last_cache_reset_request = 0.0
+        self.tile_cache = TileCache()  # 区块缓存（保存解码后的像素，与被控端同步淘汰）
+        self.render_strand = get_render_strand(self.render_frames)  # 解码/缩放在共用线程池中执行
+        self.display_lock = threading.Lock()
+        self.pending_display = None  # 线程池生成、等待主线程显示的最新画面
+        self.display_scheduled = False
         self.last_stat_time = time.time()
 
         # 快捷键功能
@@ -246,6 +458,7 @@ class RemoteClient:
                 self.hd_scale_entry.insert(0, str(self.HD_SCALE_FACTOR))
             if not self.has_adjusted_window:
                 self.auto_adjust_window_size()
+            self.schedule_viewport_update()
         except (ValueError, TypeError):
             pass
 
@@ -255,92 +468,171 @@ class RemoteClient:
             if not self.hd_scale_entry or not self.hd_scale_entry.winfo_exists():
                 return
             input_val = float(self.hd_scale_entry.get().strip())
-            if 0.5 <= input_val <= 2.0:
+            if 0.5 <= input_val <= 1.0:
                 self.HD_SCALE_FACTOR = round(input_val, 1)
                 if self.hd_scale_slider and self.hd_scale_slider.winfo_exists():
                     self.hd_scale_slider.set(self.HD_SCALE_FACTOR)
                 if not self.has_adjusted_window:
                     self.auto_adjust_window_size()
+                self.schedule_viewport_update()
             else:
                 self.hd_scale_entry.delete(0, END)
                 self.hd_scale_entry.insert(0, str(self.HD_SCALE_FACTOR))
-                messagebox.showwarning("提示", "请输入0.5~2.0之间的数字！")
+                messagebox.showwarning("提示", "请输入0.5~1.0之间的数字！")
         except ValueError:
             if self.hd_scale_entry and self.hd_scale_entry.winfo_exists():
                 self.hd_scale_entry.delete(0, END)
                 self.hd_scale_entry.insert(0, str(self.HD_SCALE_FACTOR))
                 messagebox.showwarning("提示", "请输入有效的数字！")
 
+    def schedule_viewport_update(self, event=None):
+        """显示区域尺寸或清晰度变化后，防抖下发视口信息"""
+        if not self.main_window or not self.main_window.winfo_exists():
+            return
+        if self.viewport_job:
+            self.main_window.after_cancel(self.viewport_job)
+        self.viewport_job = self.main_window.after(VIEWPORT_UPDATE_DELAY, self.send_viewport)
+
+    def send_viewport(self):
+        """下发显示区域尺寸与清晰度，被控端据此在编码前缩小画面，不再传输用不到的像素"""
+        self.viewport_job = None
+        if not self.is_connected or not self.display_label or not self.display_label.winfo_exists():
+            return
+        viewport = (self.display_label.winfo_width(), self.display_label.winfo_height(), self.HD_SCALE_FACTOR)
+        if viewport[0] <= 1 or viewport[1] <= 1 or viewport == self.last_viewport:
+            return
+        self.last_viewport = viewport
+        self.send_cmd({
+            'type': 'viewport',
+            'width': viewport[0],
+            'height': viewport[1],
+            'hd_scale': viewport[2]
+        })
+
+    def schedule_view_priority(self, event=None):
+        """窗口聚焦、失焦、最小化、还原或被遮挡后，防抖下发观看状态（焦点切换时会连续触发多个事件）"""
+        if event is not None and event.type == tk.EventType.Visibility and event.widget is self.display_label:
+            self.display_obscured = event.state == 'VisibilityFullyObscured'
+        if not self.main_window or not self.main_window.winfo_exists():
+            return
+        if self.view_priority_job:
+            self.main_window.after_cancel(self.view_priority_job)
+        self.view_priority_job = self.main_window.after(VIEW_PRIORITY_DELAY, self.send_view_priority)
+
+    def current_view_priority(self):
+        """按窗口状态确定观看状态：最小化/隐藏/完全遮挡为 paused，焦点在本窗口为 focused，否则为 background"""
+        window = self.main_window
+        if window.state() in ('iconic', 'withdrawn') or not window.winfo_viewable() or self.display_obscured:
+            return 'paused'
+        try:
+            focus = window.focus_get()
+        except KeyError:
+            # 焦点在Combobox下拉列表等无法解析的控件上，仍属于本窗口
+            return 'focused'
+        return 'focused' if focus is not None and focus.winfo_toplevel() is window else 'background'
+
+    def send_view_priority(self):
+        """下发观看状态，被控端据此全速、低帧率或暂停截图（暂停时只保持连接）"""
+        self.view_priority_job = None
+        if not self.is_connected or not self.main_window or not self.main_window.winfo_exists():
+            return
+        priority = self.current_view_priority()
+        if priority == self.last_view_priority:
+            return
+        self.last_view_priority = priority
+        self.send_cmd({'type': 'view_priority', 'priority': priority})
+
+    def select_bandwidth(self, event=None):
+        """带宽预算下拉框选择"""
+        if not self.bandwidth_combo or not self.bandwidth_combo.winfo_exists():
+            return
+        self.bandwidth_kbps = dict(BANDWIDTH_PRESETS).get(self.bandwidth_combo.get(), 0)
+        self.send_rate_budget()
+
+    def send_rate_budget(self):
+        """下发带宽预算与目标延迟，被控端据此自适应调整质量/帧率/分辨率"""
+        self.send_cmd({
+            'type': 'rate_budget',
+            'bandwidth_kbps': self.bandwidth_kbps,
+            'target_latency_ms': RATE_TARGET_LATENCY_MS
+        })
+
     def receive_frames(self):
         """帧接收线程（优化版）"""
         self.is_connected = True
+        reader = MessageReader(self.client_socket)
+        assembler = MessageAssembler()  # 协议版本4起大帧分片发送，收齐后再处理
         try:
             # 接收系统信息
-            sys_info_len_data = self.client_socket.recv(4)
-            if not sys_info_len_data:
-                raise Exception("未获取到系统信息长度")
-            sys_info_len = int.from_bytes(sys_info_len_data, 'big')
-            sys_info_data = self.client_socket.recv(sys_info_len)
-            if len(sys_info_data) != sys_info_len:
-                raise Exception("系统信息数据不完整")
-            sys_info_json = json.loads(sys_info_data.decode('utf-8', errors='ignore'))
+            sys_info_json = json.loads(str(reader.read(), 'utf-8', errors='ignore'))
+            remote_version = int(sys_info_json.get('protocol_version', LEGACY_PROTOCOL_VERSION))
             if sys_info_json.get('type') == 'sys_info':
                 self.remote_sys_info = sys_info_json.get('data', {})
                 if self.sys_info_panel and self.sys_info_panel.winfo_exists():
                     self.main_window.after(0, self.update_sys_info_panel)
                 if self.main_window and self.main_window.winfo_exists():
                     self.main_window.after(0, self.auto_adjust_window_size)
+                    self.main_window.after(0, self.update_monitor_options)
             
             # 接收缩放比例
-            scaling_len_data = self.client_socket.recv(4)
-            if not scaling_len_data:
-                raise Exception("未获取到缩放比例长度")
-            scaling_len = int.from_bytes(scaling_len_data, 'big')
-            scaling_data = self.client_socket.recv(scaling_len)
-            if len(scaling_data) != scaling_len:
-                raise Exception("缩放比例数据不完整")
-            self.remote_scaling = json.loads(scaling_data.decode('utf-8', errors='ignore')).get('scaling', 1.0)
+            self.remote_scaling = json.loads(str(reader.read(), 'utf-8', errors='ignore')).get('scaling', 1.0)
         except Exception as e:
             print(f"[{self.target_ip}] 初始化数据接收失败：{e}")
             self.remote_scaling = 1.0
+            remote_version = LEGACY_PROTOCOL_VERSION
+        
+        # 被控端支持新版协议时发起协商（旧版被控端不回复，继续使用JSON指令）
+        if remote_version >= 2:
+            self.send_cmd({'type': 'hello', 'version': PROTOCOL_VERSION})
+        # 同步连接前已选择的带宽预算与当前视口
+        if self.bandwidth_kbps:
+            self.send_rate_budget()
+        self.last_viewport = None
+        self.last_view_priority = None
+        if self.main_window and self.main_window.winfo_exists():
+            self.main_window.after(0, self.schedule_viewport_update)
+            self.main_window.after(0, self.schedule_view_priority)
 
         while not self.stop_event.is_set():
             try:
                 self.client_socket.settimeout(0.5)
-                data_len_data = self.client_socket.recv(4)
-                if not data_len_data:
-                    break
-                data_len = int.from_bytes(data_len_data, 'big')
+                # 消息体位于接收器的复用缓冲中，只有需要放入帧队列的消息才复制一次
+                data = reader.read()
+                if self.stop_event.is_set():
+                    continue
                 
-                # 分段接收数据
-                data = b''
-                remaining = data_len
-                while remaining > 0 and not self.stop_event.is_set():
-                    chunk = self.client_socket.recv(min(self.BUFFER_SIZE, remaining))
-                    if not chunk:
-                        break
-                    data += chunk
-                    remaining -= len(chunk)
+                # 带消息头的消息按类型分发，画面与光标的消息体格式与旧版相同，继续走下面的流程
+                if is_typed_message(data):
+                    msg_type, flags, _, _, data = unpack_message(data)
+                    data = assembler.feed(msg_type, flags, data)
+                    if data is None:
+                        continue
+                    if msg_type == MSG_HELLO_ACK:
+                        self.on_hello_ack(json.loads(str(data, 'utf-8')))
+                        continue
+                    if msg_type in (MSG_CHAT, MSG_CONTROL):
+                        self.handle_json_message(data)
+                        continue
                 
-                if len(data) != data_len or self.stop_event.is_set():
+                # 光标消息不进帧队列，收到即更新叠加层
+                if is_cursor_message(data):
+                    self.handle_cursor_message(data)
                     continue
                 
-                # 优先尝试解码为JSON（聊天消息）
-                try:
-                    json_data = json.loads(data.decode('utf-8', errors='strict'))
-                    if json_data.get('type') == 'chat_msg' and self.chat_text and self.chat_text.winfo_exists():
-                        self.chat_text.master.after(0, self.add_chat_msg, json_data)
-                        continue
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    # 解码失败=二进制帧数据
-                    try:
-                        if self.frame_queue.full():
-                            self.frame_queue.get_nowait()
-                        self.frame_queue.put_nowait(data)
-                    except queue.Full:
-                        pass
+                # 分块增量帧依赖前序帧，不能丢弃，积压满时信箱阻塞接收；整帧JPEG只保留最新一帧
+                if is_tile_frame(data):
+                    self.frame_mailbox.put(bytes(data) if isinstance(data, memoryview) else data, self.stop_event)
+                    continue
+                
+                # 旧版协议的JSON消息（聊天）以'{'开头，整帧JPEG以0xFF开头，按首字节区分，不再对图像试探解码
+                if data[:1] == b'{':
+                    self.handle_json_message(data)
+                    continue
+                self.frame_mailbox.put(bytes(data) if isinstance(data, memoryview) else data, self.stop_event)
             except socket.timeout:
                 continue
+            except ConnectionClosed:
+                break
             except Exception as e:
                 print(f"[{self.target_ip}] 接收异常：{e}")
                 break
@@ -352,57 +644,79 @@ class RemoteClient:
         self.pressed_mouse_button = 'left'
         for key in self.modifier_keys:
             self.modifier_keys[key] = False
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                pass
+        self.frame_mailbox.clear()
         if self.display_label and self.display_label.winfo_exists():
             self.display_label.master.after(0, self.display_label.update_frame, None, self)
 
     def update_label_from_queue(self):
-        """帧更新线程（优化版）"""
+        """渲染调度线程：阻塞等待信箱中的新帧，按 RENDER_FPS_LIMIT 对齐的时刻取最新一帧交给线程池"""
         if not self.display_label or not self.display_label.winfo_exists():
             return
         
         frame_interval = 1.0 / RENDER_FPS_LIMIT
-        last_render_time = time.time()
+        deadline = time.monotonic()
         
         while not self.stop_event.is_set():
             try:
-                # 优先从队列获取帧
-                frame_data = self.frame_queue.get_nowait()
-                
-                # 渲染节流
-                current_time = time.time()
-                elapsed = current_time - last_render_time
-                if elapsed < frame_interval:
-                    # 跳过这一帧，直接处理下一帧
+                # 线程池处理完上一批之前不取新帧：新帧留在信箱中合并，分块帧积压满时信箱阻塞接收（TCP背压）
+                if not self.render_strand.idle.wait(frame_interval):
                     continue
+                frames = self.frame_mailbox.take(deadline, self.stop_event)
+                if not frames:
+                    continue
+                
+                # 下一渲染时刻：跟得上时按固定间隔对齐，落后超过一个间隔时从现在重新计时
+                current_time = time.monotonic()
+                deadline += frame_interval
+                if deadline <= current_time:
+                    deadline = current_time + frame_interval
                 
-                last_render_time = current_time
-                self.display_label.update_frame(frame_data, self)
+                # 积压的分块帧只合成，最后一帧合成后显示
+                for frame_data in frames[:-1]:
+                    self.render_strand.submit(frame_data, render=False)
+                self.render_strand.submit(frames[-1])
                 
                 # 性能统计
-                self.frame_count += 1
+                current_time = time.time()
                 if current_time - self.last_stat_time >= 5.0:
-                    fps = self.frame_count / (current_time - self.last_stat_time)
-                    print(f"[{self.target_ip}] 渲染FPS: {fps:.1f}")
-                    self.frame_count = 0
+                    span = current_time - self.last_stat_time
+                    rendered, dropped = self.frame_mailbox.reset_stats()
+                    print(f"[{self.target_ip}] 渲染FPS: {rendered / span:.1f} | 未显示帧：{dropped} | 区块缓存：{self.tile_cache.summary()} | 键鼠：{self.input_events}事件/{self.input_packets}条消息")
+                    self.input_events = self.input_packets = 0
                     self.last_stat_time = current_time
-                    
-            except queue.Empty:
-                time.sleep(0.001)
-                continue
             except Exception as e:
                 print(f"[{self.target_ip}] 帧更新异常：{e}")
                 time.sleep(0.01)
                 continue
         
+        self.render_strand.clear()
         if self.display_label and self.display_label.winfo_exists():
-            self.display_label.update_frame(None, self)
+            self.display_label.after(0, self.display_label.update_frame, None, self)
+
+    def render_frames(self, jobs):
+        """线程池中执行：按顺序合成/解码本会话积压的帧，只为最新一帧生成显示画面，交给主线程显示"""
+        display = self.display_label.prepare_display(jobs, self)
+        if display is None:
+            return
+        with self.display_lock:
+            self.pending_display = display
+            if self.display_scheduled:
+                return
+            self.display_scheduled = True
+        try:
+            self.display_label.after(0, self.show_pending_display)
+        except Exception:
+            with self.display_lock:
+                self.display_scheduled = False
+
+    def show_pending_display(self):
+        """主线程中显示线程池生成的最新画面（期间积压的旧画面已被覆盖，不再显示）"""
+        with self.display_lock:
+            display, self.pending_display = self.pending_display, None
+            self.display_scheduled = False
+        if display is not None and self.is_connected and not self.stop_event.is_set() and self.display_label.winfo_exists():
+            self.display_label.show_display(display, self)
 
-        
 
     def add_chat_msg(self, msg_data):
         """聊天消息更新"""
@@ -454,24 +768,247 @@ class RemoteClient:
             sys_text += f"IP：{self.remote_sys_info.get('local_ip', '未知')} | 主机：{self.remote_sys_info.get('hostname', '未知')}\n"
             sys_text += f"用户：{self.remote_sys_info.get('username', '未知')} | 系统：{self.remote_sys_info.get('system', '未知')}\n"
             sys_text += f"CPU：{self.remote_sys_info.get('cpu_count_physical', '未知')}核 | 内存：{self.remote_sys_info.get('mem_used', '未知')}/{self.remote_sys_info.get('mem_total', '未知')}GB\n"
+            sys_text += f"显示器：{len(self.remote_sys_info.get('monitors') or []) or '未知'}个\n"
             self.sys_info_panel.config(text=sys_text)
         except Exception as e:
             print(f"[{self.target_ip}] 系统信息面板更新失败：{e}")
             self.sys_info_panel.config(text=f"📌 被控端信息（{self.target_ip}）\n获取信息失败，请重新连接")
 
+    def update_monitor_options(self):
+        """按被控端显示器列表刷新显示器下拉框，多于一个显示器时提供“全部”选项"""
+        self.remote_monitors = list(self.remote_sys_info.get('monitors') or []) if self.remote_sys_info else []
+        if not self.monitor_combo or not self.monitor_combo.winfo_exists():
+            return
+        names = [f"显示器{mon['index']} ({mon['width']}x{mon['height']})" for mon in self.remote_monitors]
+        if len(names) > 1:
+            names.append("全部显示器")
+        self.monitor_combo.config(values=names, state="readonly" if len(names) > 1 else "disabled")
+        if names:
+            self.monitor_combo.current(0)
+
+    def select_monitor(self, event=None):
+        """切换被控端显示器（实时生效），按新画面尺寸更新坐标映射"""
+        if not self.is_connected or not self.monitor_combo or not self.monitor_combo.winfo_exists():
+            return
+        choice = self.monitor_combo.current()
+        if choice < 0 or not self.remote_monitors:
+            return
+        if choice < len(self.remote_monitors):
+            monitor = self.remote_monitors[choice]
+            index, width, height = monitor['index'], monitor['width'], monitor['height']
+        else:
+            index = 0
+            width = max(mon['left'] + mon['width'] for mon in self.remote_monitors) - min(mon['left'] for mon in self.remote_monitors)
+            height = max(mon['top'] + mon['height'] for mon in self.remote_monitors) - min(mon['top'] for mon in self.remote_monitors)
+        # 被控端切换显示器时会自动退出区域放大
+        self.roi = None
+        if self.roi_selecting:
+            self.toggle_roi_select()
+        scaling = self.remote_scaling or 1.0
+        self.remote_width, self.remote_height = int(width / scaling), int(height / scaling)
+        self.send_cmd({'type': 'select_monitor', 'index': index})
+        self.last_viewport = None
+        self.schedule_viewport_update()
+
+    def on_hello_ack(self, ack):
+        """被控端确认协议版本，此后本端发出的指令同样改用带消息头的二进制消息"""
+        with self.cmd_lock:
+            self.protocol_version = int(ack.get('version', LEGACY_PROTOCOL_VERSION))
+        print(f"[{self.target_ip}] 协议版本：{self.protocol_version}")
+
+    def handle_json_message(self, data):
+        """接收线程中处理JSON消息（聊天消息、观看身份）"""
+        try:
+            json_data = json.loads(str(data, 'utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"[{self.target_ip}] 消息解析失败：{e}")
+            return
+        if json_data.get('type') == 'viewer_role':
+            self.view_only = json_data.get('role') == 'observer'
+            print(f"[{self.target_ip}] {'被控端已有控制端，以观察者身份观看' if self.view_only else '已获得控制权'}")
+            if self.view_only and self.main_window and self.main_window.winfo_exists() and "观看模式" not in self.main_window.title():
+                self.main_window.after(0, lambda: self.main_window.title(f"{self.main_window.title()}（观看模式）"))
+            return
+        if json_data.get('type') == 'chat_msg' and self.chat_text and self.chat_text.winfo_exists():
+            self.chat_text.master.after(0, self.add_chat_msg, json_data)
+
+    def queue_input(self, cmd):
+        """键鼠事件入队：连续的移动/拖拽合并为最新位置，连续的滚轮累加；按钮与按键事件连同队列立即发送
+
+        每个事件记录发生时刻（ts），被控端据此还原事件之间的时间间隔
+        """
+        if not self.client_socket or not self.is_connected or self.stop_event.is_set() or self.view_only:
+            return
+        self.input_events += 1
+        cmd['ts'] = timestamp_ms()
+        cmd_type = cmd['type']
+        last = self.input_queue[-1] if self.input_queue else None
+        if last and last['type'] == cmd_type and cmd_type in ('mouse_move', 'mouse_drag'):
+            self.input_queue[-1] = cmd
+        elif last and last['type'] == cmd_type == 'mouse_wheel':
+            delta = sum(item['distance'] * (1 if item['direction'] == 'up' else -1) for item in (last, cmd))
+            self.input_queue.pop()
+            if delta:
+                self.input_queue.append({'type': 'mouse_wheel', 'direction': 'up' if delta > 0 else 'down', 'distance': abs(delta), 'ts': cmd['ts']})
+        else:
+            self.input_queue.append(cmd)
+        if cmd_type not in ('mouse_move', 'mouse_drag', 'mouse_wheel') or not self.main_window or not self.main_window.winfo_exists():
+            self.flush_input()
+        elif self.input_flush_job is None:
+            self.input_flush_job = self.main_window.after(INPUT_FLUSH_INTERVAL, self.flush_input)
+
+    def flush_input(self):
+        """发送队列中的全部键鼠事件（协议版本2下合并为一条消息）"""
+        if self.input_flush_job:
+            if self.main_window and self.main_window.winfo_exists():
+                self.main_window.after_cancel(self.input_flush_job)
+            self.input_flush_job = None
+        cmds, self.input_queue = self.input_queue, []
+        if cmds:
+            self.input_packets += 1 if self.protocol_version >= 2 else len(cmds)
+            self.send_cmds(cmds)
+
     def send_cmd(self, cmd):
-        """发送指令（优化版）"""
+        """发送指令（优化版），协商后键鼠事件编码为紧凑二进制消息"""
+        self.send_cmds([cmd])
+
+    def send_cmds(self, cmds):
+        """按顺序发送多条指令：协议版本2起多条合并为一条批量消息（版本3附带事件时间），旧版逐条发送JSON"""
         if not self.client_socket or not self.is_connected or self.stop_event.is_set():
             return
         try:
             with self.cmd_lock:
-                cmd_data = json.dumps(cmd).encode('utf-8')
-                self.client_socket.sendall(len(cmd_data).to_bytes(4, 'big'))
-                self.client_socket.sendall(cmd_data)
+                if self.protocol_version >= 3 and len(cmds) > 1 and all('ts' in cmd for cmd in cmds):
+                    payload = encode_timed_batch(cmds)
+                    send_message(self.client_socket, payload, self.protocol_writer.header(MSG_TIMED_INPUT_BATCH, payload, timestamp=cmds[0]['ts']))
+                elif self.protocol_version >= 2 and len(cmds) > 1:
+                    payload = encode_batch(cmds)
+                    send_message(self.client_socket, payload, self.protocol_writer.header(MSG_INPUT_BATCH, payload))
+                elif self.protocol_version >= 2:
+                    msg_type, payload = encode_command(cmds[0])
+                    timestamp = cmds[0].get('ts') if self.protocol_version >= 3 else None
+                    send_message(self.client_socket, payload, self.protocol_writer.header(msg_type, payload, timestamp=timestamp))
+                else:
+                    for cmd in cmds:
+                        send_message(self.client_socket, json.dumps(cmd).encode('utf-8'))
         except Exception as e:
             print(f"[{self.target_ip}] 发送指令失败：{e}")
             self.disconnect()
 
+    def request_refresh(self, reset_cache=False):
+        """请求被控端重新发送完整关键帧（限频），reset_cache 时两端同时清空区块缓存"""
+        current_time = time.time()
+        last_attr = 'last_cache_reset_request' if reset_cache else 'last_refresh_request'
+        if current_time - getattr(self, last_attr) < REFRESH_REQUEST_INTERVAL:
+            return
+        setattr(self, last_attr, current_time)
+        self.send_cmd({'type': 'refresh', 'reset_cache': reset_cache})
+
+    def source_size(self):
+        """被控端整屏截图的原始尺寸（鼠标坐标系）：分块帧取帧头中的源区域，整帧JPEG按系统信息与缩放比例换算"""
+        label = self.display_label
+        if not self.roi and label.view_rect and label.view_rect[2] > 0 and label.view_rect[3] > 0:
+            return label.view_rect[2], label.view_rect[3]
+        return self.remote_width * self.remote_scaling, self.remote_height * self.remote_scaling
+
+    def display_scale(self, src_w, src_h):
+        """整屏显示比例：与被控端 stream_scale 的视口规则相同（视口适配 × 清晰度，不超过原始分辨率，按0.05向下取整），
+        被控端未因码率降级时传输尺寸即显示尺寸，无需再缩放"""
+        area_w, area_h = self.display_label.area_size
+        scale = min(1.0, self.HD_SCALE_FACTOR)
+        if area_w > 1 and area_h > 1 and src_w > 0 and src_h > 0:
+            scale = min(scale, area_w / src_w, area_h / src_h)
+        return min(1.0, max(0.1, int(scale * 20) / 20))
+
+    def view_geometry(self):
+        """当前显示画面对应的被控端区域与显示尺寸 (view_x, view_y, view_w, view_h, disp_w, disp_h)"""
+        label = self.display_label
+        if self.roi and label.view_rect and label.display_size[0] > 0 and label.display_size[1] > 0:
+            # 区域放大：显示的画面对应被控端的 view_rect 区域
+            return (*label.view_rect, *label.display_size)
+        src_w, src_h = self.source_size()
+        scale = self.display_scale(src_w, src_h)
+        return 0, 0, src_w, src_h, int(src_w * scale), int(src_h * scale)
+
+    def map_from_remote(self, x, y):
+        """将被控端坐标映射为显示区坐标，不在当前画面内时返回None"""
+        view_x, view_y, view_w, view_h, disp_w, disp_h = self.view_geometry()
+        if view_w <= 0 or view_h <= 0 or not (view_x <= x < view_x + view_w and view_y <= y < view_y + view_h):
+            return None
+        return (self.display_label.img_offset_x + (x - view_x) * disp_w / view_w,
+                self.display_label.img_offset_y + (y - view_y) * disp_h / view_h)
+
+    def map_to_remote(self, x, y, clamp=False):
+        """将显示区坐标映射为被控端坐标（整屏与区域放大模式通用），超出画面时返回None或裁剪到画面边缘"""
+        label = self.display_label
+        rel_x = x - label.img_offset_x
+        rel_y = y - label.img_offset_y
+        view_x, view_y, view_w, view_h, disp_w, disp_h = self.view_geometry()
+        if clamp:
+            rel_x = min(max(rel_x, 0), disp_w)
+            rel_y = min(max(rel_y, 0), disp_h)
+        elif rel_x < 0 or rel_y < 0 or rel_x > disp_w or rel_y > disp_h:
+            return None
+        if disp_w <= 0 or disp_h <= 0:
+            return None
+        return view_x + rel_x * view_w / disp_w, view_y + rel_y * view_h / disp_h
+
+    def handle_cursor_message(self, data):
+        """接收线程中解析光标消息，叠加层重绘合并到主线程执行"""
+        try:
+            if data[:4] == CURSOR_SHAPE_MAGIC:
+                _, shape_hash, hot_x, hot_y = CURSOR_SHAPE.unpack_from(data, 0)
+                bgra = cv2.imdecode(np.frombuffer(data, np.uint8, offset=CURSOR_SHAPE.size), cv2.IMREAD_UNCHANGED)
+                if bgra is not None and bgra.ndim == 3 and bgra.shape[2] == 4:
+                    self.cursor_shapes[shape_hash] = (cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGBA), hot_x, hot_y)
+                return
+            _, x, y, shape_hash, visible = CURSOR_POS.unpack_from(data, 0)
+            self.cursor_state = (x, y, shape_hash, bool(visible))
+            if not self.cursor_redraw_pending and self.main_window and self.main_window.winfo_exists():
+                self.cursor_redraw_pending = True
+                self.main_window.after(0, self.redraw_cursor)
+        except Exception as e:
+            print(f"[{self.target_ip}] 光标消息解析失败：{e}")
+
+    def redraw_cursor(self):
+        """主线程中重绘光标叠加层"""
+        self.cursor_redraw_pending = False
+        if self.display_label and self.display_label.winfo_exists():
+            self.display_label.draw_cursor(self)
+
+    def toggle_roi_select(self):
+        """进入/退出框选放大区域状态"""
+        if not self.is_connected or not self.display_label or not self.display_label.winfo_exists():
+            return
+        self.roi_selecting = not self.roi_selecting
+        self.roi_start = None
+        self.display_label.hide_selection()
+        self.display_label.config(cursor="crosshair" if self.roi_selecting else "")
+
+    def set_roi(self, roi):
+        """下发放大区域，None恢复整屏"""
+        self.roi = roi
+        x, y, w, h = roi if roi else (0, 0, 0, 0)
+        self.send_cmd({'type': 'roi', 'x': x, 'y': y, 'w': w, 'h': h})
+
+    def reset_roi(self):
+        """退出区域放大，恢复整屏显示"""
+        if self.roi_selecting:
+            self.toggle_roi_select()
+        if self.roi:
+            self.set_roi(None)
+
+    def finish_roi_select(self, event):
+        """框选结束：将选框换算为被控端区域并下发"""
+        start = self.roi_start
+        self.toggle_roi_select()
+        if not start or abs(event.x - start[0]) < ROI_MIN_SIZE or abs(event.y - start[1]) < ROI_MIN_SIZE:
+            return
+        x0, y0 = self.map_to_remote(*start, clamp=True)
+        x1, y1 = self.map_to_remote(event.x, event.y, clamp=True)
+        left, top = int(min(x0, x1)), int(min(y0, y1))
+        self.set_roi((left, top, int(max(x0, x1)) - left, int(max(y0, y1)) - top))
+
     def on_mouse_press(self, event):
         """鼠标按下事件"""
         if not self.is_connected or not self.is_ratio_calculated:
@@ -479,20 +1016,19 @@ class RemoteClient:
         if not self.display_label or not self.display_label.winfo_exists():
             return
         self.display_label.focus_set()
+        if self.roi_selecting:
+            self.roi_start = (event.x, event.y)
+            return
         self.is_mouse_pressed = True
         self.pressed_mouse_button = 'left' if event.num == 1 else 'right'
         
         try:
-            rel_x = event.x - self.display_label.img_offset_x
-            rel_y = event.y - self.display_label.img_offset_y
-            scaled_w = int(self.remote_width * self.canvas_ratio * self.HD_SCALE_FACTOR)
-            scaled_h = int(self.remote_height * self.canvas_ratio * self.HD_SCALE_FACTOR)
-            if rel_x < 0 or rel_y < 0 or rel_x > scaled_w or rel_y > scaled_h:
+            remote_pos = self.map_to_remote(event.x, event.y)
+            if remote_pos is None:
                 return
-            remote_x = (rel_x / (self.canvas_ratio * self.HD_SCALE_FACTOR)) * self.remote_scaling
-            remote_y = (rel_y / (self.canvas_ratio * self.HD_SCALE_FACTOR)) * self.remote_scaling
+            remote_x, remote_y = remote_pos
             
-            self.send_cmd({
+            self.queue_input({
                 'type': 'mouse_press',
                 'x': int(remote_x),
                 'y': int(remote_y),
@@ -503,6 +1039,9 @@ class RemoteClient:
 
     def on_mouse_release(self, event):
         """鼠标释放事件"""
+        if self.roi_selecting:
+            self.finish_roi_select(event)
+            return
         if not self.is_connected or not self.is_ratio_calculated or not self.is_mouse_pressed:
             return
         if not self.display_label or not self.display_label.winfo_exists():
@@ -510,16 +1049,12 @@ class RemoteClient:
         self.is_mouse_pressed = False
         
         try:
-            rel_x = event.x - self.display_label.img_offset_x
-            rel_y = event.y - self.display_label.img_offset_y
-            scaled_w = int(self.remote_width * self.canvas_ratio * self.HD_SCALE_FACTOR)
-            scaled_h = int(self.remote_height * self.canvas_ratio * self.HD_SCALE_FACTOR)
-            if rel_x < 0 or rel_y < 0 or rel_x > scaled_w or rel_y > scaled_h:
+            remote_pos = self.map_to_remote(event.x, event.y)
+            if remote_pos is None:
                 return
-            remote_x = (rel_x / (self.canvas_ratio * self.HD_SCALE_FACTOR)) * self.remote_scaling
-            remote_y = (rel_y / (self.canvas_ratio * self.HD_SCALE_FACTOR)) * self.remote_scaling
+            remote_x, remote_y = remote_pos
             
-            self.send_cmd({
+            self.queue_input({
                 'type': 'mouse_release',
                 'x': int(remote_x),
                 'y': int(remote_y),
@@ -534,6 +1069,10 @@ class RemoteClient:
             return
         if not self.display_label or not self.display_label.winfo_exists():
             return
+        if self.roi_selecting:
+            if self.roi_start:
+                self.display_label.show_selection(*self.roi_start, event.x, event.y)
+            return
         
         current_time = time.time()
         if current_time - self.last_drag_time < self.DRAG_THROTTLE:
@@ -541,23 +1080,19 @@ class RemoteClient:
         self.last_drag_time = current_time
         
         try:
-            rel_x = event.x - self.display_label.img_offset_x
-            rel_y = event.y - self.display_label.img_offset_y
-            scaled_w = int(self.remote_width * self.canvas_ratio * self.HD_SCALE_FACTOR)
-            scaled_h = int(self.remote_height * self.canvas_ratio * self.HD_SCALE_FACTOR)
-            if rel_x < 0 or rel_y < 0 or rel_x > scaled_w or rel_y > scaled_h:
+            remote_pos = self.map_to_remote(event.x, event.y)
+            if remote_pos is None:
                 return
-            remote_x = (rel_x / (self.canvas_ratio * self.HD_SCALE_FACTOR)) * self.remote_scaling
-            remote_y = (rel_y / (self.canvas_ratio * self.HD_SCALE_FACTOR)) * self.remote_scaling
+            remote_x, remote_y = remote_pos
             
             if not self.is_mouse_pressed:
-                self.send_cmd({
+                self.queue_input({
                     'type': 'mouse_move',
                     'x': int(remote_x),
                     'y': int(remote_y)
                 })
             else:
-                self.send_cmd({
+                self.queue_input({
                     'type': 'mouse_drag',
                     'x': int(remote_x),
                     'y': int(remote_y),
@@ -611,19 +1146,19 @@ class RemoteClient:
             
             if key in self.modifier_keys:
                 self.modifier_keys[key] = True
-                self.send_cmd({'type': 'key_down', 'key': key})
+                self.queue_input({'type': 'key_down', 'key': key})
                 return
             
             char = self.get_pressed_character(keysym)
             if char is not None:
-                self.send_cmd({
+                self.queue_input({
                     'type': 'key_input',
                     'key': char,
                     'is_character': True
                 })
                 return
             
-            self.send_cmd({'type': 'key_input', 'key': key, 'is_character': False})
+            self.queue_input({'type': 'key_input', 'key': key, 'is_character': False})
         except Exception as e:
             print(f"[{self.target_ip}] 键盘按下事件处理失败：{e}")
 
@@ -640,7 +1175,7 @@ class RemoteClient:
             
             if key in self.modifier_keys:
                 self.modifier_keys[key] = False
-                self.send_cmd({'type': 'key_up', 'key': key})
+                self.queue_input({'type': 'key_up', 'key': key})
                 return
         except Exception as e:
             print(f"[{self.target_ip}] 键盘释放事件处理失败：{e}")
@@ -673,7 +1208,7 @@ class RemoteClient:
         try:
             direction = 'up' if event.delta > 0 else 'down'
             distance = (abs(event.delta) // 120) * 6
-            self.send_cmd({'type': 'mouse_wheel', 'direction': direction, 'distance': distance})
+            self.queue_input({'type': 'mouse_wheel', 'direction': direction, 'distance': distance})
         except Exception as e:
             print(f"[{self.target_ip}] 鼠标滚轮事件处理失败：{e}")
 
@@ -687,6 +1222,14 @@ class RemoteClient:
         self.last_adjust_time = 0.0
         self.is_initial_adjust = False
         self.has_adjusted_window = False
+        self.roi = None
+        self.roi_selecting = False
+        self.cursor_state = None
+        self.cursor_shapes = {}
+        self.tile_cache = TileCache()
+        self.protocol_version = LEGACY_PROTOCOL_VERSION
+        self.protocol_writer = ProtocolWriter()
+        self.view_only = False
         
         self.is_mouse_pressed = False
         self.pressed_mouse_button = 'left'
@@ -734,6 +1277,8 @@ class RemoteClient:
         if not self.is_connected:
             return
         self.stop_event.set()
+        self.frame_mailbox.wake()
+        self.input_queue = []
         
         try:
             if self.is_mouse_pressed and self.client_socket:
@@ -768,11 +1313,7 @@ class RemoteClient:
             except:
                 pass
 
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                pass
+        self.frame_mailbox.clear()
 
         self.is_connected = False
         self.remote_sys_info = None
@@ -781,39 +1322,266 @@ class RemoteClient:
 
         print(f"[{self.target_ip}] 连接已断开，所有资源清理完成")
 
+# ---------------------- 解码渲染线程池（所有会话共用） ----------------------
+class RenderStrand:
+    """一个会话在线程池中的串行通道：同一会话的任务按提交顺序执行（分块帧必须按序合成），不同会话并行
+
+    提交的帧先积压在通道中，轮到执行时一次取走全部积压，处理完后若又有新帧则重新排到线程池队尾，
+    多个会话轮流使用线程，单个高帧率会话不会长期占住线程
+    """
+    def __init__(self, executor, handler):
+        self._executor = executor
+        self._handler = handler
+        self._lock = threading.Lock()
+        self._pending = []
+        self._scheduled = False
+        self.idle = threading.Event()  # 没有待处理与执行中的任务
+        self.idle.set()
+
+    def submit(self, frame_data, render=True):
+        """提交一帧；render 为False时只合成不显示（渲染节流跳过的分块帧）"""
+        with self._lock:
+            self._pending.append((frame_data, render))
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self.idle.clear()
+        self._executor.submit(self._drain)
+
+    def _drain(self):
+        with self._lock:
+            jobs, self._pending = self._pending, []
+        try:
+            if jobs:
+                self._handler(jobs)
+        except Exception as e:
+            print(f"解码渲染异常：{e}")
+        with self._lock:
+            if not self._pending:
+                self._scheduled = False
+                self.idle.set()
+                return
+        self._executor.submit(self._drain)
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+_render_executor = None
+
+def get_render_strand(handler):
+    """为一个会话创建解码渲染通道（线程池首次使用时创建，cv2解码与缩放释放GIL，可多核并行）"""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="RenderWorker")
+    return RenderStrand(_render_executor, handler)
+
 # ---------------------- 高清渲染Label（优化版） ----------------------
 class HDNoFlickerLabel(Label):
     def __init__(self, master, **kwargs):
         super().__init__(master, **kwargs)
         self._img_tk = None
+        self._framebuffer = None  # 分块模式下的持久画面缓冲（BGR，传输分辨率）
+        self._selection_edges = []  # 区域放大框选的选框边线
+        self.view_rect = None  # 当前画面对应的被控端区域 (x, y, w, h)
+        self.display_size = (0, 0)  # 当前画面在显示区中的实际尺寸
+        self._display_rgb = None  # 当前显示的画面（RGB，显示尺寸），用于光标叠加与增量更新
+        self._prepared_rgb = None  # 线程池最近一次生成的显示画面，作为下一帧变化检测的基准
+        self._cursor_label = None  # 光标叠加层：只重绘光标所在的一小块画面
+        self._cursor_img_tk = None
         self.img_offset_x = 0
         self.img_offset_y = 0
+        self.area_size = (1, 1)  # 显示区尺寸（主线程在<Configure>中更新，供线程池计算显示尺寸）
+        self.bind('<Configure>', self._on_configure, add='+')
         self.focus_set()
         self.bind('<Visibility>', lambda e: self.focus_set())
         self.config(takefocus=True)
         self.bind('<Button-1>', lambda e: self.focus_set())
 
+    def composite_tiles(self, frame_data, client: RemoteClient):
+        """将分块帧中的变化区块合成到画面缓冲，成功返回True"""
+        _, flags, width, height, tile_count, src_x, src_y, src_w, src_h, copy_count = TILE_HEADER.unpack_from(frame_data, 0)
+        self.view_rect = (src_x, src_y, src_w, src_h)
+        # 传输尺寸可能已被被控端缩小，未获取到系统信息时以帧头中的原始屏幕尺寸为准
+        if src_w and src_h and not client.roi and (client.remote_width == 0 or client.remote_height == 0):
+            client.remote_width, client.remote_height = src_w, src_h
+            print(f"[{client.target_ip}] 从帧头提取分辨率：{client.remote_width}x{client.remote_height}")
+            if not client.has_adjusted_window and client.main_window and client.main_window.winfo_exists():
+                client.main_window.after(0, client.auto_adjust_window_size)
+        cache = client.tile_cache
+        if flags & TILE_FLAG_CACHE_RESET:
+            cache.clear()
+        if flags & TILE_FLAG_KEYFRAME:
+            if self._framebuffer is None or self._framebuffer.shape[:2] != (height, width):
+                self._framebuffer = np.zeros((height, width, 3), dtype=np.uint8)
+        elif self._framebuffer is None or self._framebuffer.shape[:2] != (height, width):
+            # 缺少基准画面，增量无法合成；本帧的缓存操作也未执行，需同时重置缓存
+            client.request_refresh(reset_cache=True)
+            return False
+        
+        view = memoryview(frame_data)
+        offset = TILE_HEADER.size
+        # 滚动/平移：先在画面缓冲内复制已有内容，再覆盖新露出的区块
+        for _ in range(copy_count):
+            src_x, src_y, dst_x, dst_y, w, h = COPY_RECORD.unpack_from(frame_data, offset)
+            offset += COPY_RECORD.size
+            if max(src_x, dst_x) + w > width or max(src_y, dst_y) + h > height:
+                client.request_refresh(reset_cache=True)
+                return False
+            self._framebuffer[dst_y:dst_y + h, dst_x:dst_x + w] = self._framebuffer[src_y:src_y + h, src_x:src_x + w].copy()
+        # 记录顺序与被控端操作缓存的顺序一致：先是命中的引用，再是新编码的区块
+        for _ in range(tile_count):
+            x, y, w, h, codec, key, length = TILE_RECORD.unpack_from(frame_data, offset)
+            offset += TILE_RECORD.size
+            if codec == TILE_CODEC_CACHED:
+                tile = cache.get(key)
+                if tile is None:
+                    # 两端缓存失步
+                    client.request_refresh(reset_cache=True)
+                    continue
+            else:
+                payload = view[offset:offset + length]
+                offset += length
+                if codec == TILE_CODEC_FLAT:
+                    # 纯色区块：3字节BGR直接填充
+                    tile = np.empty((h, w, 3), dtype=np.uint8) if length == 3 else None
+                    if tile is not None:
+                        tile[:] = np.frombuffer(payload, np.uint8)
+                else:
+                    # JPEG/PNG/WebP 均由imdecode按数据自动识别
+                    tile = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+                if tile is None or tile.shape[:2] != (h, w):
+                    client.request_refresh(reset_cache=True)
+                    continue
+                cache.put(key, tile_bytes(w, h), tile)
+            if tile.shape[:2] != (h, w):
+                client.request_refresh(reset_cache=True)
+                continue
+            self._framebuffer[y:y + h, x:x + w] = tile
+        return True
+
+    def show_selection(self, x0, y0, x1, y1):
+        """绘制区域放大的选框（四条细边线叠加在画面上）"""
+        if not self._selection_edges:
+            self._selection_edges = [Frame(self, bg="red") for _ in range(4)]
+        left, top = min(x0, x1), min(y0, y1)
+        width, height = max(abs(x1 - x0), 2), max(abs(y1 - y0), 2)
+        edges = [(left, top, width, 2), (left, top + height - 2, width, 2),
+                 (left, top, 2, height), (left + width - 2, top, 2, height)]
+        for edge, (x, y, w, h) in zip(self._selection_edges, edges):
+            edge.place(x=x, y=y, width=w, height=h)
+
+    def hide_cursor(self):
+        if self._cursor_label:
+            self._cursor_label.place_forget()
+
+    def draw_cursor(self, client: RemoteClient):
+        """在光标位置叠加一块小图（底图取自当前画面并混合光标），光标移动时无需重绘整帧"""
+        state = client.cursor_state
+        if state is None or not state[3] or self._display_rgb is None:
+            self.hide_cursor()
+            return
+        x, y, shape_hash, _ = state
+        pos = client.map_from_remote(x, y)
+        if pos is None:
+            self.hide_cursor()
+            return
+        rgba, hot_x, hot_y = client.cursor_shapes.get(shape_hash) or default_cursor_shape()
+        img_h, img_w = self._display_rgb.shape[:2]
+        left = int(pos[0]) - self.img_offset_x - hot_x
+        top = int(pos[1]) - self.img_offset_y - hot_y
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + rgba.shape[1], img_w), min(top + rgba.shape[0], img_h)
+        if x1 <= x0 or y1 <= y0:
+            self.hide_cursor()
+            return
+        patch = self._display_rgb[y0:y1, x0:x1].astype(np.float32)
+        cursor = rgba[y0 - top:y1 - top, x0 - left:x1 - left].astype(np.float32)
+        alpha = cursor[:, :, 3:] / 255.0
+        patch = (cursor[:, :, :3] * alpha + patch * (1.0 - alpha)).astype(np.uint8)
+        
+        if self._cursor_label is None:
+            self._cursor_label = Label(self, bd=0, highlightthickness=0, bg="black")
+            # 光标层不拦截鼠标事件：转发给显示区处理
+            for sequence in ('<Motion>', '<ButtonPress-1>', '<ButtonPress-3>', '<ButtonRelease-1>', '<ButtonRelease-3>'):
+                self._cursor_label.bind(sequence, self._forward_cursor_event)
+        self._cursor_img_tk = ImageTk.PhotoImage(image=Image.fromarray(patch))
+        self._cursor_label.config(image=self._cursor_img_tk)
+        self._cursor_label.place(x=self.img_offset_x + x0, y=self.img_offset_y + y0, width=x1 - x0, height=y1 - y0)
+
+    def _forward_cursor_event(self, event):
+        """将落在光标层上的鼠标事件换算为显示区坐标后重新派发"""
+        x = event.x + self._cursor_label.winfo_x()
+        y = event.y + self._cursor_label.winfo_y()
+        self.event_generate(f'<{event.type.name}>' if event.type.name == 'Motion' else
+                            f'<{event.type.name}-{event.num}>', x=x, y=y)
+
+    def hide_selection(self):
+        """隐藏区域放大的选框"""
+        for edge in self._selection_edges:
+            edge.place_forget()
+
+    def _on_configure(self, event):
+        self.area_size = (event.width, event.height)
+
     def update_frame(self, frame_data, client: RemoteClient = None):
-        """高清渲染（优化版）"""
+        """高清渲染（主线程同步执行）；frame_data 为None时显示连接断开"""
         if frame_data is None:
-            self.config(text="连接已断开", font=("Arial", 12), bg="black", fg="white")
+            self.config(image="", text="连接已断开", font=("Arial", 12), bg="black", fg="white")
             self.img_offset_x = 0
             self.img_offset_y = 0
             self._img_tk = None
+            self._framebuffer = None
+            self.view_rect = None
+            self.display_size = (0, 0)
+            self._display_rgb = None
+            self._prepared_rgb = None
+            self.hide_selection()
+            self.hide_cursor()
             return
         
         if not client or not client.is_connected:
             return
+        display = self.prepare_display([(frame_data, True)], client)
+        if display is not None:
+            self.show_display(display, client)
+
+    def prepare_display(self, jobs, client: RemoteClient):
+        """解码与缩放（线程池中执行，不调用Tk）：按顺序合成全部分块帧，返回最新一帧的显示画面
+
+        返回 (RGB画面, 显示尺寸, 画面偏移, 基准画面, 变化区域)，无需显示或解码失败时返回None；
+        变化区域为相对基准画面（上一次生成的画面）的矩形列表，为None时需整幅更新
+        """
+        latest = None
+        for frame_data, _ in jobs:
+            if is_tile_frame(frame_data):
+                latest = self._framebuffer if self.composite_tiles(frame_data, client) else None
+            else:
+                latest = frame_data
+        if latest is None or not any(render for _, render in jobs) or not client.is_connected:
+            return None
         
         try:
-            nparr = np.frombuffer(frame_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
-            if frame is None:
-                return
+            if isinstance(latest, np.ndarray):
+                frame = latest
+                src_h, src_w = frame.shape[:2]
+            else:
+                # 整帧JPEG：先只读尺寸，算出显示尺寸后再按需缩小解码
+                frame = None
+                size = jpeg_size(latest) if JPEG_REDUCED_DECODE else None
+                if size is None:
+                    nparr = np.frombuffer(latest, np.uint8)
+                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+                    if frame is None:
+                        return None
+                    src_h, src_w = frame.shape[:2]
+                else:
+                    src_w, src_h = size
+                self.view_rect = client.roi
             
             if client.remote_width == 0 or client.remote_height == 0:
                 try:
-                    client.remote_height, client.remote_width = frame.shape[:2]
+                    client.remote_height, client.remote_width = src_h, src_w
                     print(f"[{client.target_ip}] 从帧中提取分辨率：{client.remote_width}x{client.remote_height}")
                     if not client.has_adjusted_window and client.main_window and client.main_window.winfo_exists():
                         client.main_window.after(0, client.auto_adjust_window_size)
@@ -821,25 +1589,69 @@ class HDNoFlickerLabel(Label):
                     client.remote_width = 1280
                     client.remote_height = 720
             
-            final_scale = client.canvas_ratio * client.HD_SCALE_FACTOR
-            new_w = int(client.remote_width * final_scale)
-            new_h = int(client.remote_height * final_scale)
-            
-            self.img_offset_x = max(0, (self.winfo_width() - new_w) // 2) if self.winfo_width() > 0 else 0
-            self.img_offset_y = max(0, (self.winfo_height() - new_h) // 2) if self.winfo_height() > 0 else 0
+            area_w, area_h = self.area_size
+            if client.roi and area_w > 1 and area_h > 1:
+                # 区域放大：按原始分辨率接收的子区域等比放大铺满显示区
+                fit_scale = min(area_w / src_w, area_h / src_h)
+                new_w = int(src_w * fit_scale)
+                new_h = int(src_h * fit_scale)
+            else:
+                # 整屏：与被控端相同的比例规则，显示尺寸等于被控端按视口缩小后的传输尺寸
+                full_w, full_h = client.source_size()
+                final_scale = client.display_scale(full_w, full_h)
+                new_w = int(full_w * final_scale)
+                new_h = int(full_h * final_scale)
+            if new_w <= 0 or new_h <= 0:
+                return None
+            if frame is None:
+                frame = decode_jpeg_scaled(latest, (src_w, src_h), new_w, new_h)
+                if frame is None:
+                    return None
+            offset = (max(0, (area_w - new_w) // 2), max(0, (area_h - new_h) // 2))
             
-            # 使用更快的缩放算法
-            frame_resized = cv2.resize(
-                frame, 
-                (new_w, new_h), 
-                interpolation=cv2.INTER_LINEAR  # 线性插值，速度较快
-            )
+            # 使用更快的缩放算法（被控端已按视口缩小时尺寸通常一致，无需再缩放）
+            if frame.shape[1] == new_w and frame.shape[0] == new_h:
+                frame_resized = frame
+            else:
+                frame_resized = cv2.resize(
+                    frame, 
+                    (new_w, new_h), 
+                    interpolation=cv2.INTER_LINEAR  # 线性插值，速度较快
+                )
+            # 颜色转换生成新数组，此后画面缓冲被下一帧修改也不影响显示
             frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            
-            self._img_tk = ImageTk.PhotoImage(image=img)
-            self.config(image=self._img_tk, text="", bg="black")
-            self.image = self._img_tk
+            base, boxes = self._prepared_rgb, None
+            if base is not None and base.shape == frame_rgb.shape:
+                boxes = dirty_boxes(base, frame_rgb)
+                if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes) > DIRTY_FULL_RATIO * new_w * new_h:
+                    boxes = None
+            self._prepared_rgb = frame_rgb
+            return frame_rgb, (new_w, new_h), offset, base, boxes
+        except Exception as e:
+            print(f"[{client.target_ip}] 高清渲染失败：{e}")
+            return None
+
+    def show_display(self, display, client: RemoteClient):
+        """主线程中显示线程池生成的画面：复用同一图像，只上传变化区域，尺寸变化时才重新创建"""
+        frame_rgb, display_size, (offset_x, offset_y), base, boxes = display
+        try:
+            height, width = frame_rgb.shape[:2]
+            if self._img_tk is None or (self._img_tk.width(), self._img_tk.height()) != (width, height):
+                self._img_tk = ImageTk.PhotoImage(image=Image.fromarray(frame_rgb))
+                self.config(image=self._img_tk, text="", bg="black")
+                self.image = self._img_tk
+            elif boxes is None or base is not self._display_rgb:
+                # 变化面积大，或基准画面未显示过（被更新的画面取代），整幅写入现有图像
+                self._img_tk.paste(Image.fromarray(frame_rgb))
+            else:
+                for x0, y0, x1, y1 in boxes:
+                    patch = ImageTk.PhotoImage(image=Image.fromarray(frame_rgb[y0:y1, x0:x1]))
+                    self.tk.call(str(self._img_tk), 'copy', str(patch), '-to', x0, y0)
+            self.display_size = display_size
+            self.img_offset_x = offset_x
+            self.img_offset_y = offset_y
+            self._display_rgb = frame_rgb
+            self.draw_cursor(client)
         except Exception as e:
             print(f"[{client.target_ip}] 高清渲染失败：{e}")
 
@@ -859,6 +1671,9 @@ class SingleRemoteWindow(tk.Toplevel):
 
         # 绑定窗口关闭事件
         self.protocol("WM_DELETE_WINDOW", self.on_window_close)
+        # 聚焦/失焦/最小化/还原时通知被控端调整帧率（子控件的事件同样经过窗口绑定，由防抖合并）
+        for sequence in ('<FocusIn>', '<FocusOut>', '<Map>', '<Unmap>'):
+            self.bind(sequence, self.remote_client.schedule_view_priority, add='+')
 
         # 初始化独立窗口的GUI布局
         self.init_window_gui()
@@ -887,7 +1702,7 @@ class SingleRemoteWindow(tk.Toplevel):
         top_frame.pack(pady=5, fill=tk.X, padx=10)
 
         Label(top_frame, text="清晰度：", font=("Arial", 10)).pack(side=tk.LEFT, padx=2)
-        hd_scale_slider = Scale(top_frame, from_=0.5, to=2.0, resolution=0.1, orient=tk.HORIZONTAL,
+        hd_scale_slider = Scale(top_frame, from_=0.5, to=1.0, resolution=0.1, orient=tk.HORIZONTAL,
                                 command=self.remote_client.adjust_hd_scale, font=("Arial", 8), length=80, width=15)
         hd_scale_slider.set(1.0)
         hd_scale_slider.pack(side=tk.LEFT, padx=2)
@@ -900,6 +1715,25 @@ class SingleRemoteWindow(tk.Toplevel):
         hd_scale_entry.bind('<FocusOut>', self.remote_client.update_hd_scale_from_entry)
         self.remote_client.hd_scale_entry = hd_scale_entry
 
+        Label(top_frame, text="带宽：", font=("Arial", 10)).pack(side=tk.LEFT, padx=(10, 2))
+        bandwidth_combo = ttk.Combobox(top_frame, values=[name for name, _ in BANDWIDTH_PRESETS],
+                                       state="readonly", width=8, font=("Arial", 9))
+        bandwidth_combo.current(0)
+        bandwidth_combo.pack(side=tk.LEFT, padx=2)
+        bandwidth_combo.bind('<<ComboboxSelected>>', self.remote_client.select_bandwidth)
+        self.remote_client.bandwidth_combo = bandwidth_combo
+
+        Label(top_frame, text="显示器：", font=("Arial", 10)).pack(side=tk.LEFT, padx=(10, 2))
+        monitor_combo = ttk.Combobox(top_frame, values=[], state="disabled", width=18, font=("Arial", 9))
+        monitor_combo.pack(side=tk.LEFT, padx=2)
+        monitor_combo.bind('<<ComboboxSelected>>', self.remote_client.select_monitor)
+        self.remote_client.monitor_combo = monitor_combo
+
+        Button(top_frame, text="区域放大", font=("Arial", 9),
+               command=self.remote_client.toggle_roi_select).pack(side=tk.LEFT, padx=(10, 2))
+        Button(top_frame, text="整屏", font=("Arial", 9),
+               command=self.remote_client.reset_roi).pack(side=tk.LEFT, padx=2)
+
         # 窗口中间：核心显示+聊天区域
         main_frame = Frame(self)
         main_frame.pack(pady=5, fill=tk.BOTH, expand=True, padx=10)
@@ -909,6 +1743,8 @@ class SingleRemoteWindow(tk.Toplevel):
         display_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=2)
         display_label = HDNoFlickerLabel(display_frame, bg="black", text="等待连接...", font=("Arial", 12), fg="white")
         display_label.pack(fill=tk.BOTH, expand=True)
+        display_label.bind('<Configure>', self.remote_client.schedule_viewport_update, add='+')
+        display_label.bind('<Visibility>', self.remote_client.schedule_view_priority, add='+')
         self.remote_client.display_label = display_label
 
         # 聊天区域
@@ -19,22 +19,98 @@ import os
 import ctypes
 from datetime import datetime
 import queue
-import winreg
-import pystray
 from PIL import Image as PILImage, ImageDraw
 import sys
 import psutil
 import getpass
 import time
+import struct
+import glob
+import functools
+import zlib
+import shutil
+from abc import ABC, abstractmethod
+import subprocess
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+from tile_cache import TileCache, tile_key, tile_bytes
+from framing import MessageReader, ConnectionClosed, send_message
+from protocol import (PROTOCOL_VERSION, LEGACY_PROTOCOL_VERSION, ProtocolWriter, is_typed_message, unpack_message,
+                      decode_messages, timestamp_ms, INPUT_TYPES, MSG_FLAG_MORE, MSG_HELLO_ACK, MSG_TILE_FRAME, MSG_JPEG_FRAME, MSG_CURSOR,
+                      MSG_CHAT, MSG_CONTROL)
+
+# ---------------------- 平台相关依赖（无界面/非Windows环境可缺省） ----------------------
+try:
+    import winreg
+except ImportError:
+    winreg = None
+try:
+    import pystray
+except Exception as e:
+    print(f"系统托盘不可用（pystray加载失败）：{e}")
+    pystray = None
+
 # ---------------------- 核心配置（优化版） ----------------------
 LISTEN_PORT = 8888
 JPEG_QUALITY = 55  # 降低质量以提高传输效率
 BUFFER_SIZE = 32768  # 增大缓冲区
 FPS_LIMIT = 25  # 降低FPS以减少CPU占用
+ROI_FPS_LIMIT = 40  # 区域放大模式的帧率上限（画面小，可提高帧率）
 FRAME_QUEUE_SIZE = 2  # 增加队列缓冲
+FRAME_CHUNK_SIZE = 64 * 1024  # 画面帧分片大小（协议版本4），分片之间可插入聊天/光标消息
+MAX_OBSERVERS = 4  # 同时观看的观察者上限（共用控制端连接的截图编码，只能观看和聊天）；0为旧行为：新连接替换当前连接
+RESYNC_INTERVAL = 2.0  # 观察者丢帧后请求全员关键帧的最小间隔（秒）
+VIEW_PRIORITIES = ("focused", "background", "paused")  # 控制端窗口状态（由高到低）：聚焦全速 / 可见未聚焦低帧率 / 最小化或隐藏时暂停
+BACKGROUND_FPS = 3  # 控制端窗口可见但未聚焦时的截图与光标帧率
+PAUSED_CHECK_INTERVAL = 0.1  # 暂停期间（只保持连接，不截图不发光标）检查是否恢复的间隔（秒）
 MOUSE_THROTTLE = 0.03  # 降低节流延迟
-SCROLL_SPEED_MULTIPLIER = 3
-AUTO_START_KEY = winreg.HKEY_CURRENT_USER
+SCROLL_SPEED_MULTIPLIER = 3  # 控制端每滚动一格，被控端滚动的格数（各注入后端一致）
+TILE_MODE = True  # 分块增量传输：只编码发送变化的区块
+TILE_SIZE = 64  # 区块边长（像素）
+TILE_DIFF_THRESHOLD = 15  # 像素灰度差超过该值视为变化
+CHANGE_DETECTOR = "signature"  # 变化检测：signature（隔行亮度签名，低开销）/ full（全分辨率逐像素对比），可用 --change-detector= 覆盖
+SIGNATURE_ROW_STRIDE = 4  # 签名检测每帧抽取的行间隔（需整除TILE_SIZE），起始行逐帧轮换
+PIPELINE_MODE = "thread"  # 采集编码模式：thread（单进程线程）/ process（共享内存环形缓冲+多进程编码，需分块模式），可用 --pipeline= 覆盖
+ENCODER_PROCESSES = max(1, (os.cpu_count() or 2) - 1)  # 编码进程数
+FRAME_RING_SLOTS = 4  # 共享内存环形缓冲的帧槽数（即同时在编码的最大帧数）
+ENCODE_CHUNK_TILES = 96  # 单帧变化区块超过该数量时拆分给多个编码进程并行
+CAPTURE_SOURCE = "mss"  # 截图源：mss[:显示器序号] / synthetic[:场景] / replay:图片目录，可用 --capture-source= 覆盖
+SYNTHETIC_SCREEN_SIZE = (1920, 1080)  # 合成截图源的分辨率
+# 码率自适应：根据发送耗时、队列积压和帧大小调整JPEG质量/帧率/截图分辨率
+RATE_TARGET_LATENCY_MS = 150  # 默认目标延迟（帧入队到发送完成）
+RATE_UPDATE_INTERVAL = 1.0  # 调整周期（秒）
+RATE_MIN_QUALITY = 25
+RATE_MAX_QUALITY = 80
+RATE_MIN_FPS = 3
+RATE_ALLOW_SCALE = True  # 质量与帧率降到底后是否允许降低截图分辨率
+RATE_MIN_SCALE = 0.5
+RATE_SCALE_HOLD = 3.0  # 分辨率变化会触发关键帧，两次调整至少间隔的秒数
+SCROLL_DETECTION = True  # 滚动/平移识别：以复制操作代替重新编码整片区域
+SCROLL_MIN_TILES = 8  # 变化区块达到该数量才尝试识别滚动
+SCROLL_MIN_ROWS = 32  # 单个复制操作的最小行（列）数
+SCROLL_MAX_REPEAT = 4  # 参考画面中重复出现超过该次数的行（空白行等）不参与位移投票
+CODEC_SELECTION = True  # 按区块内容选择编码：纯色→填充指令，文字/界面→无损PNG，照片→JPEG/WebP
+TEXT_EQUAL_RATIO = 0.5  # 与相邻像素完全相同的字节比例达到该值视为文字/界面区块
+PNG_COMPRESSION = 3  # 文字区块PNG压缩级别（越高越小越慢）
+PHOTO_CODEC = "jpeg"  # 照片区块编码：jpeg / webp（webp同质量下更小，编解码更慢）
+PROGRESSIVE_REFINE = True  # 渐进增强：变化区块先按当前质量快速发送，静止若干帧后趁发送空闲以高质量重发
+REFINE_AFTER_FRAMES = 8  # 区块连续静止该帧数后才重发
+REFINE_QUALITY = 90  # 重发使用的JPEG/WebP质量
+REFINE_LOSSLESS = False  # 重发改用无损PNG（画质最好，数据量更大）
+REFINE_MAX_TILES = 32  # 单条重发帧的最大区块数，避免占满带宽影响后续变化
+TILE_CACHE = True  # 区块内容缓存：重复出现的区块只发送哈希引用（容量见 tile_cache.py，两端一致）
+CURSOR_CHANNEL = True  # 光标独立通道：位置与形状作为小消息单独高频发送，不依赖画面帧率
+CURSOR_FPS = 60  # 光标采样频率
+INPUT_BACKEND = "auto"  # 键鼠注入后端：auto / sendinput / xtest / xdotool / pyautogui / recording（recording只记录不执行）
+DESKTOP_RECT_REFRESH = 2.0  # 注入后端缓存的虚拟桌面范围的刷新间隔（秒）；切换显示器时立即刷新
+INPUT_PLAYOUT = True  # 键鼠时序还原：按控制端事件时间重放（拖拽、手写轨迹不受网络抖动影响），缓冲深度随抖动自适应
+INPUT_PLAYOUT_MIN_MS = 0  # 最小缓冲深度
+INPUT_PLAYOUT_MAX_MS = 120  # 最大缓冲深度（抖动再大也不继续增加操作延迟）
+INPUT_JITTER_PERCENTILE = 0.95  # 缓冲深度覆盖该比例事件的传输时间波动
+INPUT_JITTER_WINDOW = 128  # 按最近该数量事件的传输时间估计基准与波动
+AUTO_START_KEY = winreg.HKEY_CURRENT_USER if winreg else None
 AUTO_START_PATH = "Software\\Microsoft\\Windows\\CurrentVersion\\Run"
 AUTO_START_NAME = "RemoteControlSlave"
 
@@ -43,31 +119,193 @@ tray_icon = None
 root = None
 msg_notify_window = None
 current_active_connection = None
-USE_WIN32 = False
-MODIFIER_STATE = {'ctrl': False, 'shift': False, 'alt': False, 'win': False}
+input_injector = None  # 键鼠注入后端，启动时创建一次，所有连接共用
+
+# ---------------------- 分块帧格式（需与控制端保持一致） ----------------------
+# 帧头：魔数(4) + 标志(1) + 帧宽(2) + 帧高(2) + 区块数(2) + 源区域x(4) + y(4) + 宽(2) + 高(2) + 复制操作数(2)
+#       帧宽高为实际传输（缩放后）的尺寸，源区域为该帧对应的被控端原始屏幕坐标范围
+# 复制：源x(2) + 源y(2) + 目标x(2) + 目标y(2) + 宽(2) + 高(2)，紧跟帧头，按顺序在画面缓冲上先于区块执行
+# 区块：x(2) + y(2) + 宽(2) + 高(2) + 类型(1) + 内容哈希(8) + 数据长度(4) + 数据（坐标为传输尺寸下的坐标）
+#       类型：JPEG/PNG/WebP为对应图片数据，纯色为3字节BGR，缓存引用无数据（从区块缓存中按哈希取出像素）
+TILE_FRAME_MAGIC = b'LDT5'
+TILE_HEADER = struct.Struct('>4sBHHHiiHHH')
+COPY_RECORD = struct.Struct('>HHHHHH')
+TILE_RECORD = struct.Struct('>HHHHBQI')
+TILE_FLAG_KEYFRAME = 0x01
+TILE_FLAG_CACHE_RESET = 0x02  # 两端清空区块缓存后再处理本帧
+TILE_CODEC_JPEG = 0
+TILE_CODEC_CACHED = 1
+TILE_CODEC_PNG = 2
+TILE_CODEC_FLAT = 3
+TILE_CODEC_WEBP = 4
+
+# ---------------------- 光标消息格式（需与控制端保持一致） ----------------------
+# 位置：魔数(4) + x(4) + y(4) + 形状哈希(4) + 是否可见(1)，坐标系与鼠标指令相同（所截画面坐标）
+# 形状：魔数(4) + 形状哈希(4) + 热点x(2) + 热点y(2) + PNG(BGRA)，同一形状每个连接只发送一次
+CURSOR_POS_MAGIC = b'LDC1'
+CURSOR_POS = struct.Struct('>4siiIB')
+CURSOR_SHAPE_MAGIC = b'LDS1'
+CURSOR_SHAPE = struct.Struct('>4sIHH')
+
+# ---------------------- 发送复用（每个连接一个写线程） ----------------------
+PRIORITY_CONTROL = 0  # 协议确认等控制消息
+PRIORITY_INTERACTIVE = 1  # 聊天、光标（画面帧来自帧队列，优先级最低）
+
+class SendMultiplexer:
+    """连接的唯一写入者：其他线程只投递消息，由发送线程按优先级写入套接字
+
+    控制消息 > 聊天/光标 > 画面帧。协议版本4起画面帧按 FRAME_CHUNK_SIZE 分片发送，
+    每个分片之后先发出已投递的消息，聊天与光标不必排在整帧之后。
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self._lock = threading.Lock()
+        self._queues = (deque(), deque())
+        self._waiting = False  # 发送线程正阻塞在帧队列上
+        self._wakeup_pending = False  # 帧队列中已有唤醒标记（最多一个，帧队列为其预留了一格）
+        self.urgent_sent = 0
+        self.chunks_sent = 0
+
+    def post(self, msg_type, data, priority=PRIORITY_INTERACTIVE, replace=None, switch_version=None):
+        """投递一条消息（任意线程调用，不阻塞）
+
+        replace 不为空时丢弃尚未发出的同键消息（光标位置只需最新一条）；
+        switch_version 为该消息发出后切换到的协议版本（协议确认消息）
+        """
+        with self._lock:
+            pending = self._queues[priority]
+            if replace is not None:
+                for item in [item for item in pending if item[2] == replace]:
+                    pending.remove(item)
+            pending.append((msg_type, data, replace, switch_version))
+            wake = self._waiting and not self._wakeup_pending
+            self._wakeup_pending |= wake
+        if wake:
+            # 发送线程阻塞在帧队列上，放入唤醒标记（None）
+            try:
+                self.connection.frame_queue.put_nowait(None)
+            except queue.Full:
+                with self._lock:
+                    self._wakeup_pending = False
+
+    def _write(self, msg_type, data, flags=0, typed=False):
+        connection = self.connection
+        if typed or connection.protocol_version >= 2:
+            send_message(connection.conn, data, connection.protocol_writer.header(msg_type, data, flags))
+        else:
+            send_message(connection.conn, data)
+
+    def send_pending(self):
+        """发出全部已投递的消息（发送线程调用），返回发出的条数"""
+        count = 0
+        while True:
+            with self._lock:
+                item = next((pending.popleft() for pending in self._queues if pending), None)
+            if item is None:
+                self.urgent_sent += count
+                return count
+            msg_type, data, _, switch_version = item
+            self._write(msg_type, data, typed=bool(switch_version and switch_version >= 2))
+            if switch_version is not None:
+                self.connection.protocol_version = switch_version
+                print(f"[{self.connection.addr}] 协议版本：{switch_version}")
+            count += 1
+
+    def next_frame(self, frame_queue, timeout):
+        """发出已投递的消息后等待下一帧；等待期间有消息投递时返回 None，超时抛出 queue.Empty"""
+        with self._lock:
+            self._waiting = True
+            if frame_queue.empty():
+                # 队列为空说明没有残留的唤醒标记（标记也可能被截图线程丢弃旧帧时取走）
+                self._wakeup_pending = False
+        try:
+            if self.send_pending():
+                return None
+            item = frame_queue.get(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting = False
+        if item is None:
+            with self._lock:
+                self._wakeup_pending = False
+        return item
+
+    def send_frame(self, msg_type, data):
+        """发送一帧：协议版本4起分片发送，每个分片之后穿插已投递的消息"""
+        view = memoryview(data).cast('B')
+        if self.connection.protocol_version < 4 or view.nbytes <= FRAME_CHUNK_SIZE:
+            self._write(msg_type, view)
+            return
+        for offset in range(0, view.nbytes, FRAME_CHUNK_SIZE):
+            end = offset + FRAME_CHUNK_SIZE
+            self._write(msg_type, view[offset:end], MSG_FLAG_MORE if end < view.nbytes else 0)
+            self.chunks_sent += 1
+            self.send_pending()
+
+# ---------------------- 多人观看（编码一次，多路发送） ----------------------
+class BroadcastQueue(queue.Queue):
+    """连接的帧队列：放入的帧同时转给该连接的观察者，发送线程的唤醒标记（None）不转发"""
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.observers = ()  # 整体替换，转发时无需加锁
+
+    def _put(self, item):
+        super()._put(item)
+        if item is not None:
+            for observer in self.observers:
+                observer.offer_frame(item)
+
+def is_resync_frame(data):
+    """分块帧能否作为观察者重新同步的起点：关键帧，启用区块缓存时还需同时清空缓存"""
+    header = memoryview(data).cast('B')
+    if header.nbytes < TILE_HEADER.size or bytes(header[:4]) != TILE_FRAME_MAGIC:
+        return False
+    flags = header[4]
+    return bool(flags & TILE_FLAG_KEYFRAME) and (not TILE_CACHE or bool(flags & TILE_FLAG_CACHE_RESET))
 
 # ---------------------- 连接隔离类（优化版） ----------------------
 class SlaveConnection:
-    """单个控制端连接的隔离类"""
-    def __init__(self, conn, addr, chat_text, chat_entry):
+    """单个控制端连接的隔离类
+
+    source 不为空时为观察者：不截图编码，只接收 source 编码好的帧（由其帧队列转发），忽略键鼠与画面参数指令
+    """
+    def __init__(self, conn, addr, chat_text, chat_entry, source=None):
         self.conn = conn
         self.addr = addr
         self.is_connected = True
+        self.source = source
+        self.resync = source is not None  # 观察者等待可重新同步的关键帧
+        self.last_resync_request = 0.0
+        self.view_priority = "focused"  # 控制端窗口状态（见 VIEW_PRIORITIES），决定截图与光标的频率
         
         # 核心资源（优化队列大小）
         self.stop_event = threading.Event()
-        self.frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
-        self.last_frame = None
+        # 多进程模式下编码完成的帧由回调按序入队，队列需容纳环形缓冲中所有在途帧；另预留一格给发送线程的唤醒标记
+        self.frame_queue = BroadcastQueue(maxsize=FRAME_QUEUE_SIZE + (FRAME_RING_SLOTS if PIPELINE_MODE == "process" else 0) + 1)
         self.last_frame_time = 0
         self.last_mouse_time = 0.0
+        self.input_playout = None  # 键鼠播放缓冲（指令线程创建）
+        self.force_keyframe = True  # 下一帧发送全部区块
+        self.capture_source = create_capture_source() if source is None else None  # 本连接独占的长期截图源
+        self.change_detector = create_detector_for_source(self.capture_source) if source is None else None  # 变化检测器（持有已发送画面的参考）
+        self.pending_monitor = None  # 控制端请求切换的显示器（0为全部），由截图线程应用
+        self.rate_controller = RateController()  # 码率自适应
+        self.pipeline_stats = PipelineStats()  # 各阶段耗时统计
+        self.encode_pipeline = None  # 多进程编码管线（process模式下由截图线程创建）
+        self.viewport = None  # 控制端显示区域 (宽, 高, 清晰度系数)，用于在编码前缩小画面
+        self.source_rect = (0, 0, 0, 0)  # 当前帧对应的原始屏幕区域
+        self.roi = None  # 区域放大：只截取并传输该区域 (x, y, w, h)，None为整屏
+        self.tile_cache = TileCache() if TILE_CACHE and source is None else None  # 区块缓存（只记录哈希，与控制端同步淘汰）
+        self.cache_reset_pending = False  # 控制端缓存失步，下一关键帧两端同时清空
+        self.refine_tracker = RefineTracker() if PROGRESSIVE_REFINE and TILE_MODE and source is None else None  # 待高质量重发的区块
+        self.last_grab = None  # 截图线程最近一次截取（已缩放）的画面，无变化时用于重发
+        self.send_idle = threading.Event()  # 发送线程空闲（队列已空）时置位
         
         # 聊天组件
         self.chat_text = chat_text
         self.chat_entry = chat_entry
         
         # 拖拽状态
-        self.is_mouse_dragging = False
-        self.dragging_button = 'left'
         
         # 线程对象
         self.cmd_thread = None
@@ -76,7 +314,17 @@ class SlaveConnection:
         
         # 性能统计
         self.frame_count = 0
+        self.tile_count = 0
+        self.sent_bytes = 0
         self.last_stat_time = time.time()
+        
+        # 发送通道：画面、光标、聊天消息共用连接，统一由发送线程按优先级写入
+        self.send_mux = SendMultiplexer(self)
+        self.stream_ready = threading.Event()  # 系统信息握手完成后才允许其他线程发送
+        self.cursor_thread = None
+        self.sent_cursor_shapes = set()  # 已发送给控制端的光标形状哈希
+        self.protocol_version = LEGACY_PROTOCOL_VERSION  # 与控制端协商后的协议版本
+        self.protocol_writer = ProtocolWriter()  # 协议版本2的消息头（序号）
 
     def disconnect(self, graceful=True):
         """断开当前连接，清理资源（优化版）"""
@@ -86,25 +334,21 @@ class SlaveConnection:
         
         print(f"[{self.addr}] 开始断开连接...")
         
-        # 1. 设置停止事件，通知所有线程退出
+        # 1. 设置停止事件，通知所有线程退出；观察者从画面来源摘除，控制端连接断开时观察者一起断开
         self.stop_event.set()
+        if self.source is not None:
+            self.source.remove_observer(self)
+        else:
+            observers, self.frame_queue.observers = self.frame_queue.observers, ()
+            for observer in observers:
+                observer.disconnect()
         
-        # 2. 释放拖拽状态
-        try:
-            if self.is_mouse_dragging:
-                import pyautogui
-                pyautogui.mouseUp(button=self.dragging_button)
-                self.is_mouse_dragging = False
-        except:
-            pass
-        
-        # 3. 释放所有按键状态
+        # 2-3. 停止键鼠播放缓冲，释放仍按下的鼠标按键（拖拽）与修饰键（观察者不注入键鼠）
         try:
-            import pyautogui
-            for key, is_pressed in MODIFIER_STATE.items():
-                if is_pressed:
-                    pyautogui.keyUp(key)
-                    MODIFIER_STATE[key] = False
+            if self.input_playout is not None:
+                self.input_playout.close()
+            if input_injector is not None and self.source is None:
+                input_injector.release_all()
         except:
             pass
         
@@ -125,7 +369,8 @@ class SlaveConnection:
         threads = [
             (self.cmd_thread, "指令处理"),
             (self.capture_thread, "截图"),
-            (self.send_thread, "发送")
+            (self.send_thread, "发送"),
+            (self.cursor_thread, "光标")
         ]
         
         for thread, name in threads:
@@ -147,11 +392,23 @@ class SlaveConnection:
             except queue.Empty:
                 break
         
-        # 7. 重置状态
+        # 7. 释放截图源（截图线程退出时也会释放，这里兜底）
+        try:
+            if self.capture_source is not None:
+                self.capture_source.close()
+        except Exception as e:
+            print(f"[{self.addr}] 释放截图源失败：{e}")
+        
+        # 8. 重置状态
         self.is_connected = False
-        self.last_frame = None
+        if self.change_detector is not None:
+            self.change_detector.reset()
+        self.force_keyframe = True
+        self.roi = None
+        self.viewport = None
+        self.last_grab = None
         
-        # 8. 更新全局状态
+        # 9. 更新全局状态
         if current_active_connection == self:
             current_active_connection = None
             if self.chat_text and self.chat_text.winfo_exists():
@@ -159,6 +416,107 @@ class SlaveConnection:
         
         print(f"[{self.addr}] 连接已完全断开，资源清理完成")
 
+    def stream_scale(self, width, height):
+        """传输缩放比例：不超过控制端视口实际显示所需的尺寸，再叠加码率控制的降级比例"""
+        scale = 1.0
+        # 区域放大模式按原始分辨率传输，只受码率控制约束
+        if self.viewport and not self.roi:
+            view_w, view_h, hd_scale = self.viewport
+            scale = min(1.0, hd_scale, view_w / width, view_h / height)
+            # 按0.05向下取整，避免控制端窗口微调时频繁改变分辨率（每次都会触发关键帧）；控制端按相同规则计算显示尺寸
+            scale = min(1.0, max(0.1, int(scale * 20) / 20))
+        return scale * self.rate_controller.scale
+
+    def apply_pending_monitor(self):
+        """在截图线程内切换显示器（mss句柄需在使用它的线程内创建），同时重建变化检测并发送关键帧"""
+        index = self.pending_monitor
+        if index is None:
+            return
+        self.pending_monitor = None
+        self.capture_source.close()
+        self.capture_source = create_capture_source('mss:all' if index == 0 else f'mss:{index}')
+        self.change_detector = create_detector_for_source(self.capture_source)
+        self.roi = None
+        self.force_keyframe = True
+        if input_injector is not None:
+            input_injector.display_changed()
+
+    def capture_origin(self):
+        """当前截图区域左上角的虚拟桌面坐标（观察者取画面来源的）"""
+        return (self.source or self).capture_source.origin
+
+    def add_observer(self, observer):
+        self.frame_queue.observers += (observer,)
+        self.request_resync()
+        print(f"[{observer.addr}] 以观察者身份观看 {self.addr} 的画面（观察者{len(self.frame_queue.observers)}个）")
+
+    def remove_observer(self, observer):
+        self.frame_queue.observers = tuple(item for item in self.frame_queue.observers if item is not observer)
+
+    def set_view_priority(self, priority):
+        """控制端窗口聚焦/失焦/最小化时调整本连接的画面频率；观察者暂停期间不接收帧，恢复后从关键帧重新同步"""
+        if priority not in VIEW_PRIORITIES or priority == self.view_priority:
+            return
+        self.view_priority = priority
+        if self.source is not None and priority == "paused":
+            self.resync = True
+        print(f"[{self.addr}] 观看状态：{priority}")
+
+    def capture_priority(self):
+        """截图按本连接与其观察者中最高的观看状态进行"""
+        return min((viewer.view_priority for viewer in (self,) + self.frame_queue.observers), key=VIEW_PRIORITIES.index)
+
+    def request_resync(self):
+        """观察者刚加入或丢帧：下一帧发送清空区块缓存的关键帧，所有观看者从该帧起重新同步（限频）"""
+        current_time = time.time()
+        if current_time - self.last_resync_request < RESYNC_INTERVAL:
+            return
+        self.last_resync_request = current_time
+        if self.tile_cache is not None:
+            self.cache_reset_pending = True
+        self.force_keyframe = True
+
+    def offer_frame(self, item):
+        """观察者接收画面来源编码好的帧（在来源帧队列的锁内调用，不能阻塞）
+
+        队列满时丢弃该帧，此后的增量帧都无法解码，丢到下一个可重新同步的关键帧为止，不拖慢其他观看者
+        """
+        if not self.is_connected or self.view_priority == "paused":
+            return
+        if self.resync:
+            if TILE_MODE and not is_resync_frame(item[1]):
+                self.source.request_resync()
+                return
+            self.resync = False
+        try:
+            self.frame_queue.put_nowait(item)
+        except queue.Full:
+            self.resync = True
+            self.source.request_resync()
+
+    def send_message(self, data, msg_type, priority=PRIORITY_INTERACTIVE, replace=None):
+        """投递一条消息，由发送线程按优先级发出（消息之间不会交错），协商后附带协议消息头"""
+        self.send_mux.post(msg_type, data, priority, replace)
+
+    def negotiate_protocol(self, version):
+        """响应控制端的hello：确认双方都支持的最高版本，确认消息发出后发送线程立即切换"""
+        version = max(LEGACY_PROTOCOL_VERSION, min(version, PROTOCOL_VERSION))
+        if version >= 2:
+            ack = json.dumps({"version": version}).encode()
+            self.send_mux.post(MSG_HELLO_ACK, ack, PRIORITY_CONTROL, switch_version=version)
+        else:
+            self.protocol_version = version
+            print(f"[{self.addr}] 协议版本：{version}")
+
+    def capture_fps(self):
+        """目标截图帧率：区域放大时画面小，按比例提高帧率（仍随码率控制降级）；控制端窗口未聚焦时降为 BACKGROUND_FPS"""
+        fps = self.rate_controller.fps
+        if self.roi:
+            fps = min(ROI_FPS_LIMIT, fps * ROI_FPS_LIMIT / FPS_LIMIT)
+        if self.capture_priority() == "background":
+            fps = min(fps, BACKGROUND_FPS)
+        return fps
+
     def _clear_chat_ui(self):
         """清空聊天UI（线程安全）"""
         if not self.chat_text.winfo_exists():
@@ -175,13 +533,8 @@ class SlaveConnection:
 
 # ---------------------- 键鼠API初始化 ----------------------
 def init_mouse_keyboard_api():
-    global USE_WIN32, MODIFIER_STATE
-    USE_WIN32 = False
-    import pyautogui
-    pyautogui.FAILSAFE = False
-    pyautogui.PAUSE = 0.001
-    MODIFIER_STATE = {'ctrl': False, 'shift': False, 'alt': False, 'win': False}
-    print("已加载pyautogui API（优化模式）")
+    global input_injector
+    input_injector = create_input_injector(INPUT_BACKEND)
 
 # ---------------------- 开机自启 ----------------------
 def get_script_path():
@@ -195,6 +548,8 @@ def get_script_path():
         return ""
 
 def set_auto_start():
+    if winreg is None:
+        return False
     try:
         script_path = get_script_path()
         if not script_path:
@@ -208,6 +563,8 @@ def set_auto_start():
         return False
 
 def cancel_auto_start():
+    if winreg is None:
+        return False
     try:
         key = winreg.OpenKey(AUTO_START_KEY, AUTO_START_PATH, 0, winreg.KEY_SET_VALUE)
         winreg.DeleteValue(key, AUTO_START_NAME)
@@ -218,6 +575,8 @@ def cancel_auto_start():
         return False
 
 def check_auto_start():
+    if winreg is None:
+        return False
     try:
         key = winreg.OpenKey(AUTO_START_KEY, AUTO_START_PATH, 0, winreg.KEY_READ)
         winreg.QueryValueEx(key, AUTO_START_NAME)
@@ -231,6 +590,8 @@ def check_auto_start():
 
 # ---------------------- 系统托盘 ----------------------
 def create_tray_icon():
+    if pystray is None:
+        return None
     try:
         icon_size = 16
         image_normal = PILImage.new('RGB', (icon_size, icon_size), (64, 64, 64))
@@ -338,21 +699,27 @@ def exit_app():
             except Exception as e:
                 print(f"断开连接时出错：{e}")
         
-        # 2. 关闭消息窗口
+        # 2. 关闭编码进程池
+        try:
+            shutdown_encoder_pool(wait=True)
+        except Exception as e:
+            print(f"关闭编码进程池时出错：{e}")
+        
+        # 3. 关闭消息窗口
         if msg_notify_window and msg_notify_window.winfo_exists():
             try:
                 msg_notify_window.destroy()
             except:
                 pass
         
-        # 3. 停止托盘图标
+        # 4. 停止托盘图标
         if tray_icon:
             try:
                 tray_icon.stop()
             except:
                 pass
         
-        # 4. 关闭主窗口
+        # 5. 关闭主窗口
         if root:
             try:
                 root.quit()
@@ -360,7 +727,7 @@ def exit_app():
             except:
                 pass
         
-        # 5. 清理所有残留的被控端进程（关键步骤）
+        # 6. 清理所有残留的被控端进程（关键步骤）
         try:
             print("正在清理所有残留的被控端进程...")
             import subprocess
@@ -410,10 +777,10 @@ def exit_app():
         except Exception as e:
             print(f"清理进程时出错: {e}")
         
-        # 6. 等待一下，确保资源清理
+        # 7. 等待一下，确保资源清理
         time.sleep(0.1)
         
-        # 7. 完全退出程序
+        # 8. 完全退出程序
         print("程序即将完全退出...")
         os._exit(0)
             
@@ -456,6 +823,7 @@ def get_system_info():
             "machine": platform.machine(),
             "local_ip": get_local_ip(),
             "screen_scaling": get_screen_scaling(),
+            "monitors": list_monitors(),
         }
         
         try:
@@ -488,6 +856,17 @@ def get_system_info():
         print(f"采集系统信息失败：{e}")
         return {"error": f"采集信息失败：{str(e)}", "local_ip": get_local_ip(), "hostname": platform.node()}
 
+def list_monitors():
+    """枚举显示器（编号与mss一致，从1开始），坐标为虚拟桌面坐标，失败返回空列表"""
+    try:
+        with mss.mss() as sct:
+            return [{"index": index, "left": mon["left"], "top": mon["top"],
+                     "width": mon["width"], "height": mon["height"]}
+                    for index, mon in enumerate(sct.monitors[1:], 1)]
+    except Exception as e:
+        print(f"枚举显示器失败：{e}")
+        return []
+
 def set_thread_priority():
     if platform.system() != "Windows":
         return
@@ -539,9 +918,9 @@ def send_chat_msg():
             "time": datetime.now().strftime("%H:%M:%S")
         }
         
-        data = json.dumps(chat_data).encode()
-        connection.conn.sendall(len(data).to_bytes(4, 'big'))
-        connection.conn.sendall(data)
+        # 观察者同样收到聊天消息
+        for viewer in (connection,) + connection.frame_queue.observers:
+            viewer.send_message(json.dumps(chat_data).encode(), MSG_CHAT)
         
         def update_chat_ui():
             if not connection.chat_text.winfo_exists() or not connection.chat_entry.winfo_exists():
@@ -578,124 +957,1680 @@ def add_chat_msg(msg_data, connection: SlaveConnection):
     except Exception as e:
         print(f"添加聊天消息失败：{e}")
 
-# ---------------------- 键鼠操作（优化版） ----------------------
-def press_mouse(x, y, button='left'):
-    try:
-        set_mouse_pos(x, y)
-        import pyautogui
-        pyautogui.mouseDown(int(x), int(y), button=button)
-    except Exception as e:
-        print(f"鼠标按下失败：{e}")
+# ---------------------- 键鼠注入（启动时选定的长期后端） ----------------------
+class InjectionStats:
+    """键鼠注入耗时统计（线程安全），summary() 输出后清零"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.peak = 0.0
 
-def release_mouse(x, y, button='left'):
-    try:
-        set_mouse_pos(x, y)
-        import pyautogui
-        pyautogui.mouseUp(int(x), int(y), button=button)
-    except Exception as e:
-        print(f"鼠标释放失败：{e}")
+    def add(self, count, seconds):
+        with self._lock:
+            self.count += count
+            self.total += seconds
+            self.peak = max(self.peak, seconds / count)
 
-def drag_mouse(x, y, button='left'):
-    try:
-        import pyautogui
-        pyautogui.moveTo(int(x), int(y), duration=0.0)
-    except Exception as e:
-        print(f"鼠标拖拽失败：{e}")
+    def summary(self):
+        """平均/最大单事件注入耗时（最大值按单批平均计），无事件时返回空字符串"""
+        with self._lock:
+            count, total, peak = self.count, self.total, self.peak
+            self.count, self.total, self.peak = 0, 0.0, 0.0
+        if not count:
+            return ""
+        return f"{count}个事件 | 平均{total / count * 1000:.2f}ms/事件 | 最大{peak * 1000:.2f}ms/事件"
 
-def click_mouse(x, y, button='left'):
-    try:
-        set_mouse_pos(x, y)
-        import pyautogui
-        pyautogui.click(int(x), int(y), button=button)
-    except Exception as e:
-        print(f"鼠标点击失败：{e}")
+# 键名：控制端对未映射的按键直接发送Tk keysym的小写形式（prior、kp_enter、super_l等），同时兼容pyautogui键名
+WINDOWS_VK_CODES = {
+    'ctrl': 0x11, 'shift': 0x10, 'alt': 0x12, 'win': 0x5B,
+    'enter': 0x0D, 'return': 0x0D, 'backspace': 0x08, 'tab': 0x09, 'esc': 0x1B, 'escape': 0x1B, 'space': 0x20,
+    'delete': 0x2E, 'insert': 0x2D, 'home': 0x24, 'end': 0x23, 'pageup': 0x21, 'pagedown': 0x22,
+    'left': 0x25, 'up': 0x26, 'right': 0x27, 'down': 0x28,
+    'capslock': 0x14, 'numlock': 0x90, 'scrolllock': 0x91, 'printscreen': 0x2C, 'pause': 0x13,
+    'prior': 0x21, 'next': 0x22, 'page_up': 0x21, 'page_down': 0x22, 'pgup': 0x21, 'pgdn': 0x22,
+    'print': 0x2C, 'prtsc': 0x2C, 'sys_req': 0x2C, 'break': 0x13, 'cancel': 0x03, 'clear': 0x0C,
+    'menu': 0x5D, 'apps': 0x5D, 'caps_lock': 0x14, 'num_lock': 0x90, 'scroll_lock': 0x91,
+    'control_l': 0xA2, 'control_r': 0xA3, 'ctrlleft': 0xA2, 'ctrlright': 0xA3,
+    'shift_l': 0xA0, 'shift_r': 0xA1, 'shiftleft': 0xA0, 'shiftright': 0xA1,
+    'alt_l': 0xA4, 'alt_r': 0xA5, 'altleft': 0xA4, 'altright': 0xA5, 'alt_gr': 0xA5, 'iso_level3_shift': 0xA5,
+    'super_l': 0x5B, 'super_r': 0x5C, 'win_l': 0x5B, 'win_r': 0x5C, 'meta_l': 0x5B, 'meta_r': 0x5C,
+    'winleft': 0x5B, 'winright': 0x5C,
+    'kp_multiply': 0x6A, 'kp_add': 0x6B, 'kp_separator': 0x6C, 'kp_subtract': 0x6D, 'kp_decimal': 0x6E,
+    'kp_divide': 0x6F, 'kp_enter': 0x0D, 'multiply': 0x6A, 'add': 0x6B, 'separator': 0x6C, 'subtract': 0x6D,
+    'decimal': 0x6E, 'divide': 0x6F,
+    # 小键盘导航键（NumLock关闭时Tk上报的键名）
+    'kp_home': 0x24, 'kp_end': 0x23, 'kp_up': 0x26, 'kp_down': 0x28, 'kp_left': 0x25, 'kp_right': 0x27,
+    'kp_prior': 0x21, 'kp_next': 0x22, 'kp_page_up': 0x21, 'kp_page_down': 0x22,
+    'kp_insert': 0x2D, 'kp_delete': 0x2E, 'kp_begin': 0x0C,
+    **{f'kp_{index}': 0x60 + index for index in range(10)},
+    **{f'num{index}': 0x60 + index for index in range(10)},
+    **{f'f{index}': 0x6F + index for index in range(1, 25)},
+}
+WINDOWS_EXTENDED_KEYS = {0x2E, 0x2D, 0x24, 0x23, 0x21, 0x22, 0x25, 0x26, 0x27, 0x28, 0x5B, 0x5C, 0x5D, 0x6F, 0x90, 0x2C, 0xA3, 0xA5}
+WINDOWS_EXTENDED_NAMES = {'kp_enter'}  # 与主键盘共用VK、需按扩展键注入的按键
+X11_KEYSYM_NAMES = {
+    'ctrl': 'Control_L', 'shift': 'Shift_L', 'alt': 'Alt_L', 'win': 'Super_L',
+    'enter': 'Return', 'return': 'Return', 'backspace': 'BackSpace', 'tab': 'Tab', 'esc': 'Escape', 'escape': 'Escape',
+    'space': 'space', 'delete': 'Delete', 'insert': 'Insert', 'home': 'Home', 'end': 'End',
+    'pageup': 'Prior', 'pagedown': 'Next', 'left': 'Left', 'up': 'Up', 'right': 'Right', 'down': 'Down',
+    'capslock': 'Caps_Lock', 'numlock': 'Num_Lock', 'scrolllock': 'Scroll_Lock', 'printscreen': 'Print', 'pause': 'Pause',
+    'page_up': 'Prior', 'page_down': 'Next', 'pgup': 'Prior', 'pgdn': 'Next', 'prtsc': 'Print', 'apps': 'Menu',
+    'ctrlleft': 'Control_L', 'ctrlright': 'Control_R', 'shiftleft': 'Shift_L', 'shiftright': 'Shift_R',
+    'altleft': 'Alt_L', 'altright': 'Alt_R', 'alt_gr': 'ISO_Level3_Shift', 'win_l': 'Super_L', 'win_r': 'Super_R',
+    'winleft': 'Super_L', 'winright': 'Super_R', 'multiply': 'KP_Multiply', 'add': 'KP_Add', 'separator': 'KP_Separator',
+    'subtract': 'KP_Subtract', 'decimal': 'KP_Decimal', 'divide': 'KP_Divide',
+    **{f'num{index}': f'KP_{index}' for index in range(10)},
+    # Tk keysym的小写形式 → X11 keysym名
+    **{name.lower(): name for name in (
+        'Prior', 'Next', 'Print', 'Menu', 'Break', 'Sys_Req', 'Cancel', 'Clear', 'Caps_Lock', 'Num_Lock', 'Scroll_Lock',
+        'Control_L', 'Control_R', 'Shift_L', 'Shift_R', 'Alt_L', 'Alt_R', 'Meta_L', 'Meta_R', 'Super_L', 'Super_R',
+        'ISO_Level3_Shift', 'KP_Enter', 'KP_Add', 'KP_Subtract', 'KP_Multiply', 'KP_Divide', 'KP_Decimal', 'KP_Separator',
+        'KP_Home', 'KP_End', 'KP_Up', 'KP_Down', 'KP_Left', 'KP_Right', 'KP_Prior', 'KP_Next', 'KP_Page_Up',
+        'KP_Page_Down', 'KP_Insert', 'KP_Delete', 'KP_Begin', *(f'KP_{index}' for index in range(10)))},
+    **{f'f{index}': f'F{index}' for index in range(1, 25)},
+}
+X11_BUTTONS = {'left': 1, 'middle': 2, 'right': 3}
+WHEEL_DELTA = 120  # Windows滚轮一格对应的滚动量
+WHEEL_DISTANCE_PER_NOTCH = 6  # 控制端滚动一格时指令中的 distance（协议约定）
 
-def set_mouse_pos(x, y):
-    try:
-        import pyautogui
-        pyautogui.moveTo(int(x), int(y), duration=0.0)
-    except Exception as e:
-        print(f"设置鼠标位置失败：{e}")
+def wheel_notches(amount):
+    """滚动格数换算为X11滚轮按键次数（至少一次）"""
+    return max(1, round(abs(amount)))
 
-def scroll_mouse(direction, distance):
-    try:
-        scaled_distance = distance * SCROLL_SPEED_MULTIPLIER
-        import pyautogui
-        pyautogui.scroll(scaled_distance * 2 if direction == 'up' else -scaled_distance * 2)
-    except Exception as e:
-        print(f"滚轮操作失败：{e}")
+class InputInjector(ABC):
+    """键鼠注入后端基类：apply() 按顺序注入一批事件，事件之间不插入等待
 
-def key_down(key):
-    try:
-        import pyautogui
-        pyautogui.keyDown(key)
-        MODIFIER_STATE[key] = True
-    except Exception as e:
-        print(f"按键按下失败：{e}")
+    事件为控制端指令字典（坐标已换算为虚拟桌面坐标）。子类实现 _move/_button/_scroll/_key/_text，
+    _scroll 的参数为滚动格数（正数向上），需要合并提交的后端先缓存，在 _flush() 中一次提交。
+    """
+    name = "base"
 
-def key_up(key):
-    try:
-        import pyautogui
-        pyautogui.keyUp(key)
-        MODIFIER_STATE[key] = False
-    except Exception as e:
-        print(f"按键释放失败：{e}")
+    def __init__(self):
+        self.stats = InjectionStats()
+        self.pressed_buttons = set()
+        self.pressed_keys = set()
+        self.unknown_keys = set()  # 已提示过的无法识别的键名
 
-def key_input(key, is_character=False):
-    try:
+    def apply(self, events):
+        if not events:
+            return
+        start = time.perf_counter()
+        for event in events:
+            try:
+                self._dispatch(event)
+            except Exception as e:
+                print(f"键鼠注入失败：{e}（事件：{event.get('type')}）")
+        try:
+            self._flush()
+        except Exception as e:
+            print(f"键鼠注入提交失败：{e}")
+        self.stats.add(len(events), time.perf_counter() - start)
+
+    def _dispatch(self, event):
+        kind = event['type']
+        button = event.get('button', 'left')
+        if 'x' in event and 'y' in event:
+            # 按下/点击/释放都在同一位置，只移动一次
+            self._move(int(event['x']), int(event['y']))
+        if kind == 'mouse_press':
+            self._button(button, True)
+            self.pressed_buttons.add(button)
+        elif kind == 'mouse_release':
+            self._button(button, False)
+            self.pressed_buttons.discard(button)
+        elif kind == 'mouse_click':
+            self._button(button, True)
+            self._button(button, False)
+        elif kind == 'mouse_wheel':
+            # 滚动量统一为格数（有符号），各后端再换算为自己的单位
+            amount = event['distance'] / WHEEL_DISTANCE_PER_NOTCH * SCROLL_SPEED_MULTIPLIER
+            self._scroll(amount if event['direction'] == 'up' else -amount)
+        elif kind == 'key_down':
+            self._key(event['key'], True)
+            self.pressed_keys.add(event['key'])
+        elif kind == 'key_up':
+            self._key(event['key'], False)
+            self.pressed_keys.discard(event['key'])
+        elif kind == 'key_input':
+            key = event['key']
+            if event.get('is_character') or len(key) == 1:
+                self._text(key)
+            else:
+                self._key(key, True)
+                self._key(key, False)
+
+    def release_all(self):
+        """断开连接时释放仍处于按下状态的鼠标按键与修饰键"""
+        self.apply([{'type': 'mouse_release', 'button': button} for button in list(self.pressed_buttons)] +
+                   [{'type': 'key_up', 'key': key} for key in list(self.pressed_keys)])
+
+    def _skip_key(self, key):
+        """无法识别的键名：跳过该按键（每个键名只提示一次），同一批的其他事件照常注入"""
+        if key not in self.unknown_keys:
+            self.unknown_keys.add(key)
+            print(f"键鼠注入（{self.name}）：未知按键 {key}，已跳过")
+
+    @abstractmethod
+    def _move(self, x, y):
+        pass
+
+    @abstractmethod
+    def _button(self, button, down):
+        pass
+
+    @abstractmethod
+    def _scroll(self, amount):
+        pass
+
+    @abstractmethod
+    def _key(self, key, down):
+        pass
+
+    @abstractmethod
+    def _text(self, text):
+        pass
+
+    def _flush(self):
+        pass
+
+    def display_changed(self):
+        """显示器配置可能变化（切换显示器等），缓存了屏幕范围的后端在此失效缓存"""
+        pass
+
+    def close(self):
+        pass
+
+if platform.system() == "Windows":
+    from ctypes import wintypes
+
+    class MOUSEINPUT(ctypes.Structure):
+        _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                    ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                    ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+
+    class HARDWAREINPUT(ctypes.Structure):
+        _fields_ = [('uMsg', wintypes.DWORD), ('wParamL', wintypes.WORD), ('wParamH', wintypes.WORD)]
+
+    class INPUT_UNION(ctypes.Union):
+        _fields_ = [('mi', MOUSEINPUT), ('ki', KEYBDINPUT), ('hi', HARDWAREINPUT)]
+
+    class INPUT(ctypes.Structure):
+        _fields_ = [('type', wintypes.DWORD), ('union', INPUT_UNION)]
+
+class SendInputInjector(InputInjector):
+    """Windows原生注入：一批事件组装为INPUT数组，一次SendInput提交（坐标按虚拟桌面归一化，支持多显示器）"""
+    name = "sendinput"
+    MOUSE_BUTTON_FLAGS = {'left': (0x0002, 0x0004), 'right': (0x0008, 0x0010), 'middle': (0x0020, 0x0040)}
+    MOUSEEVENTF_MOVE_ABSOLUTE = 0x0001 | 0x8000 | 0x4000  # MOVE | ABSOLUTE | VIRTUALDESK
+    MOUSEEVENTF_WHEEL = 0x0800
+    KEYEVENTF_EXTENDEDKEY = 0x0001
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_UNICODE = 0x0004
+
+    def __init__(self):
+        super().__init__()
+        if platform.system() != "Windows":
+            raise RuntimeError("仅支持Windows")
+        self._user32 = ctypes.windll.user32
+        self._pending = []
+        self._desktop = None  # 虚拟桌面 (左, 上, 宽, 高)，按 DESKTOP_RECT_REFRESH 刷新
+        self._desktop_time = 0.0
+
+    def _mouse(self, dx=0, dy=0, data=0, flags=0):
+        self._pending.append(INPUT(type=0, union=INPUT_UNION(mi=MOUSEINPUT(dx, dy, data & 0xFFFFFFFF, flags, 0, 0))))
+
+    def _keyboard(self, vk=0, scan=0, flags=0):
+        self._pending.append(INPUT(type=1, union=INPUT_UNION(ki=KEYBDINPUT(vk, scan, flags, 0, 0))))
+
+    def display_changed(self):
+        self._desktop = None
+
+    def _desktop_rect(self):
+        """虚拟桌面范围：缓存后每次移动无需再调用GetSystemMetrics，定期刷新以跟上分辨率或显示器变化"""
+        now = time.monotonic()
+        if self._desktop is None or now - self._desktop_time >= DESKTOP_RECT_REFRESH:
+            metrics = self._user32.GetSystemMetrics
+            self._desktop = (metrics(76), metrics(77), metrics(78), metrics(79))
+            self._desktop_time = now
+        return self._desktop
+
+    def _move(self, x, y):
+        left, top, width, height = self._desktop_rect()
+        self._mouse(int((x - left) * 65535 / max(width - 1, 1)), int((y - top) * 65535 / max(height - 1, 1)),
+                    flags=self.MOUSEEVENTF_MOVE_ABSOLUTE)
+
+    def _button(self, button, down):
+        down_flag, up_flag = self.MOUSE_BUTTON_FLAGS.get(button, self.MOUSE_BUTTON_FLAGS['left'])
+        self._mouse(flags=down_flag if down else up_flag)
+
+    def _scroll(self, amount):
+        self._mouse(data=round(amount * WHEEL_DELTA), flags=self.MOUSEEVENTF_WHEEL)
+
+    def _key(self, key, down):
+        vk = WINDOWS_VK_CODES.get(key)
+        if vk is None and len(key) == 1:
+            scan = self._user32.VkKeyScanW(ord(key))
+            vk = scan & 0xFF if scan != -1 else None
+        if vk is None:
+            self._skip_key(key)
+            return
+        extended = vk in WINDOWS_EXTENDED_KEYS or key in WINDOWS_EXTENDED_NAMES
+        flags = (0 if down else self.KEYEVENTF_KEYUP) | (self.KEYEVENTF_EXTENDEDKEY if extended else 0)
+        self._keyboard(vk=vk, flags=flags)
+
+    def _char_vk(self, char, hotkey):
+        """字符在当前键盘布局下的 (VK, 是否需要Shift)；无对应按键，或非快捷键时需要Ctrl/Alt（AltGr字符）返回None"""
+        if len(char) != 1 or ord(char) > 0xFFFF:
+            return None
+        scan = self._user32.VkKeyScanW(ord(char)) & 0xFFFF
+        if scan == 0xFFFF:
+            return None
+        shift_state = scan >> 8
+        if shift_state & 0x06 and not hotkey:
+            return None
+        return scan & 0xFF, bool(shift_state & 0x01)
+
+    def _text(self, text):
+        # 有对应按键的字符注入VK，才能与按住的Ctrl/Alt/Win组合成快捷键（VK_PACKET不与修饰键组合）；
+        # 无对应按键的字符（中文等）用Unicode方式输入，超出BMP的字符按UTF-16代理对发送
+        hotkey = any(key in self.pressed_keys for key in ('ctrl', 'alt', 'win'))
+        shift_down = 'shift' in self.pressed_keys
+        for char in text:
+            mapped = self._char_vk(char, hotkey)
+            # 非快捷键时按住的Shift与字符所需的Shift状态不一致，VK会输入另一个字符，改用Unicode
+            if mapped is not None and (hotkey or not shift_down or mapped[1]):
+                vk, need_shift = mapped
+                if need_shift and not shift_down:
+                    self._keyboard(vk=WINDOWS_VK_CODES['shift'])
+                self._keyboard(vk=vk)
+                self._keyboard(vk=vk, flags=self.KEYEVENTF_KEYUP)
+                if need_shift and not shift_down:
+                    self._keyboard(vk=WINDOWS_VK_CODES['shift'], flags=self.KEYEVENTF_KEYUP)
+                continue
+            data = char.encode('utf-16-le')
+            for unit in struct.unpack(f'<{len(data) // 2}H', data):
+                self._keyboard(scan=unit, flags=self.KEYEVENTF_UNICODE)
+                self._keyboard(scan=unit, flags=self.KEYEVENTF_UNICODE | self.KEYEVENTF_KEYUP)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        inputs = (INPUT * len(self._pending))(*self._pending)
+        self._pending = []
+        sent = self._user32.SendInput(len(inputs), inputs, ctypes.sizeof(INPUT))
+        if sent != len(inputs):
+            raise OSError(f"SendInput 仅注入{sent}/{len(inputs)}个事件（可能被UIPI拦截）")
+
+class XTestInjector(InputInjector):
+    """Linux原生注入（需要python-xlib与X服务器XTEST扩展）：一批事件写入后一次同步"""
+    name = "xtest"
+
+    def __init__(self):
+        super().__init__()
+        from Xlib import X, XK, display
+        from Xlib.ext import xtest
+        self._X, self._XK, self._xtest = X, XK, xtest
+        self._display = display.Display()
+        if not self._display.has_extension('XTEST'):
+            self._display.close()
+            raise RuntimeError("X服务器不支持XTEST扩展")
+
+    def _fake(self, event_type, detail=0, **kwargs):
+        self._xtest.fake_input(self._display, event_type, detail, **kwargs)
+
+    def _keycode(self, keysym):
+        keycode = self._display.keysym_to_keycode(keysym)
+        if not keycode:
+            raise ValueError(f"当前键盘布局无此按键（keysym {keysym:#x}）")
+        return keycode
+
+    def _move(self, x, y):
+        self._fake(self._X.MotionNotify, x=x, y=y)
+
+    def _button(self, button, down):
+        self._fake(self._X.ButtonPress if down else self._X.ButtonRelease, X11_BUTTONS.get(button, 1))
+
+    def _scroll(self, amount):
+        button = 4 if amount > 0 else 5
+        for _ in range(wheel_notches(amount)):
+            self._fake(self._X.ButtonPress, button)
+            self._fake(self._X.ButtonRelease, button)
+
+    def _key(self, key, down):
+        keysym = self._XK.string_to_keysym(X11_KEYSYM_NAMES.get(key, key))
+        keycode = self._display.keysym_to_keycode(keysym) if keysym else 0
+        if not keycode:
+            self._skip_key(key)
+            return
+        self._fake(self._X.KeyPress if down else self._X.KeyRelease, keycode)
+
+    def _text(self, text):
+        for char in text:
+            # Latin-1字符的keysym即码位，其余使用Unicode keysym
+            keysym = ord(char) if ord(char) < 0x100 else 0x01000000 | ord(char)
+            keycode = self._keycode(keysym)
+            shifted = self._display.keycode_to_keysym(keycode, 0) != keysym
+            if shifted:
+                shift = self._keycode(self._XK.string_to_keysym('Shift_L'))
+                self._fake(self._X.KeyPress, shift)
+            self._fake(self._X.KeyPress, keycode)
+            self._fake(self._X.KeyRelease, keycode)
+            if shifted:
+                self._fake(self._X.KeyRelease, shift)
+
+    def _flush(self):
+        self._display.sync()
+
+    def close(self):
+        self._display.close()
+
+class XdotoolInjector(InputInjector):
+    """Linux备选（无python-xlib时）：一批事件拼成一条xdotool命令执行，文字输入单独执行"""
+    name = "xdotool"
+
+    def __init__(self):
+        super().__init__()
+        self._path = shutil.which('xdotool')
+        if not self._path:
+            raise RuntimeError("未找到xdotool")
+        self._args = []
+
+    def _run(self, args):
+        subprocess.run([self._path] + args, check=True, timeout=2, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _move(self, x, y):
+        self._args += ['mousemove', str(x), str(y)]
+
+    def _button(self, button, down):
+        self._args += ['mousedown' if down else 'mouseup', str(X11_BUTTONS.get(button, 1))]
+
+    def _scroll(self, amount):
+        self._args += ['click', '--repeat', str(wheel_notches(amount)), '4' if amount > 0 else '5']
+
+    def _key(self, key, down):
+        name = X11_KEYSYM_NAMES.get(key)
+        if name is None and len(key) != 1:
+            # 未知键名会让整条xdotool命令失败，连带同一批的其他事件
+            self._skip_key(key)
+            return
+        self._args += ['keydown' if down else 'keyup', name or key]
+
+    def _text(self, text):
+        # type 会吞掉其后的全部参数，先提交已累积的命令再单独执行
+        self._flush()
+        self._run(['type', '--delay', '0', '--', text])
+
+    def _flush(self):
+        if self._args:
+            args, self._args = self._args, []
+            self._run(args)
+
+class PyAutoGUIInjector(InputInjector):
+    """通用注入（pyautogui）：模块只加载一次，关闭每次调用后的默认等待"""
+    name = "pyautogui"
+
+    def __init__(self):
+        super().__init__()
         import pyautogui
-        if is_character:
-            pyautogui.typewrite(key)
+        pyautogui.FAILSAFE = False
+        pyautogui.PAUSE = 0
+        self._gui = pyautogui
+
+    def _move(self, x, y):
+        self._gui.moveTo(x, y, duration=0.0)
+
+    def _button(self, button, down):
+        (self._gui.mouseDown if down else self._gui.mouseUp)(button=button)
+
+    def _scroll(self, amount):
+        # pyautogui在Windows上按滚动量、在Linux上按滚轮按键次数计
+        if platform.system() == "Windows":
+            self._gui.scroll(round(amount * WHEEL_DELTA))
         else:
-            if len(key) == 1:
-                pyautogui.typewrite(key)
-            else:
-                pyautogui.press(key)
-    except Exception as e:
-        print(f"输入按键/符号失败：{e}（键值：{key}）")
+            self._gui.scroll(wheel_notches(amount) if amount > 0 else -wheel_notches(amount))
+
+    def _key(self, key, down):
+        (self._gui.keyDown if down else self._gui.keyUp)(key)
+
+    def _text(self, text):
+        self._gui.typewrite(text)
+
+class RecordingInjector(InputInjector):
+    """只记录不注入（测试与无可用后端时使用），events 为 (时间, 操作, 参数...) 元组"""
+    name = "recording"
+
+    def __init__(self, max_events=10000):
+        super().__init__()
+        self.events = deque(maxlen=max_events)
+
+    def _record(self, *operation):
+        self.events.append((time.perf_counter(),) + operation)
+
+    def _move(self, x, y):
+        self._record('move', x, y)
+
+    def _button(self, button, down):
+        self._record('button', button, down)
+
+    def _scroll(self, amount):
+        self._record('scroll', amount)
+
+    def _key(self, key, down):
+        self._record('key', key, down)
+
+    def _text(self, text):
+        self._record('text', text)
+
+INPUT_INJECTORS = {cls.name: cls for cls in (SendInputInjector, XTestInjector, XdotoolInjector, PyAutoGUIInjector, RecordingInjector)}
+
+def create_input_injector(name=None):
+    """按名称创建键鼠注入后端；auto 按平台依次尝试原生接口与pyautogui，全部失败时只记录事件"""
+    name = name or INPUT_BACKEND
+    if name == "auto":
+        if platform.system() == "Windows":
+            candidates = ['sendinput']
+        elif platform.system() == "Linux" and os.environ.get('DISPLAY'):
+            candidates = ['xtest', 'xdotool']
+        else:
+            candidates = []
+        candidates.append('pyautogui')
+    else:
+        candidates = [name]
+    for candidate in candidates:
+        try:
+            injector = INPUT_INJECTORS[candidate]()
+            print(f"已加载键鼠注入后端：{injector.name}")
+            return injector
+        except Exception as e:
+            print(f"键鼠注入后端 {candidate} 不可用：{e}")
+    print("无可用的键鼠注入后端，键鼠事件只记录不执行")
+    return RecordingInjector()
+
+# ---------------------- 键鼠时序还原（自适应播放缓冲） ----------------------
+def wrap_ms(delta):
+    """按2^32回绕的毫秒差值 → 有符号整数"""
+    delta &= 0xFFFFFFFF
+    return delta - 0x100000000 if delta >= 0x80000000 else delta
+
+class InputPlayout:
+    """键鼠事件播放缓冲：按控制端记录的事件时间还原事件之间的相对时序，缓冲深度随实测抖动自适应
+
+    两端时钟不同步，只使用 传输时间 = 本端接收时刻 - 控制端事件时间 的相对变化：
+    最近若干事件中最小的传输时间视为无排队的基准，事件在 事件时间 + 基准 + 缓冲深度 时注入；
+    缓冲深度取最近事件传输时间超出基准部分的 INPUT_JITTER_PERCENTILE 分位数（限制在上下限之间），
+    包含网络抖动与控制端合并发送的等待。晚于注入时刻到达的事件立即注入；事件始终按到达顺序注入。
+    """
+    def __init__(self, injector):
+        self.injector = injector
+        self._cond = threading.Condition()
+        self._events = deque()  # (注入时刻perf_counter, 指令)
+        self._transits = deque(maxlen=INPUT_JITTER_WINDOW)
+        self._last_play = 0.0
+        self._closed = False
+        self.depth_ms = INPUT_PLAYOUT_MIN_MS
+        self.played = 0
+        self.late = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _schedule(self, timestamp, now):
+        """计算事件的注入时刻；无事件时间的指令（旧版控制端）立即注入"""
+        if timestamp is None:
+            return now
+        transit = wrap_ms(timestamp_ms() - timestamp)
+        self._transits.append(transit)
+        base = min(self._transits)
+        spread = sorted(self._transits)[int((len(self._transits) - 1) * INPUT_JITTER_PERCENTILE)] - base
+        self.depth_ms = min(INPUT_PLAYOUT_MAX_MS, max(INPUT_PLAYOUT_MIN_MS, spread))
+        delay = self.depth_ms - (transit - base)
+        if delay <= 0:
+            self.late += 1
+            return now
+        return now + delay / 1000
+
+    def push(self, cmds):
+        """按到达顺序加入一批键鼠事件（指令的 ts 字段为控制端事件时间）"""
+        now = time.perf_counter()
+        with self._cond:
+            if self._closed:
+                return
+            for cmd in cmds:
+                self._last_play = max(self._last_play, self._schedule(cmd.pop('ts', None), now))
+                self._events.append((self._last_play, cmd))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._events:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                now = time.perf_counter()
+                if self._events[0][0] > now:
+                    self._cond.wait(self._events[0][0] - now)
+                    continue
+                # 已到注入时刻的事件一起注入
+                batch = []
+                while self._events and self._events[0][0] <= now:
+                    batch.append(self._events.popleft()[1])
+                self.played += len(batch)
+            self.injector.apply(batch)
+
+    def close(self):
+        """停止播放并丢弃尚未注入的事件（断开连接时随后释放仍按下的按键）"""
+        with self._cond:
+            self._closed = True
+            self._events.clear()
+            self._cond.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+
+    def summary(self):
+        """缓冲深度与迟到事件数，输出后清零计数；无事件时返回空字符串"""
+        with self._cond:
+            played, late = self.played, self.late
+            self.played = self.late = 0
+        if not played:
+            return ""
+        return f"缓冲深度{self.depth_ms:.0f}ms | 注入{played}个事件 | 迟到{late}"
+
+# ---------------------- 截图源（每个连接持有一个长期实例） ----------------------
+class CaptureSource(ABC):
+    """截图源基类：grab() 返回一帧BGR图像（numpy数组）
+    
+    origin 为画面左上角在虚拟桌面中的坐标（鼠标指令据此换算），
+    regions 为多显示器拼接时各显示器在画面中的区域，单画面为None
+    """
+    name = "base"
+    origin = (0, 0)
+    regions = None
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def grab(self):
+        pass
+
+    def grab_region(self, region):
+        """截取屏幕子区域，返回 (帧, 实际区域)；区域超出屏幕时裁剪到屏幕范围内"""
+        frame = self.grab()
+        if frame is None:
+            return None, None
+        rect = clamp_region(region, frame.shape[1], frame.shape[0])
+        x, y, w, h = rect
+        return np.ascontiguousarray(frame[y:y + h, x:x + w]), rect
+
+    def close(self):
+        pass
+
+def clamp_region(region, width, height):
+    """将 (x, y, w, h) 区域限制在 width x height 的屏幕范围内，且至少保留一个区块大小"""
+    x, y, w, h = (int(v) for v in region)
+    w = max(min(TILE_SIZE, width), min(w, width))
+    h = max(min(TILE_SIZE, height), min(h, height))
+    x = max(0, min(x, width - w))
+    y = max(0, min(y, height - h))
+    return x, y, w, h
+
+class MSSCaptureSource(CaptureSource):
+    """真实屏幕截图：mss实例在截图线程内创建并复用，避免每帧重复初始化"""
+    name = "mss"
+
+    def __init__(self, monitor_index=1):
+        self.monitor_index = monitor_index
+        self.monitor = None
+        self._sct = None
+
+    def open(self):
+        self._sct = mss.mss()
+        monitors = self._sct.monitors
+        self.monitor = monitors[self.monitor_index] if self.monitor_index < len(monitors) else monitors[1]
+        self.origin = (self.monitor['left'], self.monitor['top'])
+
+    def grab(self):
+        if self._sct is None:
+            self.open()
+        try:
+            img = self._sct.grab(self.monitor)
+            # 转为连续的BGR数组：后续cv2处理在非连续视图上会退化为逐像素拷贝
+            return cv2.cvtColor(np.asarray(img), cv2.COLOR_BGRA2BGR)
+        except Exception:
+            # 截图句柄失效（如锁屏、分辨率切换）时重建
+            self.close()
+            raise
+
+    def grab_region(self, region):
+        # 只截取子区域，避免整屏截图后再裁剪
+        if self._sct is None:
+            self.open()
+        rect = clamp_region(region, self.monitor['width'], self.monitor['height'])
+        x, y, w, h = rect
+        try:
+            img = self._sct.grab({'left': self.monitor['left'] + x, 'top': self.monitor['top'] + y,
+                                  'width': w, 'height': h})
+            return cv2.cvtColor(np.asarray(img), cv2.COLOR_BGRA2BGR), rect
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._sct is not None:
+            try:
+                self._sct.close()
+            except Exception:
+                pass
+            self._sct = None
+
+class MultiMonitorCaptureSource(MSSCaptureSource):
+    """全部显示器：逐个截取各显示器，按虚拟桌面中的相对位置拼接为一帧，
+    regions 记录各显示器区域，配合 RegionChangeDetector 让每个显示器独立做变化检测"""
+    name = "mss-all"
+
+    def __init__(self):
+        super().__init__(0)
+        self.monitors = []
+        self.regions = []
+
+    def open(self):
+        super().open()
+        self.monitors = self._sct.monitors[1:]
+        left, top = self.origin
+        self.regions = [(mon['left'] - left, mon['top'] - top, mon['width'], mon['height']) for mon in self.monitors]
+
+    def grab(self):
+        if self._sct is None:
+            self.open()
+        try:
+            # 显示器尺寸不同时拼接画面存在空白区域，保持黑色
+            frame = np.zeros((self.monitor['height'], self.monitor['width'], 3), dtype=np.uint8)
+            for mon, (x, y, w, h) in zip(self.monitors, self.regions):
+                frame[y:y + h, x:x + w] = cv2.cvtColor(np.asarray(self._sct.grab(mon)), cv2.COLOR_BGRA2BGR)
+            return frame
+        except Exception:
+            self.close()
+            raise
+
+class SyntheticCaptureSource(CaptureSource):
+    """合成截图源：按帧序号生成可复现的脚本化画面，用于无界面环境测试整条采集编码链路
+    
+    场景：office（静态文档+光标闪烁+时钟）、scroll（文档滚动）、windows（窗口移动）、
+    video（视频噪声区域）、mixed（以上全部）
+    """
+    name = "synthetic"
+    SCENES = ('office', 'scroll', 'windows', 'video', 'mixed')
+    LINE_HEIGHT = 24
+
+    def __init__(self, scene='mixed', size=SYNTHETIC_SCREEN_SIZE, seed=0):
+        if scene not in self.SCENES:
+            raise ValueError(f"未知合成场景：{scene}（可选：{', '.join(self.SCENES)}）")
+        self.scene = scene
+        self.width, self.height = size
+        self.seed = seed
+        self.frame_index = 0
+        self._background = None
+        self._document = None
+        self._rng = None
+
+    def open(self):
+        width, height = self.width, self.height
+        # 桌面背景：竖向渐变 + 任务栏
+        gradient = np.linspace(90, 160, height, dtype=np.uint8)
+        self._background = np.empty((height, width, 3), dtype=np.uint8)
+        self._background[:, :, 0] = gradient[:, None]
+        self._background[:, :, 1] = (gradient // 2)[:, None]
+        self._background[:, :, 2] = 40
+        self._background[height - 40:, :] = (48, 48, 48)
+        
+        # 文档内容：预先渲染三屏高的文字，滚动时按偏移截取
+        doc_w, doc_h = width // 2, height * 3
+        self._document = np.full((doc_h, doc_w, 3), 255, dtype=np.uint8)
+        for line in range(doc_h // self.LINE_HEIGHT):
+            text = f"{line + 1:04d}  The quick brown fox jumps over the lazy dog. 局域网远程协助测试文本"
+            cv2.putText(self._document, text, (12, (line + 1) * self.LINE_HEIGHT - 6),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (30, 30, 30), 1, cv2.LINE_AA)
+        self._rng = np.random.default_rng(self.seed)
+        self.frame_index = 0
+
+    def _draw_window(self, frame, x, y, w, h, title):
+        height, width = frame.shape[:2]
+        x, y = max(0, min(x, width - w)), max(0, min(y, height - 40 - h))
+        frame[y:y + h, x:x + w] = (235, 235, 235)
+        frame[y:y + 28, x:x + w] = (120, 80, 30)
+        cv2.putText(frame, title, (x + 8, y + 19), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        cv2.rectangle(frame, (x, y), (x + w - 1, y + h - 1), (90, 90, 90), 1)
+
+    def grab(self):
+        if self._background is None:
+            self.open()
+        index = self.frame_index
+        self.frame_index += 1
+        scene = self.scene
+        frame = self._background.copy()
+        width, height = self.width, self.height
+        
+        # 文档窗口（office/scroll/mixed）
+        if scene in ('office', 'scroll', 'mixed'):
+            doc_h, doc_w = height - 200, self._document.shape[1]
+            offset = (index * 4) % (self._document.shape[0] - doc_h) if scene != 'office' else 0
+            frame[80:80 + doc_h, 60:60 + doc_w] = self._document[offset:offset + doc_h]
+            # 光标每12帧闪烁一次
+            if (index // 12) % 2 == 0:
+                frame[100:118, 400:402] = 0
+        
+        # 移动窗口（windows/mixed）
+        if scene in ('windows', 'mixed'):
+            x = int((width - 420) * (0.5 + 0.5 * np.sin(index / 30.0)))
+            y = int((height - 340) * (0.5 + 0.5 * np.cos(index / 45.0)))
+            self._draw_window(frame, x, y, 400, 260, "Dialog")
+        
+        # 视频区域（video/mixed）
+        if scene in ('video', 'mixed'):
+            vw, vh = width // 3, height // 3
+            vx, vy = width - vw - 60, 80
+            noise = self._rng.integers(0, 255, (vh // 4, vw // 4, 3), dtype=np.uint8)
+            frame[vy:vy + vh, vx:vx + vw] = cv2.resize(noise, (vw, vh), interpolation=cv2.INTER_LINEAR)
+        
+        # 任务栏时钟每秒（按25帧计）跳变一次
+        clock = f"{(index // 25) // 60:02d}:{(index // 25) % 60:02d}"
+        cv2.putText(frame, clock, (width - 80, height - 14), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        return frame
+
+class ReplayCaptureSource(CaptureSource):
+    """回放截图源：按文件名顺序循环读取目录中的图片"""
+    name = "replay"
+    EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, directory, loop=True):
+        self.directory = directory
+        self.loop = loop
+        self.files = []
+        self.frame_index = 0
+
+    def open(self):
+        self.files = sorted(path for path in glob.glob(os.path.join(self.directory, '*'))
+                            if path.lower().endswith(self.EXTENSIONS))
+        if not self.files:
+            raise ValueError(f"回放目录中没有图片：{self.directory}")
+        self.frame_index = 0
+
+    def grab(self):
+        if not self.files:
+            self.open()
+        if self.frame_index >= len(self.files):
+            if not self.loop:
+                return None
+            self.frame_index = 0
+        path = self.files[self.frame_index]
+        self.frame_index += 1
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError(f"无法读取回放图片：{path}")
+        return frame
+
+def create_capture_source(spec=None):
+    """按描述创建截图源，例如 mss、mss:2、mss:all、synthetic:scroll、replay:D:\\frames"""
+    spec = spec or CAPTURE_SOURCE
+    name, _, arg = spec.partition(':')
+    if name == 'mss':
+        if arg == 'all':
+            return MultiMonitorCaptureSource()
+        return MSSCaptureSource(int(arg) if arg else 1)
+    if name == 'synthetic':
+        return SyntheticCaptureSource(arg or 'mixed')
+    if name == 'replay':
+        return ReplayCaptureSource(arg)
+    raise ValueError(f"未知截图源：{spec}")
+
+# ---------------------- 变化检测（返回区块级变化图） ----------------------
+class ChangeMap:
+    """区块级变化图：magnitude 为每个区块内检测到变化的采样比例（0~1）"""
+    def __init__(self, magnitude, width, height, tile_size=TILE_SIZE):
+        self.magnitude = magnitude
+        self.changed = magnitude > 0
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+
+    @property
+    def changed_fraction(self):
+        """整屏变化比例"""
+        return float(self.magnitude.mean())
+
+    def any(self):
+        return bool(self.changed.any())
+
+    def dirty_tiles(self):
+        """变化区块列表 (x, y, w, h)"""
+        ts = self.tile_size
+        return [(int(c) * ts, int(r) * ts, min(ts, self.width - int(c) * ts), min(ts, self.height - int(r) * ts))
+                for r, c in zip(*np.nonzero(self.changed))]
+
+def tile_fraction(changed, cell_h, cell_w):
+    """按区块归约布尔变化图，返回每个区块的变化比例（边缘区块按实际面积计算）"""
+    row_starts = np.arange(0, changed.shape[0], cell_h)
+    col_starts = np.arange(0, changed.shape[1], cell_w)
+    counts = np.add.reduceat(changed.view(np.uint8), row_starts, axis=0, dtype=np.uint32)
+    counts = np.add.reduceat(counts, col_starts, axis=1)
+    heights = np.diff(np.append(row_starts, changed.shape[0]))
+    widths = np.diff(np.append(col_starts, changed.shape[1]))
+    return counts / np.outer(heights, widths)
+
+class ChangeDetector(ABC):
+    """变化检测基类：detect() 对比参考画面返回 ChangeMap（无可比参考时返回None），
+    commit() 在区块真正发送后更新参考，保证参考始终等于控制端已有的画面"""
+    name = "base"
+
+    def __init__(self, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.reset()
+
+    def reset(self):
+        self._reference = None
+
+    def has_reference(self, frame):
+        return self._reference is not None and self._reference.shape[:2] == frame.shape[:2]
+
+    def reference_luma(self):
+        """参考画面的亮度图（供滚动识别），不支持时返回None"""
+        return None
+
+    @abstractmethod
+    def detect(self, frame, copies=()):
+        """copies 非空时与执行复制操作后的参考画面对比（不修改参考）"""
+
+    @abstractmethod
+    def commit(self, frame, tiles=None, copies=()):
+        pass
+
+def apply_copy_rects(image, copies):
+    """按顺序执行复制操作 (源x, 源y, 目标x, 目标y, 宽, 高)，与控制端合成顺序一致"""
+    for src_x, src_y, dst_x, dst_y, w, h in copies:
+        image[dst_y:dst_y + h, dst_x:dst_x + w] = image[src_y:src_y + h, src_x:src_x + w].copy()
+    return image
+
+class FullDiffDetector(ChangeDetector):
+    """全分辨率检测（原实现）：absdiff + 灰度 + 阈值，逐像素精确但开销最大"""
+    name = "full"
+
+    def reference_luma(self):
+        return None if self._reference is None else cv2.cvtColor(self._reference, cv2.COLOR_BGR2GRAY)
+
+    def detect(self, frame, copies=()):
+        if not self.has_reference(frame):
+            return None
+        reference = apply_copy_rects(self._reference.copy(), copies) if copies else self._reference
+        changed = cv2.cvtColor(cv2.absdiff(frame, reference), cv2.COLOR_BGR2GRAY) > TILE_DIFF_THRESHOLD
+        height, width = frame.shape[:2]
+        return ChangeMap(tile_fraction(changed, self.tile_size, self.tile_size), width, height, self.tile_size)
+
+    def commit(self, frame, tiles=None, copies=()):
+        if tiles is None or not self.has_reference(frame):
+            self._reference = frame.copy()
+            return
+        apply_copy_rects(self._reference, copies)
+        for x, y, w, h in tiles:
+            self._reference[y:y + h, x:x + w] = frame[y:y + h, x:x + w]
+
+class SignatureDetector(ChangeDetector):
+    """隔行亮度签名检测：每帧只取 1/SIGNATURE_ROW_STRIDE 的行转灰度后与参考亮度对比，
+    起始行逐帧轮换，持续存在的变化最多延迟 SIGNATURE_ROW_STRIDE-1 帧被发现；
+    整行采样不做横向抽稀，细竖线（如输入光标）不会漏检"""
+    name = "signature"
+
+    def __init__(self, tile_size=TILE_SIZE, stride=SIGNATURE_ROW_STRIDE):
+        if tile_size % stride:
+            raise ValueError(f"签名行间隔{stride}必须整除区块边长{tile_size}")
+        self.stride = stride
+        self._phase = 0
+        super().__init__(tile_size)
+
+    def reference_luma(self):
+        return self._reference
+
+    def detect(self, frame, copies=()):
+        if not self.has_reference(frame):
+            return None
+        phase = self._phase
+        self._phase = (phase + 1) % self.stride
+        reference = apply_copy_rects(self._reference.copy(), copies) if copies else self._reference
+        luma = cv2.cvtColor(frame[phase::self.stride], cv2.COLOR_BGR2GRAY)
+        changed = cv2.absdiff(luma, reference[phase::self.stride]) > TILE_DIFF_THRESHOLD
+        height, width = frame.shape[:2]
+        magnitude = tile_fraction(changed, self.tile_size // self.stride, self.tile_size)
+        return ChangeMap(magnitude, width, height, self.tile_size)
+
+    def commit(self, frame, tiles=None, copies=()):
+        if tiles is None or not self.has_reference(frame):
+            self._reference = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            return
+        apply_copy_rects(self._reference, copies)
+        if len(tiles) * self.tile_size * self.tile_size * 8 > frame.shape[0] * frame.shape[1]:
+            # 变化区块较多时整帧转灰度一次再拷贝，比逐块调用cvtColor更快
+            luma = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            for x, y, w, h in tiles:
+                self._reference[y:y + h, x:x + w] = luma[y:y + h, x:x + w]
+            return
+        for x, y, w, h in tiles:
+            self._reference[y:y + h, x:x + w] = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
+
+CHANGE_DETECTORS = {cls.name: cls for cls in (SignatureDetector, FullDiffDetector)}
+
+class RegionChangeMap:
+    """多区域变化图：合并各区域的 ChangeMap，区块坐标换算为整帧坐标"""
+    def __init__(self, parts):
+        self.parts = parts  # [(x, y, ChangeMap)]
+
+    @property
+    def changed_fraction(self):
+        total = sum(cm.width * cm.height for _, _, cm in self.parts)
+        changed = sum(cm.changed_fraction * cm.width * cm.height for _, _, cm in self.parts)
+        return changed / total if total else 0.0
+
+    def any(self):
+        return any(cm.any() for _, _, cm in self.parts)
+
+    def dirty_tiles(self):
+        return [(x + tx, y + ty, tw, th) for x, y, cm in self.parts for tx, ty, tw, th in cm.dirty_tiles()]
+
+class RegionChangeDetector(ChangeDetector):
+    """多显示器分区检测：每个显示器区域持有独立的检测器与参考画面，
+    区块网格按各显示器左上角对齐，空闲显示器不产生区块"""
+    name = "regions"
+
+    def __init__(self, name=None, tile_size=TILE_SIZE):
+        self.detector_name = name
+        self.regions = []
+        self.detectors = []
+        super().__init__(tile_size)
+
+    def set_regions(self, regions):
+        """设置各区域在当前帧中的位置，布局变化时重建子检测器"""
+        regions = list(regions)
+        if regions != self.regions:
+            self.regions = regions
+            self.detectors = [create_change_detector(self.detector_name) for _ in regions]
+
+    def reset(self):
+        for detector in getattr(self, 'detectors', []):
+            detector.reset()
+
+    def _parts(self, frame):
+        for (x, y, w, h), detector in zip(self.regions, self.detectors):
+            yield x, y, np.ascontiguousarray(frame[y:y + h, x:x + w]), detector
+
+    def has_reference(self, frame):
+        return bool(self.detectors) and all(detector.has_reference(part) for _, _, part, detector in self._parts(frame))
+
+    def detect(self, frame, copies=()):
+        # 分区检测不做滚动识别（reference_luma 返回None），copies 始终为空
+        parts = []
+        for x, y, part, detector in self._parts(frame):
+            change_map = detector.detect(part)
+            if change_map is None:
+                return None
+            parts.append((x, y, change_map))
+        return RegionChangeMap(parts) if parts else None
+
+    def commit(self, frame, tiles=None, copies=()):
+        for x, y, part, detector in self._parts(frame):
+            if tiles is None:
+                detector.commit(part)
+                continue
+            w, h = part.shape[1], part.shape[0]
+            local = [(tx - x, ty - y, tw, th) for tx, ty, tw, th in tiles if x <= tx < x + w and y <= ty < y + h]
+            if local:
+                detector.commit(part, local)
+
+def create_change_detector(name=None):
+    """按名称创建变化检测器"""
+    name = name or CHANGE_DETECTOR
+    if name not in CHANGE_DETECTORS:
+        raise ValueError(f"未知变化检测器：{name}（可选：{', '.join(CHANGE_DETECTORS)}）")
+    return CHANGE_DETECTORS[name]()
+
+def create_detector_for_source(source):
+    """按截图源创建检测器：多显示器拼接画面使用分区检测"""
+    return RegionChangeDetector() if source.regions is not None else create_change_detector()
+
+# ---------------------- 滚动/平移识别 ----------------------
+def find_shift_runs(reference, current):
+    """按行哈希匹配两幅亮度图，返回同一位移下连续匹配的行段 [(起始行, 结束行, 位移)]，
+    current 的第 i 行等于 reference 的第 i+位移 行"""
+    ref_hashes = [zlib.crc32(row) for row in reference]
+    cur_hashes = [zlib.crc32(row) for row in current]
+    positions = {}
+    for index, row_hash in enumerate(ref_hashes):
+        positions.setdefault(row_hash, []).append(index)
+    
+    # 只用发生变化且在参考中足够独特的行投票，空白行等重复行会产生大量假位移
+    votes = Counter()
+    for index, row_hash in enumerate(cur_hashes):
+        if row_hash == ref_hashes[index]:
+            continue
+        matches = positions.get(row_hash)
+        if matches and len(matches) <= SCROLL_MAX_REPEAT:
+            for match in matches:
+                votes[match - index] += 1
+    if not votes:
+        return []
+    shift, count = votes.most_common(1)[0]
+    if shift == 0 or count * 4 < SCROLL_MIN_ROWS:
+        return []
+    
+    runs = []
+    start = None
+    rows = len(cur_hashes)
+    for index in range(rows + 1):
+        matched = index < rows and 0 <= index + shift < rows and cur_hashes[index] == ref_hashes[index + shift]
+        if matched and start is None:
+            start = index
+        elif not matched and start is not None:
+            if index - start >= SCROLL_MIN_ROWS:
+                runs.append((start, index, shift))
+            start = None
+    return runs
+
+def detect_scroll(reference_luma, frame, tiles):
+    """在变化区块的外接矩形内识别垂直滚动（其次水平平移），返回复制操作列表
+    [(源x, 源y, 目标x, 目标y, 宽, 高)]，未识别到返回空列表"""
+    if reference_luma is None or reference_luma.shape[:2] != frame.shape[:2]:
+        return []
+    x0 = min(x for x, _, _, _ in tiles)
+    y0 = min(y for _, y, _, _ in tiles)
+    x1 = max(x + w for x, _, w, _ in tiles)
+    y1 = max(y + h for _, y, _, h in tiles)
+    luma = cv2.cvtColor(frame[y0:y1], cv2.COLOR_BGR2GRAY)[:, x0:x1]
+    reference = reference_luma[y0:y1, x0:x1]
+    
+    runs = find_shift_runs(reference, luma)
+    if runs:
+        return [(x0, y0 + start + shift, x0, y0 + start, x1 - x0, end - start) for start, end, shift in runs]
+    # 水平平移：转置后按列匹配
+    runs = find_shift_runs(np.ascontiguousarray(reference.T), np.ascontiguousarray(luma.T))
+    return [(x0 + start + shift, y0, x0 + start, y0, end - start, y1 - y0) for start, end, shift in runs]
+
+def map_regions(regions, source_rect, scale):
+    """将原始坐标下的各显示器区域换算到当前帧（区域放大裁剪 + 缩放）坐标，丢弃不可见的区域"""
+    src_x, src_y, src_w, src_h = source_rect
+    mapped = []
+    for x, y, w, h in regions:
+        left, top = max(x, src_x), max(y, src_y)
+        right, bottom = min(x + w, src_x + src_w), min(y + h, src_y + src_h)
+        if right <= left or bottom <= top:
+            continue
+        x0, y0 = int((left - src_x) * scale), int((top - src_y) * scale)
+        x1, y1 = int((right - src_x) * scale), int((bottom - src_y) * scale)
+        if x1 > x0 and y1 > y0:
+            mapped.append((x0, y0, x1 - x0, y1 - y0))
+    return mapped
+
+# ---------------------- 码率自适应控制 ----------------------
+class RateController:
+    """单连接闭环码率控制器
+    
+    发送线程上报每帧的排队时间、发送耗时和字节数，截图线程每个周期调用 update()：
+    超出目标延迟/带宽预算或队列持续积压时依次降低 JPEG质量 → 帧率 → 截图分辨率，
+    余量充足时按相反顺序逐级恢复。带宽预算由控制端下发（0 表示不限，仅按延迟调整）。
+    """
+    def __init__(self):
+        self.quality = JPEG_QUALITY
+        self.fps = FPS_LIMIT
+        self.scale = 1.0
+        self.bandwidth_kbps = 0
+        self.target_latency_ms = RATE_TARGET_LATENCY_MS
+        self._lock = threading.Lock()
+        self._last_update = time.time()
+        self._last_scale_change = 0.0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_bytes = 0
+        self._window_frames = 0
+        self._window_latency = 0.0
+        self._window_queue_full = 0
+
+    def set_budget(self, bandwidth_kbps=None, target_latency_ms=None):
+        """设置带宽预算（kbps，0为不限）与目标延迟（毫秒）"""
+        with self._lock:
+            if bandwidth_kbps is not None:
+                self.bandwidth_kbps = max(0, int(bandwidth_kbps))
+            if target_latency_ms is not None:
+                self.target_latency_ms = max(20, int(target_latency_ms))
+
+    def on_frame_sent(self, size, queue_wait, send_time):
+        """发送线程：上报一帧的字节数、排队时间和发送耗时（秒）"""
+        with self._lock:
+            self._window_bytes += size
+            self._window_frames += 1
+            self._window_latency += queue_wait + send_time
+
+    def on_queue_full(self):
+        """截图线程：发送队列已满、本轮截图被跳过"""
+        with self._lock:
+            self._window_queue_full += 1
+
+    def update(self, now):
+        """周期性评估并调整参数，参数有变化时返回True"""
+        span = now - self._last_update
+        if span < RATE_UPDATE_INTERVAL:
+            return False
+        with self._lock:
+            frames = self._window_frames
+            rate_kbps = self._window_bytes * 8 / 1000 / span
+            latency_ms = self._window_latency / frames * 1000 if frames else 0.0
+            queue_full = self._window_queue_full
+            budget = self.bandwidth_kbps
+            target = self.target_latency_ms
+            self._reset_window()
+        self._last_update = now
+        
+        # 画面静止没有发送时不做判断
+        if not frames and not queue_full:
+            return False
+        
+        congested = (latency_ms > target or queue_full > frames
+                     or (budget and rate_kbps > budget * 1.05))
+        headroom = (latency_ms < target * 0.5 and not queue_full
+                    and (not budget or rate_kbps < budget * 0.7))
+        if congested:
+            return self._step_down(now)
+        if headroom:
+            return self._step_up(now)
+        return False
+
+    def _step_down(self, now):
+        if self.quality > RATE_MIN_QUALITY:
+            self.quality = max(RATE_MIN_QUALITY, self.quality - 10)
+        elif self.fps > RATE_MIN_FPS:
+            self.fps = max(RATE_MIN_FPS, int(self.fps * 0.7))
+        elif RATE_ALLOW_SCALE and self.scale > RATE_MIN_SCALE and now - self._last_scale_change >= RATE_SCALE_HOLD:
+            self.scale = max(RATE_MIN_SCALE, round(self.scale - 0.25, 2))
+            self._last_scale_change = now
+        else:
+            return False
+        return True
+
+    def _step_up(self, now):
+        if self.scale < 1.0 and now - self._last_scale_change >= RATE_SCALE_HOLD:
+            self.scale = min(1.0, round(self.scale + 0.25, 2))
+            self._last_scale_change = now
+        elif self.fps < FPS_LIMIT:
+            self.fps = min(FPS_LIMIT, self.fps + 3)
+        elif self.quality < RATE_MAX_QUALITY:
+            self.quality = min(RATE_MAX_QUALITY, self.quality + 5)
+        else:
+            return False
+        return True
 
 # ---------------------- 截图功能（优化版） ----------------------
+def grab_screen(connection: SlaveConnection):
+    """从连接持有的截图源取一帧BGR图像，按控制端视口与码率控制的比例缩小后再编码"""
+    connection.apply_pending_monitor()
+    roi = connection.roi
+    if roi:
+        frame, rect = connection.capture_source.grab_region(roi)
+        if frame is None:
+            return None
+        connection.source_rect = rect
+    else:
+        frame = connection.capture_source.grab()
+        if frame is None:
+            return None
+        connection.source_rect = (0, 0, frame.shape[1], frame.shape[0])
+    height, width = frame.shape[:2]
+    scale = connection.stream_scale(width, height)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    if isinstance(connection.change_detector, RegionChangeDetector):
+        connection.change_detector.set_regions(map_regions(connection.capture_source.regions, connection.source_rect,
+                                                           frame.shape[1] / connection.source_rect[2]))
+    return frame
+
 def capture_incremental_frame(connection: SlaveConnection):
     """优化的增量截图"""
     try:
-        with mss.mss() as sct:
-            monitor = sct.monitors[1]
-            # 使用更快的截图方式
-            img = sct.grab(monitor)
-            frame = np.array(img, dtype=np.uint8)[:, :, :3]
-            
-            if connection.last_frame is None:
-                connection.last_frame = frame
-                return frame
-            
-            # 优化差异检测：使用更宽松的阈值
-            diff = cv2.absdiff(frame, connection.last_frame)
-            gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            
-            # 动态阈值：根据画面变化程度调整
-            non_zero = np.count_nonzero(gray_diff > 15)
-            total_pixels = gray_diff.shape[0] * gray_diff.shape[1]
-            
-            # 如果变化小于0.1%则跳过
-            if non_zero < total_pixels * 0.001:
-                return None
-            
-            connection.last_frame = frame
-            return frame
+        frame = grab_screen(connection)
+        if frame is None:
+            return None
+        
+        change_map = connection.change_detector.detect(frame)
+        # 如果变化小于0.1%则跳过
+        if change_map is not None and change_map.changed_fraction < 0.001:
+            return None
+        
+        connection.change_detector.commit(frame)
+        return frame
+    except Exception as e:
+        print(f"截图失败：{e}")
+        connection.change_detector.reset()
+        return None
+
+def list_all_tiles(width, height, tile_size=TILE_SIZE):
+    """按网格切分整屏，返回全部区块 (x, y, w, h)"""
+    return [(x, y, min(tile_size, width - x), min(tile_size, height - y))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)]
+
+def capture_dirty_tiles(connection: SlaveConnection):
+    """分块增量截图，返回 (帧, 变化区块, 是否关键帧, 复制操作)，无变化时返回None
+    
+    参考画面只在区块真正入队发送后才更新（见 commit_tiles），
+    发送拥塞时跳过的变化会在下一次对比中自动累积，不会丢失。
+    """
+    try:
+        frame = grab_screen(connection)
+        connection.last_grab = frame
+        if frame is None:
+            return None
+        
+        change_map = None if connection.force_keyframe else connection.change_detector.detect(frame)
+        if change_map is None:
+            height, width = frame.shape[:2]
+            return frame, list_all_tiles(width, height), True, []
+        
+        tiles = change_map.dirty_tiles()
+        if not tiles:
+            return None
+        copies = []
+        if SCROLL_DETECTION and len(tiles) >= SCROLL_MIN_TILES:
+            # 滚动时大片区域只是位移：先复制已有内容，只编码新露出的部分
+            copies = detect_scroll(connection.change_detector.reference_luma(), frame, tiles)
+            if copies:
+                tiles = connection.change_detector.detect(frame, copies).dirty_tiles()
+        return frame, tiles, False, copies
     except Exception as e:
         print(f"截图失败：{e}")
-        connection.last_frame = None
+        connection.change_detector.reset()
         return None
 
+def classify_tile(tile):
+    """区块内容分类，返回编码类型：纯色 / 文字界面（大量相邻像素完全相同）/ 照片
+    
+    按字节统计与左侧相邻像素的差异（absdiff + countNonZero），比逐像素比较快一个数量级
+    """
+    diff = cv2.absdiff(tile[:, 1:], tile[:, :-1])
+    changed = cv2.countNonZero(diff.reshape(diff.shape[0], -1))
+    if changed == 0 and (tile[:, 0] == tile[0, 0]).all():
+        return TILE_CODEC_FLAT
+    if changed <= diff.size * (1 - TEXT_EQUAL_RATIO):
+        return TILE_CODEC_PNG
+    return TILE_CODEC_WEBP if PHOTO_CODEC == "webp" else TILE_CODEC_JPEG
+
+def encode_tile_records(frame, tiles, quality=JPEG_QUALITY, codec_selection=None, lossless=False):
+    """将区块 (x, y, w, h, 哈希) 逐个按内容选择编码，返回拼接好的区块记录（不含帧头），lossless 时非纯色区块一律PNG"""
+    codec_selection = CODEC_SELECTION if codec_selection is None else codec_selection
+    encoders = {
+        TILE_CODEC_JPEG: ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, quality]),
+        TILE_CODEC_WEBP: ('.webp', [cv2.IMWRITE_WEBP_QUALITY, quality]),
+        TILE_CODEC_PNG: ('.png', [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]),
+    }
+    parts = []
+    for x, y, w, h, key in tiles:
+        tile = frame[y:y + h, x:x + w]
+        codec = classify_tile(tile) if codec_selection else TILE_CODEC_JPEG
+        if lossless and codec != TILE_CODEC_FLAT:
+            codec = TILE_CODEC_PNG
+        if codec == TILE_CODEC_FLAT:
+            payload = tile[0, 0].copy()
+        else:
+            ext, params = encoders[codec]
+            payload = cv2.imencode(ext, tile, params)[1]
+        parts.append(TILE_RECORD.pack(x, y, w, h, codec, key, payload.nbytes))
+        parts.append(payload)
+    return b''.join(parts)
+
+def pack_cached_records(cached):
+    """缓存命中的区块只发送哈希引用"""
+    return b''.join(TILE_RECORD.pack(x, y, w, h, TILE_CODEC_CACHED, key, 0) for x, y, w, h, key in cached)
+
+def plan_tile_cache(connection: SlaveConnection, frame, tiles, keyframe):
+    """按内容哈希查询区块缓存，返回 (命中的引用, 需编码的区块, 是否重置缓存)，区块均为 (x, y, w, h, 哈希)
+    
+    先按顺序刷新命中条目，再按顺序写入未命中条目，控制端以相同顺序处理记录，两端淘汰结果一致。
+    调用后缓存即已更新，本帧必须发送出去。
+    """
+    cache = connection.tile_cache
+    if cache is None:
+        return [], [(x, y, w, h, 0) for x, y, w, h in tiles], False
+    cache_reset = keyframe and connection.cache_reset_pending
+    if cache_reset:
+        cache.clear()
+        connection.cache_reset_pending = False
+    cached, pending = [], []
+    for x, y, w, h in tiles:
+        key = tile_key(frame[y:y + h, x:x + w])
+        (cached if cache.touch(key) else pending).append((x, y, w, h, key))
+    for x, y, w, h, key in pending:
+        cache.put(key, tile_bytes(w, h))
+    return cached, pending, cache_reset
+
+def pack_tile_header(frame, tile_count, keyframe, source_rect=None, copies=(), cache_reset=False):
+    """分块帧头（含复制操作），source_rect 为帧对应的原始屏幕区域 (x, y, w, h)，缺省为帧本身尺寸"""
+    height, width = frame.shape[:2]
+    src_x, src_y, src_w, src_h = source_rect or (0, 0, width, height)
+    flags = (TILE_FLAG_KEYFRAME if keyframe else 0) | (TILE_FLAG_CACHE_RESET if cache_reset else 0)
+    header = TILE_HEADER.pack(TILE_FRAME_MAGIC, flags, width, height, tile_count,
+                              src_x, src_y, src_w, src_h, len(copies))
+    return header + b''.join(COPY_RECORD.pack(*copy) for copy in copies)
+
+def encode_tile_frame(frame, tiles, keyframe, quality=JPEG_QUALITY, source_rect=None, copies=(), cached=(), cache_reset=False,
+                      lossless=False):
+    """将复制操作、缓存引用与待编码区块编码为一条分块帧消息"""
+    header = pack_tile_header(frame, len(cached) + len(tiles), keyframe, source_rect, copies, cache_reset)
+    return header + pack_cached_records(cached) + encode_tile_records(frame, tiles, quality, lossless=lossless)
+
+def build_tile_frame(connection: SlaveConnection, frame, tiles, keyframe, quality, copies=()):
+    """查询区块缓存后编码整条分块帧（截图线程内同步编码时使用）"""
+    cached, pending, cache_reset = plan_tile_cache(connection, frame, tiles, keyframe)
+    return encode_tile_frame(frame, pending, keyframe, quality, connection.source_rect, copies, cached, cache_reset)
+
+def commit_tiles(connection: SlaveConnection, frame, tiles, keyframe, copies=(), quality=JPEG_QUALITY):
+    """区块已入队发送，同步更新变化检测参考（先执行复制操作，再写入区块）"""
+    connection.change_detector.commit(frame, None if keyframe else tiles, copies)
+    if keyframe:
+        connection.force_keyframe = False
+    if connection.refine_tracker is not None:
+        connection.refine_tracker.on_sent(frame, tiles, keyframe, copies, quality)
+
+# ---------------------- 渐进增强（静止区块高质量重发） ----------------------
+class RefineTracker:
+    """记录以低于 REFINE_QUALITY 的有损质量发送过的区块，静止满 REFINE_AFTER_FRAMES 帧后交给重发
+    
+    区块坐标为传输尺寸下的网格坐标；关键帧（尺寸/区域变化）时全部重新登记，
+    复制操作的目标区域内容来自旧画面，同样视为需要重发。
+    """
+    def __init__(self, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.pending = {}  # (x, y, w, h) -> 最近一次有损发送时的帧序号
+        self.frame_no = 0
+        self.refined = 0
+
+    def tick(self):
+        """截图线程每截取一帧调用一次"""
+        self.frame_no += 1
+
+    def on_sent(self, frame, tiles, keyframe, copies=(), quality=JPEG_QUALITY):
+        if keyframe:
+            self.pending.clear()
+        if quality < REFINE_QUALITY or REFINE_LOSSLESS:
+            for x, y, w, h in tiles:
+                self.pending[(x, y, w, h)] = self.frame_no
+        height, width = frame.shape[:2]
+        size = self.tile_size
+        for _, _, dst_x, dst_y, w, h in copies:
+            for y in range(dst_y // size * size, dst_y + h, size):
+                for x in range(dst_x // size * size, dst_x + w, size):
+                    self.pending[(x, y, min(size, width - x), min(size, height - y))] = self.frame_no
+
+    def due_tiles(self, frame, limit=REFINE_MAX_TILES):
+        """取出已静止足够久的区块（最早发送的优先），无损编码的区块（纯色/文字）不需要重发，直接移除"""
+        ready = sorted((sent, tile) for tile, sent in self.pending.items()
+                       if self.frame_no - sent >= REFINE_AFTER_FRAMES)
+        due = []
+        for _, tile in ready:
+            del self.pending[tile]
+            x, y, w, h = tile
+            if y + h > frame.shape[0] or x + w > frame.shape[1]:
+                continue
+            if CODEC_SELECTION and not REFINE_LOSSLESS and classify_tile(frame[y:y + h, x:x + w]) in (TILE_CODEC_FLAT, TILE_CODEC_PNG):
+                continue
+            due.append(tile)
+            if len(due) >= limit:
+                break
+        return due
+
+def build_refine_frame(connection: SlaveConnection, frame, tiles):
+    """以高质量（或无损）重新编码静止区块，返回分块帧消息
+    
+    不查询缓存（缓存中的像素正是低质量版本），但按顺序写入缓存：控制端对编码区块同样执行写入，
+    两端的LRU顺序保持一致，之后的缓存引用取到的也是高质量像素。
+    """
+    keyed = []
+    for x, y, w, h in tiles:
+        key = tile_key(frame[y:y + h, x:x + w])
+        if connection.tile_cache is not None:
+            connection.tile_cache.put(key, tile_bytes(w, h))
+        keyed.append((x, y, w, h, key))
+    return encode_tile_frame(frame, keyed, False, REFINE_QUALITY, connection.source_rect, lossless=REFINE_LOSSLESS)
+
+def refine_static_tiles(connection: SlaveConnection, queue_obj):
+    """画面无变化且发送空闲时，重发一批静止区块，返回重发的区块数
+    
+    在截图线程内同步编码入队：与增量帧共用同一生产者，保证帧序与缓存操作顺序不乱
+    """
+    tracker = connection.refine_tracker
+    frame = connection.last_grab
+    if tracker is None or frame is None or not tracker.pending:
+        return 0
+    tiles = tracker.due_tiles(frame)
+    if not tiles:
+        return 0
+    queue_obj.put((time.time(), build_refine_frame(connection, frame, tiles)))
+    connection.change_detector.commit(frame, tiles)
+    tracker.refined += len(tiles)
+    return len(tiles)
+
+# ---------------------- 多进程编码管线（共享内存环形缓冲） ----------------------
+class PipelineStats:
+    """各阶段耗时统计（线程安全），summary() 输出平均耗时后清零"""
+    STAGES = (('capture', '截图检测'), ('ring', '写入缓冲'), ('encode', '编码'), ('queue', '排队'), ('send', '发送'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {name: 0.0 for name, _ in self.STAGES}
+        self._counts = {name: 0 for name, _ in self.STAGES}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._totals[stage] += seconds
+            self._counts[stage] += 1
+
+    def summary(self):
+        with self._lock:
+            parts = [f"{label}{self._totals[name] / self._counts[name] * 1000:.1f}ms"
+                     for name, label in self.STAGES if self._counts[name]]
+            for name, _ in self.STAGES:
+                self._totals[name] = 0.0
+                self._counts[name] = 0
+        return " | ".join(parts)
+
+class SharedFrameRing:
+    """共享内存帧环形缓冲：截图线程写入原始帧，编码进程按名称挂载后直接读取"""
+    def __init__(self, slot_count, slot_bytes):
+        self.slot_count = slot_count
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_count * slot_bytes)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, slot, frame):
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+        del view
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception as e:
+            print(f"释放共享内存失败：{e}")
+
+# 编码进程内挂载的共享内存（按名称缓存，环形缓冲重建后旧名称会被淘汰）
+_worker_rings = {}
+
+def encode_tiles_from_ring(shm_name, offset, shape, tiles, quality):
+    """编码进程入口：从共享内存帧槽读取原始帧并编码指定区块，返回 (区块记录, 编码耗时)"""
+    start = time.perf_counter()
+    shm = _worker_rings.get(shm_name)
+    if shm is None:
+        for stale in list(_worker_rings):
+            _worker_rings.pop(stale).close()
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_rings[shm_name] = shm
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+    data = encode_tile_records(frame, tiles, quality)
+    del frame
+    return data, time.perf_counter() - start
+
+ENCODER_SETTINGS = ("CODEC_SELECTION", "PHOTO_CODEC", "PNG_COMPRESSION", "TEXT_EQUAL_RATIO")  # 区块编码用到的配置（质量随每个分片传入）
+
+def init_encoder_worker(settings):
+    """编码进程初始化：Windows下编码进程以spawn方式重新导入本模块，只有默认配置，需套用主进程的实际配置"""
+    globals().update(settings)
+
+_encoder_pool = None
+
+def get_encoder_pool():
+    """进程池在首次使用时创建，所有连接复用；编码配置随初始化参数传给编码进程，与线程模式的编码结果一致"""
+    global _encoder_pool
+    if _encoder_pool is None:
+        settings = {name: globals()[name] for name in ENCODER_SETTINGS}
+        _encoder_pool = ProcessPoolExecutor(max_workers=ENCODER_PROCESSES, initializer=init_encoder_worker, initargs=(settings,))
+        print(f"多进程编码已启动：{ENCODER_PROCESSES}个编码进程，{FRAME_RING_SLOTS}个帧槽")
+    return _encoder_pool
+
+def shutdown_encoder_pool(wait=False):
+    """关闭编码进程池；程序退出时需 wait=True 等管理线程结束，否则解释器退出时其管道已关闭会报错"""
+    global _encoder_pool
+    if _encoder_pool is not None:
+        _encoder_pool.shutdown(wait=wait, cancel_futures=True)
+        _encoder_pool = None
+
+class ProcessEncodePipeline:
+    """多进程编码管线：帧写入共享内存帧槽后按区块分片交给编码进程，
+    编码完成的分片在回调中重组，并严格按提交顺序放入发送队列"""
+    def __init__(self, connection: SlaveConnection, out_queue):
+        self.connection = connection
+        self.out_queue = out_queue
+        self.ring = None
+        self.free_slots = []
+        self._lock = threading.Lock()
+        self._next_submit = 0
+        self._next_emit = 0
+        self._pending = {}
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_ring(self, frame):
+        """帧槽不够大时（首帧或分辨率变大）重建环形缓冲，需等在途帧全部完成"""
+        if self.ring is not None and frame.nbytes <= self.ring.slot_bytes:
+            return True
+        if self.in_flight():
+            return False
+        if self.ring is not None:
+            self.ring.close()
+        self.ring = SharedFrameRing(FRAME_RING_SLOTS, frame.nbytes)
+        self.free_slots = list(range(FRAME_RING_SLOTS))
+        return True
+
+    def submit(self, frame, tiles, keyframe, quality, copies=()):
+        """提交一帧，帧槽不足时返回False（本轮截图作废，变化留到下一轮）"""
+        if not self._ensure_ring(frame):
+            return False
+        with self._lock:
+            if not self.free_slots:
+                return False
+            slot = self.free_slots.pop()
+            seq = self._next_submit
+            self._next_submit += 1
+            # 取到帧槽后才查询区块缓存：缓存一经更新，本帧必须发出
+            cached, pending, cache_reset = plan_tile_cache(self.connection, frame, tiles, keyframe)
+            # 纯复制操作/全部命中缓存的帧没有待编码区块，仍走一次空分片以保持按序发送
+            chunks = [pending[i:i + ENCODE_CHUNK_TILES] for i in range(0, len(pending), ENCODE_CHUNK_TILES)] or [[]]
+            self._pending[seq] = {
+                'header': pack_tile_header(frame, len(tiles), keyframe, self.connection.source_rect, copies, cache_reset)
+                          + pack_cached_records(cached),
+                'parts': [None] * len(chunks),
+                'remaining': len(chunks),
+                'slot': slot,
+                'failed': False,
+            }
+        
+        ring_start = time.perf_counter()
+        self.ring.write(slot, frame)
+        self.connection.pipeline_stats.add('ring', time.perf_counter() - ring_start)
+        
+        pool = get_encoder_pool()
+        for index, chunk in enumerate(chunks):
+            future = pool.submit(encode_tiles_from_ring, self.ring.name, slot * self.ring.slot_bytes,
+                                 frame.shape, chunk, quality)
+            future.add_done_callback(functools.partial(self._on_chunk_done, seq, index))
+        return True
+
+    def _on_chunk_done(self, seq, index, future):
+        """分片编码完成回调（在进程池的管理线程中执行）"""
+        try:
+            data, encode_time = future.result()
+            self.connection.pipeline_stats.add('encode', encode_time)
+        except Exception as e:
+            print(f"[{self.connection.addr}] 编码进程异常：{e}")
+            data = None
+        
+        with self._lock:
+            entry = self._pending.get(seq)
+            if entry is None:
+                return
+            if data is None:
+                entry['failed'] = True
+            entry['parts'][index] = data
+            entry['remaining'] -= 1
+            if entry['remaining'] == 0:
+                self.free_slots.append(entry['slot'])
+            
+            # 按提交顺序放入发送队列，先完成的后续帧在这里等待
+            while self._next_emit in self._pending and self._pending[self._next_emit]['remaining'] == 0:
+                done = self._pending.pop(self._next_emit)
+                self._next_emit += 1
+                if done['failed']:
+                    # 增量帧缺失会让控制端画面错乱，改发关键帧重新同步；
+                    # 本帧区块已计入区块缓存，控制端却没收到，关键帧需同时清空两端缓存
+                    self.connection.cache_reset_pending = True
+                    self.connection.force_keyframe = True
+                    continue
+                try:
+                    self.out_queue.put_nowait((time.time(), done['header'] + b''.join(done['parts'])))
+                except queue.Full:
+                    self.connection.cache_reset_pending = True
+                    self.connection.force_keyframe = True
+
+    def close(self):
+        with self._lock:
+            self._pending.clear()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
 def capture_to_queue(queue_obj, stop_event, connection: SlaveConnection):
     """优化的截图线程"""
-    frame_interval = 1.0 / FPS_LIMIT
+    rate_controller = connection.rate_controller
+    stats = connection.pipeline_stats
+    if PIPELINE_MODE == "process" and TILE_MODE:
+        connection.encode_pipeline = ProcessEncodePipeline(connection, queue_obj)
+    pipeline = connection.encode_pipeline
     last_time = time.time()
     
     while not stop_event.is_set() and connection.is_connected:
         try:
+            # 控制端窗口最小化/隐藏：暂停截图编码，恢复后的首帧包含暂停期间的全部变化
+            if connection.capture_priority() == "paused":
+                time.sleep(PAUSED_CHECK_INTERVAL)
+                continue
             current_time = time.time()
             elapsed = current_time - last_time
+            if rate_controller.update(current_time):
+                print(f"[{connection.addr}] 码率调整：质量={rate_controller.quality} 帧率={rate_controller.fps} 分辨率={rate_controller.scale:.2f}")
+            frame_interval = 1.0 / connection.capture_fps()
             
             if elapsed < frame_interval:
                 # 使用更精确的睡眠
@@ -706,67 +2641,263 @@ def capture_to_queue(queue_obj, stop_event, connection: SlaveConnection):
             
             last_time = current_time
             
-            frame = capture_incremental_frame(connection)
-            if frame is None:
-                continue
-            
-            # 使用更快的JPEG编码
-            encode_param = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
-            _, encoded = cv2.imencode('.jpg', frame, encode_param)
-            
-            # 优化队列管理
-            if queue_obj.qsize() >= FRAME_QUEUE_SIZE:
-                try:
-                    queue_obj.get_nowait()
-                except queue.Empty:
-                    pass
-            
-            queue_obj.put(encoded.tobytes())
+            if TILE_MODE:
+                # 发送队列已满时不截图，变化留到下一轮统一发送（增量帧不能丢弃）
+                backlog = queue_obj.qsize() + (pipeline.in_flight() if pipeline else 0)
+                if backlog >= queue_obj.maxsize:
+                    rate_controller.on_queue_full()
+                    continue
+                capture_start = time.perf_counter()
+                result = capture_dirty_tiles(connection)
+                stats.add('capture', time.perf_counter() - capture_start)
+                if connection.refine_tracker is not None:
+                    connection.refine_tracker.tick()
+                if result is None:
+                    # 画面静止且发送线程空闲：用富余带宽把之前的低质量区块重发为高质量
+                    if connection.send_idle.is_set() and queue_obj.empty() and not (pipeline and pipeline.in_flight()):
+                        encode_start = time.perf_counter()
+                        if refine_static_tiles(connection, queue_obj):
+                            stats.add('encode', time.perf_counter() - encode_start)
+                    continue
+                frame, tiles, keyframe, copies = result
+                if pipeline:
+                    # 多进程模式：写入共享内存帧槽后异步编码，由管线按序入队
+                    if not pipeline.submit(frame, tiles, keyframe, rate_controller.quality, copies):
+                        rate_controller.on_queue_full()
+                        continue
+                else:
+                    encode_start = time.perf_counter()
+                    data = build_tile_frame(connection, frame, tiles, keyframe, rate_controller.quality, copies)
+                    stats.add('encode', time.perf_counter() - encode_start)
+                    queue_obj.put((time.time(), data))
+                commit_tiles(connection, frame, tiles, keyframe, copies, rate_controller.quality)
+                connection.tile_count += len(tiles)
+            else:
+                capture_start = time.perf_counter()
+                frame = capture_incremental_frame(connection)
+                stats.add('capture', time.perf_counter() - capture_start)
+                if frame is None:
+                    continue
+                
+                # 使用更快的JPEG编码
+                encode_start = time.perf_counter()
+                encode_param = [cv2.IMWRITE_JPEG_QUALITY, rate_controller.quality]
+                _, encoded = cv2.imencode('.jpg', frame, encode_param)
+                stats.add('encode', time.perf_counter() - encode_start)
+                
+                # 优化队列管理
+                if queue_obj.qsize() >= FRAME_QUEUE_SIZE:
+                    rate_controller.on_queue_full()
+                    try:
+                        queue_obj.get_nowait()
+                    except queue.Empty:
+                        pass
+                
+                # 直接入队编码缓冲，发送时与长度前缀一起聚合发出，不再复制为bytes
+                queue_obj.put((time.time(), encoded))
             
-            # 性能统计
+            # 性能统计（字节数由发送线程累计）
             connection.frame_count += 1
             if current_time - connection.last_stat_time >= 5.0:
-                fps = connection.frame_count / (current_time - connection.last_stat_time)
-                print(f"[{connection.addr}] FPS: {fps:.1f}")
+                span = current_time - connection.last_stat_time
+                fps = connection.frame_count / span
+                print(f"[{connection.addr}] FPS: {fps:.1f} | 区块/帧: {connection.tile_count / max(connection.frame_count, 1):.1f} | 带宽: {connection.sent_bytes / span / 1024:.0f}KB/s | 质量: {rate_controller.quality}")
+                print(f"[{connection.addr}] 阶段耗时：{stats.summary()}")
+                if connection.tile_cache is not None:
+                    print(f"[{connection.addr}] 区块缓存：{connection.tile_cache.summary()}")
+                if connection.refine_tracker is not None:
+                    print(f"[{connection.addr}] 渐进增强：已重发{connection.refine_tracker.refined}个区块 | 待重发{len(connection.refine_tracker.pending)}")
+                injection = input_injector.stats.summary() if input_injector is not None else ""
+                if injection:
+                    print(f"[{connection.addr}] 键鼠注入（{input_injector.name}）：{injection}")
+                timing = connection.input_playout.summary() if connection.input_playout is not None else ""
+                if timing:
+                    print(f"[{connection.addr}] 键鼠时序：{timing}")
                 connection.frame_count = 0
+                connection.tile_count = 0
+                connection.sent_bytes = 0
                 connection.last_stat_time = current_time
                 
         except Exception as e:
             print(f"[{connection.addr}] 截图线程异常：{e}")
             time.sleep(0.1)
             continue
+    
+    # mss等截图句柄与线程绑定，在截图线程内释放
+    connection.capture_source.close()
+    if pipeline:
+        pipeline.close()
 
 def send_from_queue(conn, queue_obj, stop_event, connection: SlaveConnection):
     """优化的发送线程"""
     try:
         # 发送系统信息
         sys_info = get_system_info()
-        sys_info_data = json.dumps({"type": "sys_info", "data": sys_info}).encode()
-        conn.sendall(len(sys_info_data).to_bytes(4, 'big'))
-        conn.sendall(sys_info_data)
+        send_message(conn, json.dumps({"type": "sys_info", "data": sys_info, "protocol_version": PROTOCOL_VERSION}).encode())
         
         # 发送缩放信息
-        scaling_data = json.dumps({"scaling": get_screen_scaling()}).encode()
-        conn.sendall(len(scaling_data).to_bytes(4, 'big'))
-        conn.sendall(scaling_data)
+        send_message(conn, json.dumps({"scaling": get_screen_scaling()}).encode())
     except Exception as e:
         print(f"[{connection.addr}] 发送系统信息失败：{e}")
         stop_event.set()
         return
+    connection.stream_ready.set()
     
+    mux = connection.send_mux
     while not stop_event.is_set() and connection.is_connected:
         try:
-            encoded_data = queue_obj.get(timeout=0.05)
+            # 先发出已投递的控制/聊天/光标消息，再取下一帧
+            item = mux.next_frame(queue_obj, 0.05)
+            if item is None:
+                continue
+            enqueue_time, encoded_data = item
+            connection.send_idle.clear()
+            send_start = time.time()
             data_len = len(encoded_data)
-            conn.sendall(data_len.to_bytes(4, 'big'))
-            conn.sendall(encoded_data)
+            mux.send_frame(MSG_TILE_FRAME if TILE_MODE else MSG_JPEG_FRAME, encoded_data)
+            send_end = time.time()
+            connection.rate_controller.on_frame_sent(data_len, send_start - enqueue_time, send_end - send_start)
+            connection.pipeline_stats.add('queue', send_start - enqueue_time)
+            connection.pipeline_stats.add('send', send_end - send_start)
+            connection.sent_bytes += data_len
         except queue.Empty:
+            connection.send_idle.set()
             continue
         except Exception as e:
             print(f"[{connection.addr}] 发送帧失败：{e}")
             stop_event.set()
             break
 
+# ---------------------- 光标独立通道 ----------------------
+if platform.system() == "Windows":
+    from ctypes import wintypes
+
+    class CURSORINFO(ctypes.Structure):
+        _fields_ = [('cbSize', wintypes.DWORD), ('flags', wintypes.DWORD),
+                    ('hCursor', wintypes.HANDLE), ('ptScreenPos', wintypes.POINT)]
+
+    class ICONINFO(ctypes.Structure):
+        _fields_ = [('fIcon', wintypes.BOOL), ('xHotspot', wintypes.DWORD), ('yHotspot', wintypes.DWORD),
+                    ('hbmMask', wintypes.HBITMAP), ('hbmColor', wintypes.HBITMAP)]
+
+    class BITMAPINFOHEADER(ctypes.Structure):
+        _fields_ = [('biSize', wintypes.DWORD), ('biWidth', wintypes.LONG), ('biHeight', wintypes.LONG),
+                    ('biPlanes', wintypes.WORD), ('biBitCount', wintypes.WORD), ('biCompression', wintypes.DWORD),
+                    ('biSizeImage', wintypes.DWORD), ('biXPelsPerMeter', wintypes.LONG),
+                    ('biYPelsPerMeter', wintypes.LONG), ('biClrUsed', wintypes.DWORD), ('biClrImportant', wintypes.DWORD)]
+
+class CursorProbe:
+    """读取被控端光标：Windows通过Win32 API取位置、可见性与形状（按句柄缓存渲染结果），
+    其他平台只取位置，形状哈希为0，由控制端绘制默认箭头"""
+    CURSOR_SHOWING = 0x01
+    SM_CXCURSOR = 13
+    DI_NORMAL = 0x0003
+
+    def __init__(self):
+        self.is_windows = platform.system() == "Windows"
+        self._shapes = {}  # 光标句柄 -> (哈希, 热点x, 热点y, PNG)
+        self._pyautogui = None
+        if not self.is_windows:
+            try:
+                import pyautogui
+                self._pyautogui = pyautogui
+            except Exception as e:
+                print(f"光标位置不可用（pyautogui加载失败）：{e}")
+
+    def read(self):
+        """返回 (x, y, 是否可见, 形状)，形状为 (哈希, 热点x, 热点y, PNG) 或None；读取失败返回None"""
+        if not self.is_windows:
+            if self._pyautogui is None:
+                return None
+            x, y = self._pyautogui.position()
+            return int(x), int(y), True, None
+        info = CURSORINFO()
+        info.cbSize = ctypes.sizeof(CURSORINFO)
+        if not ctypes.windll.user32.GetCursorInfo(ctypes.byref(info)):
+            return None
+        visible = bool(info.flags & self.CURSOR_SHOWING) and bool(info.hCursor)
+        shape = None
+        if visible:
+            shape = self._shapes.get(info.hCursor)
+            if shape is None:
+                shape = self._render_shape(info.hCursor)
+                self._shapes[info.hCursor] = shape
+        return info.ptScreenPos.x, info.ptScreenPos.y, visible, shape
+
+    def _draw(self, hdc, bits, size, hcursor, background):
+        """在指定底色上绘制光标，返回BGR像素"""
+        ctypes.memset(bits, background, size * size * 4)
+        ctypes.windll.user32.DrawIconEx(hdc, 0, 0, hcursor, size, size, 0, None, self.DI_NORMAL)
+        return np.frombuffer(ctypes.string_at(bits, size * size * 4), np.uint8).reshape(size, size, 4)[:, :, :3].astype(np.int16)
+
+    def _render_shape(self, hcursor):
+        """渲染光标形状：分别画在黑底与白底上，由两者差值还原透明度"""
+        user32, gdi32 = ctypes.windll.user32, ctypes.windll.gdi32
+        icon_info = ICONINFO()
+        if not user32.GetIconInfo(wintypes.HANDLE(hcursor), ctypes.byref(icon_info)):
+            return None
+        for bitmap in (icon_info.hbmMask, icon_info.hbmColor):
+            if bitmap:
+                gdi32.DeleteObject(bitmap)
+        size = user32.GetSystemMetrics(self.SM_CXCURSOR) or 32
+        header = BITMAPINFOHEADER(biSize=ctypes.sizeof(BITMAPINFOHEADER), biWidth=size, biHeight=-size,
+                                  biPlanes=1, biBitCount=32, biCompression=0)
+        bits = ctypes.c_void_p()
+        screen_dc = user32.GetDC(None)
+        hdc = gdi32.CreateCompatibleDC(screen_dc)
+        bitmap = gdi32.CreateDIBSection(hdc, ctypes.byref(header), 0, ctypes.byref(bits), None, 0)
+        try:
+            gdi32.SelectObject(hdc, bitmap)
+            on_black = self._draw(hdc, bits, size, hcursor, 0x00)
+            on_white = self._draw(hdc, bits, size, hcursor, 0xFF)
+        finally:
+            gdi32.DeleteObject(bitmap)
+            gdi32.DeleteDC(hdc)
+            user32.ReleaseDC(None, screen_dc)
+        alpha = np.clip(255 - (on_white - on_black).max(axis=2), 0, 255)
+        color = np.where(alpha[:, :, None] > 0, on_black * 255 // np.maximum(alpha, 1)[:, :, None], 0)
+        bgra = np.dstack([np.clip(color, 0, 255), alpha]).astype(np.uint8)
+        _, png = cv2.imencode('.png', bgra)
+        png = png.tobytes()
+        return zlib.crc32(png), icon_info.xHotspot, icon_info.yHotspot, png
+
+def cursor_loop(stop_event, connection: SlaveConnection):
+    """光标线程：高频采样光标，位置或形状变化时立即发送小消息，不经过画面队列，
+    光标移动不再需要等待下一帧画面，也不会引起画面区块重新编码"""
+    while not connection.stream_ready.wait(timeout=0.1):
+        if stop_event.is_set() or not connection.is_connected:
+            return
+    probe = CursorProbe()
+    interval = 1.0 / CURSOR_FPS
+    last_message = None
+    while not stop_event.is_set() and connection.is_connected:
+        if connection.view_priority == "paused":
+            time.sleep(PAUSED_CHECK_INTERVAL)
+            continue
+        time.sleep(interval if connection.view_priority == "focused" else 1.0 / BACKGROUND_FPS)
+        try:
+            state = probe.read()
+            if state is None:
+                continue
+            x, y, visible, shape = state
+            shape_hash = 0
+            if shape:
+                shape_hash, hot_x, hot_y, png = shape
+                if shape_hash not in connection.sent_cursor_shapes:
+                    connection.send_message(CURSOR_SHAPE.pack(CURSOR_SHAPE_MAGIC, shape_hash, hot_x, hot_y) + png, MSG_CURSOR)
+                    connection.sent_cursor_shapes.add(shape_hash)
+            origin_x, origin_y = connection.capture_origin()
+            message = CURSOR_POS.pack(CURSOR_POS_MAGIC, x - origin_x, y - origin_y, shape_hash, int(visible))
+            if message != last_message:
+                connection.send_message(message, MSG_CURSOR, replace='cursor_pos')
+                last_message = message
+        except OSError as e:
+            print(f"[{connection.addr}] 光标发送失败：{e}")
+            break
+        except Exception as e:
+            print(f"[{connection.addr}] 光标采样失败：{e}")
+            time.sleep(1.0)
+
 # ---------------------- 指令处理（优化版） ----------------------
 def handle_commands(conn, stop_event, connection: SlaveConnection):
     """处理控制指令"""
@@ -783,83 +2914,105 @@ def handle_commands(conn, stop_event, connection: SlaveConnection):
         connection.chat_entry.focus_set()
     root.after(0, show_connect_tip)
     
+    injector = input_injector if input_injector is not None else create_input_injector(INPUT_BACKEND)
+    reader = MessageReader(conn, BUFFER_SIZE)
+    pending = []  # 批量消息展开后尚未执行的指令
+    input_batch = []  # 待注入的键鼠事件：同一次读取展开的事件一起注入，再阻塞等待下一条消息
+    playout = connection.input_playout = InputPlayout(injector) if INPUT_PLAYOUT and connection.source is None else None
     while not stop_event.is_set() and connection.is_connected:
         try:
-            # 接收指令长度
-            cmd_len_data = conn.recv(4)
-            if not cmd_len_data:
-                break
-            cmd_len = int.from_bytes(cmd_len_data, 'big')
-            
-            # 接收指令内容（优化接收）
-            cmd_data = b''
-            remaining = cmd_len
-            while remaining > 0 and not stop_event.is_set():
-                chunk_size = min(BUFFER_SIZE, remaining)
-                chunk = conn.recv(chunk_size)
-                if not chunk:
-                    break
-                cmd_data += chunk
-                remaining -= len(chunk)
+            # 接收并解析指令（消息体位于复用缓冲中，直接解码）：带消息头的为协议版本2，否则为旧版JSON
+            if not pending:
+                if input_batch:
+                    batch, input_batch = input_batch, []
+                    if playout is not None:
+                        playout.push(batch)
+                    else:
+                        injector.apply(batch)
+                data = reader.read()
+                if is_typed_message(data):
+                    msg_type, _, _, timestamp, body = unpack_message(data)
+                    pending = decode_messages(msg_type, body, timestamp)
+                else:
+                    pending = [json.loads(str(data, 'utf-8'))]
+            cmd = pending.pop(0)
+            current_time = datetime.now().timestamp()
             
-            if len(cmd_data) != cmd_len:
+            # 协议版本协商
+            if cmd['type'] == 'hello':
+                connection.negotiate_protocol(int(cmd.get('version', LEGACY_PROTOCOL_VERSION)))
                 continue
-            
-            # 解析指令
-            cmd = json.loads(cmd_data.decode())
-            current_time = datetime.now().timestamp()
 
             # 处理聊天消息
             if cmd['type'] == 'chat_msg':
                 add_chat_msg(cmd, connection)
                 continue
             
-            # 鼠标移动（优化节流）
-            if cmd['type'] == 'mouse_move':
-                if current_time - connection.last_mouse_time < MOUSE_THROTTLE:
-                    continue
-                connection.last_mouse_time = current_time
-                set_mouse_pos(int(cmd['x']), int(cmd['y']))
+            # 控制端窗口聚焦/失焦/最小化：调整截图与光标频率（观察者同样适用）
+            if cmd['type'] == 'view_priority':
+                connection.set_view_priority(cmd.get('priority'))
+                continue
+            
+            # 观察者只能观看：忽略键鼠与画面参数指令，画面异常时等待重新同步
+            if connection.source is not None:
+                if cmd['type'] == 'refresh':
+                    connection.resync = True
+                    connection.source.request_resync()
+                continue
+            
+            # 控制端设置带宽预算/目标延迟
+            if cmd['type'] == 'rate_budget':
+                connection.rate_controller.set_budget(cmd.get('bandwidth_kbps'), cmd.get('target_latency_ms'))
+                print(f"[{connection.addr}] 带宽预算：{connection.rate_controller.bandwidth_kbps}kbps，目标延迟：{connection.rate_controller.target_latency_ms}ms")
+                continue
             
-            # 鼠标点击
-            elif cmd['type'] == 'mouse_click':
-                click_mouse(int(cmd['x']), int(cmd['y']), cmd.get('button', 'left'))
+            # 控制端显示区域变化：按视口尺寸与清晰度在被控端缩小画面
+            if cmd['type'] == 'viewport':
+                width, height = int(cmd.get('width', 0)), int(cmd.get('height', 0))
+                connection.viewport = (width, height, float(cmd.get('hd_scale', 1.0))) if width > 0 and height > 0 else None
+                continue
             
-            # 鼠标滚轮
-            elif cmd['type'] == 'mouse_wheel':
-                scroll_mouse(cmd['direction'], cmd['distance'])
+            # 区域放大：只截取传输指定区域，宽高为0时恢复整屏
+            if cmd['type'] == 'roi':
+                width, height = int(cmd.get('w', 0)), int(cmd.get('h', 0))
+                connection.roi = (int(cmd.get('x', 0)), int(cmd.get('y', 0)), width, height) if width > 0 and height > 0 else None
+                connection.force_keyframe = True
+                print(f"[{connection.addr}] 区域放大：{connection.roi if connection.roi else '已恢复整屏'}")
+                continue
+            
+            # 控制端请求完整关键帧（如控制端画面缓冲失效）
+            if cmd['type'] == 'refresh':
+                # 控制端发现区块缓存失步时同时要求重置缓存
+                if cmd.get('reset_cache'):
+                    connection.cache_reset_pending = True
+                connection.force_keyframe = True
+                continue
             
-            # 鼠标按下（拖拽）
-            elif cmd['type'] == 'mouse_press':
-                connection.is_mouse_dragging = True
-                connection.dragging_button = cmd.get('button', 'left')
-                press_mouse(int(cmd['x']), int(cmd['y']), connection.dragging_button)
+            # 切换显示器（0为全部显示器），仅真实屏幕截图源支持
+            if cmd['type'] == 'select_monitor':
+                if CAPTURE_SOURCE.partition(':')[0] == 'mss':
+                    connection.pending_monitor = int(cmd.get('index', 1))
+                    print(f"[{connection.addr}] 切换显示器：{connection.pending_monitor or '全部'}")
+                continue
             
-            # 鼠标释放（拖拽）
-            elif cmd['type'] == 'mouse_release':
-                connection.is_mouse_dragging = False
-                release_mouse(int(cmd['x']), int(cmd['y']), cmd.get('button', 'left'))
+            # 鼠标坐标为所截画面内的坐标，换算为虚拟桌面坐标（主显示器左上角为原点）
+            if 'x' in cmd and 'y' in cmd:
+                origin_x, origin_y = connection.capture_origin()
+                cmd['x'] = int(cmd['x']) + origin_x
+                cmd['y'] = int(cmd['y']) + origin_y
             
-            # 鼠标拖拽
-            elif cmd['type'] == 'mouse_drag':
+            # 鼠标移动/拖拽（优化节流）：带事件时间的由播放缓冲还原时序，不丢弃
+            if cmd['type'] in ('mouse_move', 'mouse_drag') and (playout is None or 'ts' not in cmd):
                 if current_time - connection.last_mouse_time < MOUSE_THROTTLE:
                     continue
                 connection.last_mouse_time = current_time
-                drag_mouse(int(cmd['x']), int(cmd['y']), cmd.get('button', 'left'))
-            
-            # 按键输入
-            elif cmd['type'] == 'key_input':
-                is_character = cmd.get('is_character', False)
-                key_input(cmd['key'], is_character)
             
-            # 按键按下
-            elif cmd['type'] == 'key_down':
-                key_down(cmd['key'])
-            
-            # 按键释放
-            elif cmd['type'] == 'key_up':
-                key_up(cmd['key'])
+            # 键鼠事件：加入本批，由注入后端连续执行
+            if cmd['type'] in INPUT_TYPES:
+                input_batch.append(cmd)
                 
+        except ConnectionClosed:
+            break
         except Exception as e:
             print(f"[{connection.addr}] 指令处理异常：{e}")
             time.sleep(0.01)
@@ -869,6 +3022,103 @@ def handle_commands(conn, stop_event, connection: SlaveConnection):
     stop_event.set()
     connection.disconnect()
 
+# ---------------------- 无界面采集编码链路 ----------------------
+def get_capture_source_spec():
+    """读取命令行 --capture-source= 参数"""
+    for arg in sys.argv[1:]:
+        if arg.startswith("--capture-source="):
+            return arg.split("=", 1)[1]
+    return CAPTURE_SOURCE
+
+def get_change_detector_name():
+    """读取命令行 --change-detector= 参数"""
+    for arg in sys.argv[1:]:
+        if arg.startswith("--change-detector="):
+            return arg.split("=", 1)[1]
+    return CHANGE_DETECTOR
+
+def get_pipeline_mode():
+    """读取命令行 --pipeline= 参数"""
+    for arg in sys.argv[1:]:
+        if arg.startswith("--pipeline="):
+            return arg.split("=", 1)[1]
+    return PIPELINE_MODE
+
+def get_input_backend_name():
+    """读取命令行 --input-backend= 参数"""
+    for arg in sys.argv[1:]:
+        if arg.startswith("--input-backend="):
+            return arg.split("=", 1)[1]
+    return INPUT_BACKEND
+
+def run_headless_pipeline(frame_total=250):
+    """不启动界面和网络，按帧跑完 截图→变化检测→编码 链路并打印统计（不限帧率）"""
+    connection = SlaveConnection(None, "headless", None, None)
+    stats = connection.pipeline_stats
+    out_queue = connection.frame_queue
+    pipeline = ProcessEncodePipeline(connection, out_queue) if PIPELINE_MODE == "process" and TILE_MODE else None
+    quality = connection.rate_controller.quality
+    sent_frames = sent_tiles = sent_bytes = sent_copies = 0
+    refine_tracker = connection.refine_tracker
+    
+    def drain(block):
+        nonlocal sent_frames, sent_bytes
+        try:
+            _, data = out_queue.get(timeout=0.5) if block else out_queue.get_nowait()
+        except queue.Empty:
+            return
+        sent_frames += 1
+        sent_bytes += len(data)
+    
+    start = time.perf_counter()
+    try:
+        for _ in range(frame_total):
+            while out_queue.qsize() + (pipeline.in_flight() if pipeline else 0) >= out_queue.maxsize:
+                drain(block=True)
+            t0 = time.perf_counter()
+            result = capture_dirty_tiles(connection) if TILE_MODE else capture_incremental_frame(connection)
+            t1 = time.perf_counter()
+            stats.add('capture', t1 - t0)
+            if refine_tracker is not None:
+                refine_tracker.tick()
+            if result is None:
+                if out_queue.empty() and not (pipeline and pipeline.in_flight()) and refine_static_tiles(connection, out_queue):
+                    stats.add('encode', time.perf_counter() - t1)
+                continue
+            if not TILE_MODE:
+                _, encoded = cv2.imencode('.jpg', result, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                out_queue.put((time.time(), encoded))
+                stats.add('encode', time.perf_counter() - t1)
+                continue
+            frame, tiles, keyframe, copies = result
+            if pipeline:
+                while not pipeline.submit(frame, tiles, keyframe, quality, copies):
+                    drain(block=True)
+            else:
+                out_queue.put((time.time(), build_tile_frame(connection, frame, tiles, keyframe, quality, copies)))
+                stats.add('encode', time.perf_counter() - t1)
+            commit_tiles(connection, frame, tiles, keyframe, copies, quality)
+            sent_tiles += len(tiles)
+            sent_copies += len(copies)
+            drain(block=False)
+        while pipeline and pipeline.in_flight() or not out_queue.empty():
+            drain(block=True)
+    finally:
+        connection.capture_source.close()
+        if pipeline:
+            pipeline.close()
+            shutdown_encoder_pool(wait=True)
+    
+    elapsed = time.perf_counter() - start
+    print(f"===== 无界面链路统计（{get_capture_source_spec()}，检测器 {CHANGE_DETECTOR}，{PIPELINE_MODE}模式，{frame_total}帧） =====")
+    print(f"处理速度：{frame_total / elapsed:.1f} 帧/秒 | 发送帧：{sent_frames} | 区块/帧：{sent_tiles / max(sent_frames, 1):.1f} | 复制操作：{sent_copies}")
+    print(f"阶段耗时：{stats.summary()}")
+    if connection.tile_cache is not None:
+        print(f"区块缓存：{connection.tile_cache.summary()}")
+    if refine_tracker is not None:
+        print(f"渐进增强：重发{refine_tracker.refined}个区块 | 待重发{len(refine_tracker.pending)}")
+    print(f"数据量：{sent_bytes / 1024:.0f}KB，平均 {sent_bytes / max(sent_frames, 1) / 1024:.1f}KB/发送帧")
+
 # ---------------------- 启动服务（优化版） ----------------------
 def start_server(chat_text, chat_entry):
     """启动被控端服务"""
@@ -889,7 +3139,7 @@ def start_server(chat_text, chat_entry):
         print(f"CPU：{sys_info['cpu_count_physical']}物理/{sys_info['cpu_count_logical']}逻辑核心")
         print(f"内存：{sys_info['mem_used']}/{sys_info['mem_total']}GB")
         print(f"屏幕：{sys_info['screen_width']}x{sys_info['screen_height']} (缩放{sys_info['screen_scaling']}x)")
-        print(f"优化配置：FPS={FPS_LIMIT}, JPEG质量={JPEG_QUALITY}, 队列大小={FRAME_QUEUE_SIZE}")
+        print(f"优化配置：FPS={FPS_LIMIT}, JPEG质量={JPEG_QUALITY}, 队列大小={FRAME_QUEUE_SIZE}, 分块模式={'开启' if TILE_MODE else '关闭'}")
         print(f"开机自启状态：{'已开启' if check_auto_start() else '未开启'}")
         print(f"==========================")
 
@@ -899,14 +3149,25 @@ def start_server(chat_text, chat_entry):
                 conn, addr = server_socket.accept()
                 print(f"[{addr}] 新连接建立")
                 
-                # 断开旧连接
+                # 已有其他IP的控制端连接时作为观察者加入，共用其截图编码；同一IP（控制端重连）仍替换旧连接
                 global current_active_connection
-                if current_active_connection and current_active_connection.is_connected:
-                    current_active_connection.disconnect()
-                
-                # 创建新连接实例
-                slave_connection = SlaveConnection(conn, addr, chat_text, chat_entry)
-                current_active_connection = slave_connection
+                controller = current_active_connection if current_active_connection and current_active_connection.is_connected else None
+                if controller and MAX_OBSERVERS and addr[0] != controller.addr[0]:
+                    if len(controller.frame_queue.observers) >= MAX_OBSERVERS:
+                        print(f"[{addr}] 观察者已达上限（{MAX_OBSERVERS}），拒绝连接")
+                        conn.close()
+                        continue
+                    slave_connection = SlaveConnection(conn, addr, chat_text, chat_entry, source=controller)
+                    slave_connection.send_message(json.dumps({"type": "viewer_role", "role": "observer"}).encode(), MSG_CONTROL, PRIORITY_CONTROL)
+                    controller.add_observer(slave_connection)
+                else:
+                    # 断开旧连接
+                    if controller:
+                        controller.disconnect()
+                    
+                    # 创建新连接实例
+                    slave_connection = SlaveConnection(conn, addr, chat_text, chat_entry)
+                    current_active_connection = slave_connection
                 
                 # 启动线程组
                 stop_event = slave_connection.stop_event
@@ -919,13 +3180,14 @@ def start_server(chat_text, chat_entry):
                     daemon=True,
                     name=f"CmdThread-{addr}"
                 )
-                # 截图线程
-                slave_connection.capture_thread = threading.Thread(
-                    target=capture_to_queue, 
-                    args=(frame_queue, stop_event, slave_connection), 
-                    daemon=True,
-                    name=f"CaptureThread-{addr}"
-                )
+                # 截图线程（观察者直接使用控制端连接编码好的帧）
+                if slave_connection.source is None:
+                    slave_connection.capture_thread = threading.Thread(
+                        target=capture_to_queue, 
+                        args=(frame_queue, stop_event, slave_connection), 
+                        daemon=True,
+                        name=f"CaptureThread-{addr}"
+                    )
                 # 发送线程
                 slave_connection.send_thread = threading.Thread(
                     target=send_from_queue, 
@@ -934,10 +3196,22 @@ def start_server(chat_text, chat_entry):
                     name=f"SendThread-{addr}"
                 )
                 
+                # 光标线程
+                if CURSOR_CHANNEL:
+                    slave_connection.cursor_thread = threading.Thread(
+                        target=cursor_loop,
+                        args=(stop_event, slave_connection),
+                        daemon=True,
+                        name=f"CursorThread-{addr}"
+                    )
+                
                 # 启动线程
                 slave_connection.cmd_thread.start()
-                slave_connection.capture_thread.start()
+                if slave_connection.capture_thread:
+                    slave_connection.capture_thread.start()
                 slave_connection.send_thread.start()
+                if slave_connection.cursor_thread:
+                    slave_connection.cursor_thread.start()
 
             except Exception as e:
                 print(f"客户端连接异常：{e}")
@@ -1039,6 +3313,9 @@ def create_gui():
 
 # ---------------------- 主程序入口 ----------------------
 if __name__ == "__main__":
+    # 多进程编码在打包后的exe中需要
+    multiprocessing.freeze_support()
+    
     if platform.system() == "Windows":
         try:
             os.system("title 局域网被控端")
@@ -1050,5 +3327,14 @@ if __name__ == "__main__":
         messagebox.showerror("版本错误", "请使用Python 3.7及以上版本运行！")
         sys.exit(1)
     
+    # 截图源（--capture-source=synthetic 等可在无界面环境复现链路）
+    CAPTURE_SOURCE = get_capture_source_spec()
+    CHANGE_DETECTOR = get_change_detector_name()
+    PIPELINE_MODE = get_pipeline_mode()
+    INPUT_BACKEND = get_input_backend_name()
+    if "--headless" in sys.argv:
+        run_headless_pipeline()
+        sys.exit(0)
+    
     # 启动GUI
     create_gui()
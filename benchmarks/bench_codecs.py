@@ -0,0 +1,90 @@
+#项目名称:局域网远程控制-区块编码选择基准测试
+#用法：python benchmarks/bench_codecs.py [--frames 60] [--scenes office,mixed,windows,video] [--quality 55]
+#对比单一JPEG编码与按内容选择编码（纯色/PNG/JPEG或WebP）的每帧字节数、编码耗时与画质（PSNR）
+#------------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import User  # noqa: E402
+from tile_cache import tile_key  # noqa: E402
+
+SIZE = (1920, 1080)
+
+def collect_updates(scene, frame_total):
+    """按采集线程的方式生成 (帧, 区块) 序列：首帧为关键帧全部区块，之后为变化区块"""
+    source = User.SyntheticCaptureSource(scene, SIZE)
+    detector = User.create_change_detector('full')
+    updates = []
+    for index in range(frame_total):
+        frame = source.grab()
+        if index == 0:
+            tiles = User.list_all_tiles(frame.shape[1], frame.shape[0])
+        else:
+            tiles = detector.detect(frame).dirty_tiles()
+        if tiles:
+            detector.commit(frame, tiles)
+            updates.append((frame, [(x, y, w, h, tile_key(frame[y:y + h, x:x + w])) for x, y, w, h in tiles]))
+    return updates
+
+def decode_records(data, tile_count, framebuffer):
+    """按控制端的方式把区块记录解码到画面缓冲，返回各编码类型的区块数"""
+    offset = 0
+    codecs = {}
+    for _ in range(tile_count):
+        x, y, w, h, codec, _, length = User.TILE_RECORD.unpack_from(data, offset)
+        offset += User.TILE_RECORD.size
+        payload = np.frombuffer(data, np.uint8, count=length, offset=offset)
+        offset += length
+        if codec == User.TILE_CODEC_FLAT:
+            framebuffer[y:y + h, x:x + w] = payload
+        else:
+            framebuffer[y:y + h, x:x + w] = cv2.imdecode(payload, cv2.IMREAD_COLOR)
+        codecs[codec] = codecs.get(codec, 0) + 1
+    return codecs
+
+def run_mode(updates, quality, codec_selection):
+    """编码全部更新，返回 (字节/帧, 编码ms/帧, 平均PSNR, 编码类型分布)"""
+    total_bytes = 0
+    elapsed = 0.0
+    psnr_total = 0.0
+    codecs = {}
+    framebuffer = np.zeros_like(updates[0][0])
+    for frame, tiles in updates:
+        start = time.perf_counter()
+        data = User.encode_tile_records(frame, tiles, quality, codec_selection)
+        elapsed += time.perf_counter() - start
+        total_bytes += len(data)
+        for codec, count in decode_records(data, len(tiles), framebuffer).items():
+            codecs[codec] = codecs.get(codec, 0) + count
+        psnr_total += min(cv2.PSNR(frame, framebuffer), 99.0)
+    count = len(updates)
+    return total_bytes / count, elapsed / count * 1000, psnr_total / count, codecs
+
+def main():
+    parser = argparse.ArgumentParser(description="区块编码选择基准测试")
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--scenes', default='office,mixed,windows,video')
+    parser.add_argument('--quality', type=int, default=User.JPEG_QUALITY)
+    args = parser.parse_args()
+
+    names = {User.TILE_CODEC_JPEG: 'JPEG', User.TILE_CODEC_PNG: 'PNG',
+             User.TILE_CODEC_FLAT: '纯色', User.TILE_CODEC_WEBP: 'WebP'}
+    print(f"{'场景':<8} {'编码方式':<8} {'KB/帧':>9} {'编码ms/帧':>10} {'PSNR':>7} {'节省':>6}  区块分布")
+    for scene in args.scenes.split(','):
+        updates = collect_updates(scene, args.frames)
+        baseline = None
+        for label, codec_selection in (('单一JPEG', False), ('按内容', True)):
+            size, cost, psnr, codecs = run_mode(updates, args.quality, codec_selection)
+            baseline = baseline or size
+            mix = ' '.join(f"{names[codec]}:{count}" for codec, count in sorted(codecs.items()))
+            print(f"{scene:<10} {label:<8} {size / 1024:>9.1f} {cost:>12.2f} {psnr:>7.1f} {(1 - size / baseline) * 100:>5.0f}%  {mix}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#项目名称:局域网远程控制-消息分帧吞吐基准测试
+#用法：python benchmarks/bench_framing.py [--seconds 2] [--sizes 200,65536,262144,2097152]
+#在本机回环TCP连接上对比旧版手写分帧（两次sendall + recv后 data += chunk 拼接）与 framing 模块的吞吐
+#------------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import framing  # noqa: E402
+
+BUFFER_SIZE = 65536
+
+def legacy_send(sock, data):
+    sock.sendall(len(data).to_bytes(4, 'big'))
+    sock.sendall(data)
+
+def legacy_reader(sock):
+    def read():
+        # 旧版直接 recv(4)，长度前缀被拆包时会错位；这里补足4字节，只保留拼接方式作对比
+        header = b''
+        while len(header) < 4:
+            chunk = sock.recv(4 - len(header))
+            if not chunk:
+                raise framing.ConnectionClosed()
+            header += chunk
+        length = int.from_bytes(header, 'big')
+        data = b''
+        remaining = length
+        while remaining > 0:
+            chunk = sock.recv(min(BUFFER_SIZE, remaining))
+            if not chunk:
+                raise framing.ConnectionClosed()
+            data += chunk
+            remaining -= len(chunk)
+        return data
+    return read
+
+def framing_reader(sock):
+    return framing.MessageReader(sock).read
+
+def loopback_pair():
+    """建立一对回环TCP连接（与实际部署一致开启TCP_NODELAY）"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    client = socket.create_connection(server.getsockname())
+    peer, _ = server.accept()
+    server.close()
+    for sock in (client, peer):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return client, peer
+
+def run(send, make_reader, size, seconds):
+    """发送端持续发送指定大小的消息，返回 (消息/秒, MB/秒)"""
+    sender, receiver = loopback_pair()
+    payload = os.urandom(size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            while not stop.is_set():
+                send(sender, payload)
+        except OSError:
+            pass
+        finally:
+            sender.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    read = make_reader(receiver)
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        message = read()
+        assert len(message) == size
+        count += 1
+    elapsed = time.perf_counter() - start
+    stop.set()
+    receiver.close()
+    thread.join()
+    return count / elapsed, count * size / elapsed / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="消息分帧吞吐基准测试")
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--sizes', default='200,65536,262144,2097152')
+    args = parser.parse_args()
+
+    print(f"sendmsg可用：{framing.HAS_SENDMSG}")
+    print(f"{'消息大小':<10} {'实现':<8} {'消息/秒':>10} {'MB/秒':>9} {'加速比':>7}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        baseline = None
+        for label, send, make_reader in (('旧版', legacy_send, legacy_reader),
+                                         ('framing', framing.send_message, framing_reader)):
+            rate, throughput = run(send, make_reader, size, args.seconds)
+            baseline = baseline or throughput
+            print(f"{size:<14} {label:<10} {rate:>10.0f} {throughput:>9.1f} {throughput / baseline:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#项目名称:局域网远程控制-消息分帧（被控端与控制端共用）
+#项目简介：4字节大端长度前缀 + 消息体；接收预读到复用的预分配缓冲（recv_into），发送将长度与消息体一次聚合发出（sendmsg）
+#---------------------------------------------------------------------------------------------
+
+import socket
+import struct
+
+# ---------------------- 分帧配置（两端必须一致） ----------------------
+LENGTH_PREFIX = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024  # 超过该长度视为数据流错位
+RECV_BUFFER_SIZE = 1024 * 1024  # 接收缓冲初始容量，遇到更大的消息时按需扩容后继续复用
+COALESCE_LIMIT = 16 * 1024  # 小于该长度的消息与长度前缀拼接后一次sendall（小消息复制比聚合发送的开销更低）
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+class ConnectionClosed(Exception):
+    """对端关闭连接（或收到非法长度，数据流已无法继续解析）"""
+
+def send_message(sock, payload, prefix=b''):
+    """发送一条带长度前缀的消息，payload 可以是 bytes/bytearray/memoryview/numpy数组等连续缓冲
+
+    prefix 为紧贴在消息体前的附加头（如协议消息头），计入消息长度但不与消息体拼接复制。
+    调用方负责多线程互斥（同一连接上的消息不能交错）
+    """
+    body = memoryview(payload).cast('B')
+    header = LENGTH_PREFIX.pack(len(prefix) + body.nbytes) + prefix
+    if body.nbytes <= COALESCE_LIMIT:
+        sock.sendall(header + body)
+        return
+    if not HAS_SENDMSG:
+        # Windows没有sendmsg：大消息拼接的复制代价高于多一次系统调用
+        sock.sendall(header)
+        sock.sendall(body)
+        return
+    buffers = [memoryview(header), body]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        # 部分发送：丢弃已发完的缓冲，截掉未发完缓冲的已发部分
+        while sent:
+            first = buffers[0]
+            if sent >= first.nbytes:
+                sent -= first.nbytes
+                buffers.pop(0)
+            else:
+                buffers[0] = first[sent:]
+                sent = 0
+        while buffers and not buffers[0].nbytes:
+            buffers.pop(0)
+
+class MessageReader:
+    """从连接中逐条读取消息：recv_into 预读到复用的缓冲中，一次系统调用可取得多条小消息
+
+    read() 返回指向内部缓冲的 memoryview，下一次 read() 时内容可能被覆盖；
+    需要跨调用保留（如放入帧队列）时由调用方 bytes(view) 复制一次。
+    未读完的数据保留在缓冲中，因此超时异常可以安全地向上抛出，下次调用从断点继续。
+    """
+    def __init__(self, sock, buffer_size=RECV_BUFFER_SIZE):
+        self.sock = sock
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # 未消费数据的起点
+        self._end = 0  # 已接收数据的终点
+        self.messages = 0
+        self.bytes = 0
+
+    def _ensure(self, size):
+        """保证缓冲中至少有 size 字节未消费数据，不足时（必要时先前移或扩容）继续接收"""
+        while self._end - self._start < size:
+            if self._start + size > len(self._buffer):
+                pending = self._end - self._start
+                if size > len(self._buffer):
+                    # 扩容：新缓冲容纳整条消息，旧视图仍指向旧缓冲，不受影响
+                    buffer = bytearray(max(size, len(self._buffer) * 2))
+                    buffer[:pending] = self._view[self._start:self._end]
+                    self._buffer = buffer
+                    self._view = memoryview(buffer)
+                else:
+                    self._view[:pending] = self._view[self._start:self._end]
+                self._start, self._end = 0, pending
+            count = self.sock.recv_into(self._view[self._end:])
+            if not count:
+                raise ConnectionClosed("连接已关闭")
+            self._end += count
+
+    def read(self):
+        """读取下一条消息，返回消息体的 memoryview；连接关闭抛出 ConnectionClosed，空闲超时抛出 socket.timeout"""
+        self._ensure(LENGTH_PREFIX.size)
+        length, = LENGTH_PREFIX.unpack_from(self._buffer, self._start)
+        if length > MAX_MESSAGE_SIZE:
+            raise ConnectionClosed(f"消息长度异常：{length}")
+        self._ensure(LENGTH_PREFIX.size + length)
+        begin = self._start + LENGTH_PREFIX.size
+        self._start = begin + length
+        if self._start == self._end:
+            self._start = self._end = 0
+        self.messages += 1
+        self.bytes += length
+        return self._view[begin:begin + length]
@@ -0,0 +1,163 @@
+#项目名称:局域网远程控制-二进制消息协议（被控端与控制端共用）
+#项目简介：协商后每条消息带固定消息头（类型、标志、序号、时间戳、长度），键鼠事件使用紧凑二进制布局
+#---------------------------------------------------------------------------------------------
+
+import json
+import struct
+import time
+
+# ---------------------- 协议版本 ----------------------
+# 版本1：旧版JSON指令 + 按魔数区分的画面/光标消息
+# 版本2：连接时协商，之后双方改用带消息头的二进制消息
+#   1. 被控端在 sys_info 消息中声明 protocol_version
+#   2. 控制端发送 {"type": "hello", "version": N}（仍为JSON）
+#   3. 被控端回复 MSG_HELLO_ACK，此后被控端发出的消息均带消息头；控制端收到确认后同样切换
+# 版本3：键鼠事件携带控制端的事件时间（单条消息使用消息头时间戳，批量消息使用 MSG_TIMED_INPUT_BATCH）
+# 版本4：大消息可拆成多个分片（MSG_FLAG_MORE）发送，分片之间可以插入其他类型的消息
+LEGACY_PROTOCOL_VERSION = 1
+PROTOCOL_VERSION = 4
+
+# ---------------------- 消息头 ----------------------
+# 类型(1) + 标志(1) + 序号(4) + 发送时间戳(4，毫秒，按2^32回绕) + 消息体长度(4)
+# 类型取值均小于 TYPED_MESSAGE_LIMIT，与旧版消息首字节（'{'、'L'、JPEG的0xFF）不重叠，接收端可直接按首字节区分
+MSG_HEADER = struct.Struct('>BBIII')
+TYPED_MESSAGE_LIMIT = 0x20
+MSG_FLAG_MORE = 0x80  # 标志：消息体只是分片，后续还有同类型的分片，拼接到不带该标志的分片为止
+
+# 被控端 → 控制端
+MSG_HELLO_ACK = 0x01  # 消息体为JSON：{"version": N}
+MSG_TILE_FRAME = 0x02  # 消息体为分块帧（格式见分块帧格式）
+MSG_JPEG_FRAME = 0x03  # 消息体为整帧JPEG
+MSG_CURSOR = 0x04  # 消息体为光标位置/形状消息
+# 双向
+MSG_CHAT = 0x08  # 消息体为聊天消息JSON
+MSG_CONTROL = 0x09  # 消息体为低频控制指令JSON（视口、区域放大、刷新等）
+# 控制端 → 被控端（键鼠事件）
+MSG_MOUSE = 0x10  # 动作(1) + 按键(1) + x(4) + y(4)
+MSG_WHEEL = 0x11  # 方向(1，有符号) + 距离(2)
+MSG_KEY = 0x12  # 动作(1) + 是否字符(1) + 键名UTF-8
+MSG_INPUT_BATCH = 0x13  # 多条键鼠事件：逐条为 类型(1) + 长度(1) + 事件消息体
+MSG_TIMED_INPUT_BATCH = 0x14  # 带事件时间的多条键鼠事件：逐条为 类型(1) + 长度(1) + 相对消息头时间戳的毫秒数(2) + 事件消息体
+
+MOUSE_EVENT = struct.Struct('>BBii')
+WHEEL_EVENT = struct.Struct('>bH')
+KEY_EVENT = struct.Struct('>BB')
+BATCH_RECORD = struct.Struct('>BB')
+TIMED_BATCH_RECORD = struct.Struct('>BBH')
+MOUSE_ACTIONS = ('mouse_move', 'mouse_press', 'mouse_release', 'mouse_click', 'mouse_drag')
+MOUSE_BUTTONS = ('left', 'right', 'middle')
+KEY_ACTIONS = ('key_down', 'key_up', 'key_input')
+INPUT_TYPES = MOUSE_ACTIONS + ('mouse_wheel',) + KEY_ACTIONS
+
+def timestamp_ms():
+    """消息头时间戳：墙上时钟毫秒数的低32位"""
+    return int(time.time() * 1000) & 0xFFFFFFFF
+
+class ProtocolWriter:
+    """为一个方向的消息生成消息头，序号逐条递增；调用方需与发送在同一把锁内，保证序号与发送顺序一致"""
+    def __init__(self):
+        self.seq = 0
+
+    def header(self, msg_type, payload, flags=0, timestamp=None):
+        """timestamp 默认为发送时刻，键鼠事件传入事件发生时刻"""
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        timestamp = timestamp_ms() if timestamp is None else timestamp & 0xFFFFFFFF
+        return MSG_HEADER.pack(msg_type, flags, self.seq, timestamp, memoryview(payload).nbytes)
+
+def is_typed_message(data):
+    """是否为带消息头的消息（首字节为消息类型）"""
+    return len(data) >= MSG_HEADER.size and data[0] < TYPED_MESSAGE_LIMIT
+
+def unpack_message(data):
+    """拆分消息头，返回 (类型, 标志, 序号, 时间戳, 消息体)；长度不符时抛出 ValueError"""
+    msg_type, flags, seq, timestamp, length = MSG_HEADER.unpack_from(data, 0)
+    body = memoryview(data)[MSG_HEADER.size:]
+    if body.nbytes != length:
+        raise ValueError(f"消息长度不符：头部{length}，实际{body.nbytes}")
+    return msg_type, flags, seq, timestamp, body
+
+class MessageAssembler:
+    """接收端拼接分片消息：带 MSG_FLAG_MORE 的分片按类型暂存，最后一个分片到达时返回完整消息体"""
+    def __init__(self):
+        self._parts = {}
+
+    def feed(self, msg_type, flags, body):
+        """未分片的消息原样返回；分片未收齐时返回 None，收齐时返回拼接后的 bytearray"""
+        if flags & MSG_FLAG_MORE:
+            self._parts.setdefault(msg_type, bytearray()).extend(body)
+            return None
+        parts = self._parts.pop(msg_type, None)
+        if parts is None:
+            return body
+        parts.extend(body)
+        return parts
+
+def encode_command(cmd):
+    """控制端指令字典 → (消息类型, 消息体)，键鼠事件使用二进制布局，其余指令为JSON"""
+    cmd_type = cmd['type']
+    if cmd_type in MOUSE_ACTIONS:
+        button = MOUSE_BUTTONS.index(cmd.get('button', 'left'))
+        return MSG_MOUSE, MOUSE_EVENT.pack(MOUSE_ACTIONS.index(cmd_type), button, int(cmd['x']), int(cmd['y']))
+    if cmd_type == 'mouse_wheel':
+        return MSG_WHEEL, WHEEL_EVENT.pack(1 if cmd['direction'] == 'up' else -1, int(cmd['distance']))
+    if cmd_type in KEY_ACTIONS:
+        return MSG_KEY, KEY_EVENT.pack(KEY_ACTIONS.index(cmd_type), bool(cmd.get('is_character'))) + cmd['key'].encode('utf-8')
+    return (MSG_CHAT if cmd_type == 'chat_msg' else MSG_CONTROL), json.dumps(cmd).encode('utf-8')
+
+def decode_command(msg_type, body):
+    """(消息类型, 消息体) → 指令字典，格式与旧版JSON指令一致"""
+    if msg_type == MSG_MOUSE:
+        action, button, x, y = MOUSE_EVENT.unpack_from(body, 0)
+        return {'type': MOUSE_ACTIONS[action], 'x': x, 'y': y, 'button': MOUSE_BUTTONS[button]}
+    if msg_type == MSG_WHEEL:
+        direction, distance = WHEEL_EVENT.unpack_from(body, 0)
+        return {'type': 'mouse_wheel', 'direction': 'up' if direction > 0 else 'down', 'distance': distance}
+    if msg_type == MSG_KEY:
+        action, is_character = KEY_EVENT.unpack_from(body, 0)
+        return {'type': KEY_ACTIONS[action], 'key': str(body[KEY_EVENT.size:], 'utf-8'), 'is_character': bool(is_character)}
+    if msg_type in (MSG_CHAT, MSG_CONTROL):
+        return json.loads(str(body, 'utf-8'))
+    raise ValueError(f"未知消息类型：{msg_type}")
+
+def encode_batch(cmds):
+    """多条键鼠事件指令 → 一条 MSG_INPUT_BATCH 消息体"""
+    parts = []
+    for cmd in cmds:
+        msg_type, body = encode_command(cmd)
+        parts.append(BATCH_RECORD.pack(msg_type, len(body)))
+        parts.append(body)
+    return b''.join(parts)
+
+def encode_timed_batch(cmds):
+    """带事件时间（指令的 ts 字段）的多条键鼠事件 → 一条 MSG_TIMED_INPUT_BATCH 消息体，消息头时间戳取第一条的 ts"""
+    base = cmds[0]['ts']
+    parts = []
+    for cmd in cmds:
+        msg_type, body = encode_command(cmd)
+        parts.append(TIMED_BATCH_RECORD.pack(msg_type, len(body), min((cmd['ts'] - base) & 0xFFFFFFFF, 0xFFFF)))
+        parts.append(body)
+    return b''.join(parts)
+
+def decode_messages(msg_type, body, timestamp=None):
+    """(消息类型, 消息体) → 指令字典列表，批量消息按原顺序展开
+
+    传入消息头时间戳时，单条键鼠事件与带时间的批量事件附带 ts 字段（控制端事件时间，毫秒，按2^32回绕）
+    """
+    if msg_type not in (MSG_INPUT_BATCH, MSG_TIMED_INPUT_BATCH):
+        cmd = decode_command(msg_type, body)
+        if timestamp is not None and msg_type in (MSG_MOUSE, MSG_WHEEL, MSG_KEY):
+            cmd['ts'] = timestamp
+        return [cmd]
+    timed = msg_type == MSG_TIMED_INPUT_BATCH and timestamp is not None
+    record = TIMED_BATCH_RECORD if msg_type == MSG_TIMED_INPUT_BATCH else BATCH_RECORD
+    cmds = []
+    offset = 0
+    while offset < len(body):
+        record_type, length, *delta = record.unpack_from(body, offset)
+        offset += record.size
+        cmd = decode_command(record_type, body[offset:offset + length])
+        if timed:
+            cmd['ts'] = (timestamp + delta[0]) & 0xFFFFFFFF
+        cmds.append(cmd)
+        offset += length
+    return cmds
@@ -0,0 +1,81 @@
+#项目名称:局域网远程控制-区块内容缓存（被控端与控制端共用）
+#项目简介：按内容哈希缓存最近发送过的画面区块，重复出现的区块只发送引用
+#---------------------------------------------------------------------------------------------
+
+import zlib
+from collections import OrderedDict
+
+# ---------------------- 缓存配置（两端必须一致） ----------------------
+TILE_CACHE_BYTES = 64 * 1024 * 1024  # 缓存容量（按解码后的BGR像素字节数计）
+
+def tile_key(tile):
+    """区块内容哈希（64位）：CRC32 与 Adler32 拼接，宽高作为初值参与计算"""
+    data = tile.tobytes()
+    height, width = tile.shape[:2]
+    return (zlib.crc32(data, (width << 16) | height) << 32) | zlib.adler32(data, (height << 16) | width)
+
+def tile_bytes(width, height):
+    """区块在缓存中占用的字节数，两端按相同规则计算，保证淘汰结果一致"""
+    return width * height * 3
+
+class TileCache:
+    """LRU区块缓存：被控端只记录哈希（value为None），控制端保存解码后的像素
+
+    两端对每一帧按相同顺序执行 touch/put，容量与淘汰规则相同，因此缓存内容保持一致；
+    控制端发现引用的哈希不存在（两端不一致）时请求重置，两端同时清空
+    """
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # 哈希 -> (字节数, 像素)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def touch(self, key):
+        """查询并刷新LRU顺序，命中返回True"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, key):
+        """查询并刷新LRU顺序，返回缓存的像素，未命中返回None"""
+        if not self.touch(key):
+            return None
+        return self._entries[key][1]
+
+    def put(self, key, size, value=None):
+        """写入条目（已存在则刷新），超出容量时淘汰最久未用的条目"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0]
+        self._entries[key] = (size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        """统计摘要：命中率、条目数、占用"""
+        return (f"命中率{self.hit_rate * 100:.0f}%（{self.hits}/{self.hits + self.misses}） | "
+                f"条目{len(self._entries)} | 占用{self.bytes / 1024 / 1024:.1f}MB | 淘汰{self.evictions}")